@@ -3,6 +3,9 @@ ASGI config for surgicalm project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI worker class, e.g.
+    gunicorn -k uvicorn.workers.UvicornWorker surgicalm.backend.asgi:application
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
@@ -12,5 +15,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'surgicalm.backend.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'true')
+# Requests don't keep a thread here, so connections are pooled rather than persistent
+os.environ.setdefault('DB_POOL_ENABLED', 'true')
 
 application = get_asgi_application()
+
+# Load views and open connections before the first request reaches this worker
+from django.apps import apps
+apps.get_app_config('users').warm_up()
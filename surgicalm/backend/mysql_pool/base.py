@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.mysql import base
+
+from .pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+_pools = {}
+_direct_stats = {}
+_lock = threading.Lock()
+
+
+def connection_stats():
+    """
+    Connection setup counters for this process, by alias: how many connections
+    were opened and how long that took, plus checkout figures for pooled aliases.
+    """
+    with _lock:
+        stats = {alias: dict(counters) for alias, counters in _direct_stats.items()}
+        pools = dict(_pools)
+    for alias, pool in pools.items():
+        pooled = pool.snapshot()
+        direct = stats.get(alias, {})
+        pooled['connects'] += direct.get('connects', 0)
+        pooled['connect_seconds'] += direct.get('connect_seconds', 0.0)
+        stats[alias] = pooled
+    return stats
+
+
+def close_pools():
+    """Closes and forgets every pool in this process."""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The MySQL backend plus connection setup metrics and an optional per-process
+    pool, enabled with OPTIONS['pool'] = {'min_size', 'max_size', 'timeout',
+    'max_idle'} (or True for the defaults). Pooled connections go back to the
+    pool when Django closes them, so the TLS handshake, auth and init_command
+    are paid once per pooled connection rather than once per request.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    @property
+    def pool(self):
+        options = self.settings_dict['OPTIONS'].get('pool')
+        if not options:
+            return None
+        with _lock:
+            pool = _pools.get(self.alias)
+            created = pool is None
+            if created:
+                if self.settings_dict['CONN_MAX_AGE'] != 0:
+                    raise ImproperlyConfigured('Pooled connections are returned after every request; set CONN_MAX_AGE to 0.')
+                params = self.get_connection_params()
+                pool = _pools[self.alias] = ConnectionPool(
+                    lambda: base.Database.connect(**params),
+                    name=self.alias,
+                    **({} if options is True else options),
+                )
+        if created:
+            pool.fill()
+        return pool
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is not None:
+            # Reused connections keep their session settings from the first checkout
+            connection, self._pool_reused = pool.get()
+            return connection
+
+        started = time.perf_counter()
+        connection = super().get_new_connection(conn_params)
+        elapsed = time.perf_counter() - started
+        with _lock:
+            counters = _direct_stats.setdefault(self.alias, {'connects': 0, 'connect_seconds': 0.0})
+            counters['connects'] += 1
+            counters['connect_seconds'] += elapsed
+            counters['last_connect_seconds'] = elapsed
+        logger.info("[DB] Opened %s connection in %.1fms", self.alias, elapsed * 1000)
+        return connection
+
+    def init_connection_state(self):
+        if getattr(self, '_pool_reused', False):
+            return
+        super().init_connection_state()
+
+    def _close(self):
+        pool = self.pool
+        if pool is None:
+            return super()._close()
+
+        # Never hand another request a connection with an open transaction
+        discard = self.in_atomic_block
+        if not discard:
+            try:
+                self.connection.rollback()
+            except base.Database.Error:
+                discard = True
+        self._pool_reused = False
+        pool.put(self.connection, discard=discard)
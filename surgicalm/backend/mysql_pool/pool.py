@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Per-process pool of DB-API connections with at most `max_size` checked out
+    at once, keeping `min_size` open from the start. Idle connections are pinged before reuse and closed once they
+    have sat unused for `max_idle` seconds. `connect` opens a new connection.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=4, timeout=10.0, max_idle=300, name='default'):
+        if not 0 <= min_size <= max_size:
+            raise ValueError('Pool sizes must satisfy 0 <= min_size <= max_size')
+        self._connect = connect
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.stats = {
+            'connects': 0, 'connect_seconds': 0.0, 'last_connect_seconds': 0.0,
+            'checkouts': 0, 'reused': 0, 'waited_seconds': 0.0, 'discarded': 0,
+        }
+
+    def _open(self):
+        started = time.perf_counter()
+        connection = self._connect()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.stats['connects'] += 1
+            self.stats['connect_seconds'] += elapsed
+            self.stats['last_connect_seconds'] = elapsed
+        logger.info("[DB_POOL] Opened %s connection in %.1fms", self.name, elapsed * 1000)
+        return connection
+
+    def _discard(self, connection):
+        with self._lock:
+            self.stats['discarded'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def fill(self):
+        """Opens connections until `min_size` are idle."""
+        while True:
+            with self._lock:
+                if len(self._idle) >= self.min_size:
+                    return
+            connection = self._open()
+            with self._lock:
+                self._idle.append((connection, time.monotonic()))
+
+    def get(self):
+        """
+        Checks a connection out, waiting up to `timeout` seconds for a free
+        slot. Returns (connection, reused).
+        """
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'No database connection free after {self.timeout}s ({self.max_size} in use)')
+        waited = time.perf_counter() - started
+
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    connection, reused = self._open(), False
+                    break
+                connection, returned_at = item
+                if time.monotonic() - returned_at > self.max_idle:
+                    self._discard(connection)
+                    continue
+                try:
+                    connection.ping()
+                except Exception:
+                    self._discard(connection)
+                    continue
+                with self._lock:
+                    self.stats['reused'] += 1
+                reused = True
+                break
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.stats['checkouts'] += 1
+            self.stats['waited_seconds'] += waited
+        return connection, reused
+
+    def put(self, connection, discard=False):
+        """Returns a checked out connection; `discard` closes it instead."""
+        try:
+            if discard:
+                self._discard(connection)
+            else:
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Closes every idle connection."""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, 'idle': len(self._idle), 'max_size': self.max_size}
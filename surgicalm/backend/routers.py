@@ -0,0 +1,96 @@
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+STICKY_PREFIX = 'db-sticky'
+# Only app data is read from the replica; the cache table, token blacklist and
+# lockouts always need the primary's latest state
+REPLICA_APP_LABELS = {'users'}
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def _sticky_key(user_id):
+    return f'{STICKY_PREFIX}:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """
+    Keeps replica reads about a user (a patient who just completed something,
+    or a nurse who just registered patients) on the primary for
+    DATABASE_REPLICA_STICKY_SECONDS, long enough for the replica to catch up.
+    """
+    if replica_configured():
+        cache.set(_sticky_key(user_id), True, settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+@contextmanager
+def replica_reads(*user_ids):
+    """
+    Routes reads inside the block to the replica, unless one of `user_ids` was
+    pinned to the primary within the sticky window. Reads inside a transaction
+    on the primary stay there.
+    """
+    use_replica = replica_configured() and not (
+        user_ids and cache.get_many([_sticky_key(user_id) for user_id in user_ids])
+    )
+    token = _replica_reads.set(use_replica)
+    try:
+        yield use_replica
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_view(patient_kwarg=None):
+    """
+    Runs a read-only view inside replica_reads(), sticky on the requesting user
+    and on the patient named by the `patient_kwarg` URL argument.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            user_ids = [request.user.id]
+            if patient_kwarg:
+                user_ids.append(kwargs[patient_kwarg])
+            with replica_reads(*user_ids):
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ReplicaRouter:
+    """
+    Sends reads made inside replica_reads() to the replica and everything else,
+    writes included, to the primary. The replica is a copy of the primary, so
+    relations between the two are allowed and it is never migrated.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            _replica_reads.get()
+            and model._meta.app_label in REPLICA_APP_LABELS
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Without this, saving an instance read from the replica would write to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA_ALIAS} or None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_ALIAS:
+            return False
+        return None
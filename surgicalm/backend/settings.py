@@ -79,7 +79,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'surgicalm.users.authentication.ClaimsJWTAuthentication',
     ],
 }
 
@@ -88,6 +88,9 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),  
     'ROTATE_REFRESH_TOKENS': True, 
     'BLACKLIST_AFTER_ROTATION': True,
+    # Adds user_type / hospital_id claims to tokens from the generic token endpoint
+    'TOKEN_OBTAIN_SERIALIZER': 'surgicalm.users.serializers.HospitalTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'surgicalm.users.serializers.HospitalTokenRefreshSerializer',
 }
 
 AUTHENTICATION_BACKENDS = [
@@ -98,6 +101,11 @@ AUTHENTICATION_BACKENDS = [
 AXES_FAILURE_LIMIT = 10  
 AXES_COOLOFF_TIME = timedelta(hours=1)  
 AXES_RESET_ON_SUCCESS = True  
+# Keep failure counters in the shared cache instead of writing AccessAttempt rows per login
+AXES_HANDLER = 'axes.handlers.cache.AxesCacheHandler'
+AXES_CACHE = 'default'
+
+RATELIMIT_USE_CACHE = 'default'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -132,22 +140,58 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'surgicalm.backend.wsgi.application'
 
+# MySQL connections are kept open between requests and pinged before reuse.
+# DB_POOL_ENABLED switches to a per-worker pool (surgicalm.backend.mysql_pool)
+# that takes connections back after every request instead.
+DB_POOL_ENABLED = config('DB_POOL_ENABLED', default=False, cast=bool)
+DB_POOL = {
+    'min_size': config('DB_POOL_MIN_SIZE', default=1, cast=int),
+    'max_size': config('DB_POOL_MAX_SIZE', default=4, cast=int),
+    'timeout': config('DB_POOL_TIMEOUT', default=10.0, cast=float),
+    'max_idle': config('DB_POOL_MAX_IDLE', default=300, cast=int),
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'surgicalm.backend.mysql_pool',
         'NAME': config('DATABASE_NAME'),
         'USER': config('DATABASE_USER'),
         'PASSWORD': config('DATABASE_PASSWORD'),
         'HOST': config('DATABASE_HOST'),
         'PORT': config('DATABASE_PORT'),
+        'CONN_MAX_AGE': 0 if DB_POOL_ENABLED else config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
         'OPTIONS': {
             'charset': 'utf8mb4',
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
             'auth_plugin': 'caching_sha2_password', 
+            'pool': DB_POOL if DB_POOL_ENABLED else False,
         }
     }
 }
 
+# Shared by every worker and instance: rate limits, axes lockouts, the token
+# blacklist and the roster/autocomplete caches. Set REDIS_URL in production;
+# otherwise the database cache table, created by `manage.py migrate`, is used.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'surgicalm',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'surgicalm.backend.cache.AtomicDatabaseCache',
+            'LOCATION': config('CACHE_TABLE', default='surgicalm_cache'),
+            'KEY_PREFIX': 'surgicalm',
+            'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=100000, cast=int)},
+        }
+    }
+
 AUTH_USER_MODEL = 'users.CustomUser'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -164,3 +208,78 @@ AUTH_PASSWORD_VALIDATORS = [
         'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
     },
 ]
+
+# Patient search
+PATIENT_SEARCH_BACKEND = config('PATIENT_SEARCH_BACKEND', default='surgicalm.users.search.NgramIndexBackend')
+PATIENT_SEARCH_MAX_RESULTS = config('PATIENT_SEARCH_MAX_RESULTS', default=50, cast=int)
+PATIENT_AUTOCOMPLETE_LIMIT = config('PATIENT_AUTOCOMPLETE_LIMIT', default=10, cast=int)
+
+# Write-behind buffering of WatchedData (flushed by `manage.py flush_watch_buffer`)
+WATCH_BUFFER_ENABLED = config('WATCH_BUFFER_ENABLED', default=False, cast=bool)
+WATCH_BUFFER_BATCH_SIZE = config('WATCH_BUFFER_BATCH_SIZE', default=1000, cast=int)
+
+# Offline sync: how far back queued completions are still accepted
+SYNC_HISTORY_MAX_DAYS = config('SYNC_HISTORY_MAX_DAYS', default=7, cast=int)
+
+# Patient activity log (older events are rolled into daily aggregates by `manage.py compact_activity_log`)
+ACTIVITY_LOG_RETENTION_DAYS = config('ACTIVITY_LOG_RETENTION_DAYS', default=30, cast=int)
+
+# Expo push delivery
+EXPO_PUSH_URL = config('EXPO_PUSH_URL', default='https://exp.host/--/api/v2/push/send')
+EXPO_RECEIPTS_URL = config('EXPO_RECEIPTS_URL', default='https://exp.host/--/api/v2/push/getReceipts')
+EXPO_PUSH_MAX_WORKERS = config('EXPO_PUSH_MAX_WORKERS', default=8, cast=int)
+EXPO_PUSH_TIMEOUT = config('EXPO_PUSH_TIMEOUT', default=10.0, cast=float)
+EXPO_PUSH_MAX_RETRIES = config('EXPO_PUSH_MAX_RETRIES', default=3, cast=int)
+EXPO_PUSH_BACKOFF = config('EXPO_PUSH_BACKOFF', default=0.5, cast=float)
+
+# Notification outbox (drained by `manage.py process_notification_outbox`)
+NOTIFICATION_MAX_ATTEMPTS = config('NOTIFICATION_MAX_ATTEMPTS', default=5, cast=int)
+NOTIFICATION_RETRY_DELAY = config('NOTIFICATION_RETRY_DELAY', default=60, cast=int)
+NOTIFICATION_RECEIPT_DELAY = config('NOTIFICATION_RECEIPT_DELAY', default=900, cast=int)
+# Expo keeps receipts for about a day; tickets still without one are given up on
+NOTIFICATION_RECEIPT_EXPIRY = config('NOTIFICATION_RECEIPT_EXPIRY', default=86400, cast=int)
+
+# Per-hospital local-time scheduling (run `manage.py dispatch_scheduled` every few minutes;
+# the daily /users/cron/refresh-all-user-data/ job still refreshes whatever it hasn't reached)
+DAILY_REMINDER_TITLE = config('DAILY_REMINDER_TITLE', default='Daily Reminder 🚀')
+DAILY_REMINDER_BODY = config('DAILY_REMINDER_BODY', default='Time to check your app!')
+
+# Google signing keys for the Cloud Scheduler OIDC tokens (point at a local JWKS to test)
+GOOGLE_OIDC_JWKS_URL = config('GOOGLE_OIDC_JWKS_URL', default='https://www.googleapis.com/oauth2/v3/certs')
+
+# Refresh token blacklist (expired rows are removed by `manage.py prune_expired_tokens`)
+JWT_BLACKLIST_CACHE = config('JWT_BLACKLIST_CACHE', default='default')
+JWT_BLACKLIST_FILTER_TTL = config('JWT_BLACKLIST_FILTER_TTL', default=300, cast=int)
+JWT_BLACKLIST_FILTER_ERROR_RATE = config('JWT_BLACKLIST_FILTER_ERROR_RATE', default=0.001, cast=float)
+TOKEN_PRUNE_BATCH_SIZE = config('TOKEN_PRUNE_BATCH_SIZE', default=1000, cast=int)
+
+# Email outbox (drained by `manage.py process_email_outbox` over one SMTP connection,
+# or by Cloud Scheduler POSTing to /users/cron/process-email-outbox/)
+EMAIL_OUTBOX_BATCH_SIZE = config('EMAIL_OUTBOX_BATCH_SIZE', default=50, cast=int)
+EMAIL_OUTBOX_MAX_ATTEMPTS = config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+EMAIL_OUTBOX_RETRY_DELAY = config('EMAIL_OUTBOX_RETRY_DELAY', default=60, cast=int)
+EMAIL_OUTBOX_CRON_MAX_MESSAGES = config('EMAIL_OUTBOX_CRON_MAX_MESSAGES', default=500, cast=int)
+
+# Bulk patient onboarding (`POST /users/patients/import/` or `manage.py import_patients`)
+PATIENT_IMPORT_MAX_ROWS = config('PATIENT_IMPORT_MAX_ROWS', default=500, cast=int)
+PATIENT_IMPORT_HASH_WORKERS = config('PATIENT_IMPORT_HASH_WORKERS', default=os.cpu_count() or 1, cast=int)
+
+# Async versions of the hot patient endpoints (on by default under asgi.py)
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
+# Cold starts: preload views, connections and per-process caches when a worker boots (see UsersConfig.warm_up)
+WARM_UP_ON_START = config('WARM_UP_ON_START', default=True, cast=bool)
+
+# Read replica for nurse analytics and nightly bulk reads (see surgicalm.backend.routers).
+# Reads about a patient or nurse stay on the primary for a few seconds after they write.
+DATABASE_REPLICA_HOST = config('DATABASE_REPLICA_HOST', default='')
+DATABASE_REPLICA_STICKY_SECONDS = config('DATABASE_REPLICA_STICKY_SECONDS', default=10, cast=int)
+if DATABASE_REPLICA_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': DATABASE_REPLICA_HOST,
+        'PORT': config('DATABASE_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['surgicalm.backend.routers.ReplicaRouter']
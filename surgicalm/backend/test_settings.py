@@ -0,0 +1,35 @@
+"""
+Settings for the test suite, runnable without MySQL or the production env:
+
+    cd surgicalm && python manage.py test --settings=backend.test_settings
+
+SQLite stands in for MySQL, with a `replica` alias mirroring the default
+database so the replica router can be exercised. The users migrations contain
+MySQL-only SQL, so the test database is built straight from the models.
+"""
+import os
+
+for name in (
+    'SECRET_KEY', 'DEV_KEY', 'BASE_URL', 'SERVICE_ACCOUNT_EMAIL', 'STORAGE_BUCKET_NAME',
+    'EMAIL_HOST_USERNAME', 'EMAIL_HOST_PASSWORD', 'DEFAULT_FROM_EMAIL',
+    'DATABASE_NAME', 'DATABASE_USER', 'DATABASE_PASSWORD', 'DATABASE_HOST', 'DATABASE_PORT',
+):
+    os.environ.setdefault(name, 'test')
+
+from .settings import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+MIGRATION_MODULES = {'users': None}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+WARM_UP_ON_START = False
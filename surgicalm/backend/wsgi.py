@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'surgicalm.backend.settings')
 
 application = get_wsgi_application()
+
+# Load views and open connections before the first request reaches this worker
+from django.apps import apps
+apps.get_app_config('users').warm_up()
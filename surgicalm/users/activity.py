@@ -0,0 +1,92 @@
+import logging
+import operator
+from collections import Counter
+from functools import reduce
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Max, Min, Q, Value, When
+from django.utils import timezone
+
+from .models import ActivityDailyAggregate, ActivityEvent
+
+logger = logging.getLogger(__name__)
+
+COMPACTION_CHUNK_SIZE = 5000
+AGGREGATE_BATCH_SIZE = 1000
+
+
+def log_activity(patient_id, event, object_id=None):
+    """Appends a single event to the activity log."""
+    ActivityEvent.objects.create(patient_id=patient_id, event=event, object_id=object_id)
+
+
+async def alog_activity(patient_id, event, object_id=None):
+    """log_activity() for async views."""
+    await ActivityEvent.objects.acreate(patient_id=patient_id, event=event, object_id=object_id)
+
+
+def log_activities(patient_id, event, object_ids, created_at=None):
+    """Appends one event per object id with a single bulk insert."""
+    if not object_ids:
+        return
+    created_at = created_at or timezone.now()
+    ActivityEvent.objects.bulk_create([
+        ActivityEvent(patient_id=patient_id, event=event, object_id=object_id, created_at=created_at)
+        for object_id in object_ids
+    ])
+
+
+def _add_to_aggregates(counts, batch_size=AGGREGATE_BATCH_SIZE):
+    """
+    Adds {(patient_id, date, event): n} to the daily aggregates the way
+    bump_watch_rollups does: missing rows are inserted at zero, skipping any
+    that exist, then one UPDATE per batch adds every count through a CASE.
+    The increments happen in the database, so overlapping runs don't lose counts.
+    """
+    items = list(counts.items())
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        ActivityDailyAggregate.objects.bulk_create([
+            ActivityDailyAggregate(patient_id=patient_id, date=day, event=event, count=0)
+            for (patient_id, day, event), _ in batch
+        ], ignore_conflicts=True)
+        keys = [Q(patient_id=patient_id, date=day, event=event) for (patient_id, day, event), _ in batch]
+        ActivityDailyAggregate.objects.filter(reduce(operator.or_, keys)).update(count=F('count') + Case(
+            *[When(key, then=Value(count)) for key, (_, count) in zip(keys, batch)],
+            default=Value(0),
+        ))
+
+
+def compact_activity_log(retention_days=None, chunk_size=COMPACTION_CHUNK_SIZE):
+    """
+    Rolls events older than the retention window into per-day aggregates and
+    deletes them, walking the primary key in chunks so each transaction stays
+    short. Returns the number of events compacted.
+    """
+    retention_days = settings.ACTIVITY_LOG_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = timezone.now() - timezone.timedelta(days=retention_days)
+
+    bounds = ActivityEvent.objects.filter(created_at__lt=cutoff).aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return 0
+
+    compacted = 0
+    for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        with transaction.atomic():
+            events = ActivityEvent.objects.select_for_update().filter(
+                id__gte=start, id__lt=start + chunk_size, created_at__lt=cutoff
+            )
+            rows = list(events.values_list('id', 'patient_id', 'event', 'created_at'))
+            if not rows:
+                continue
+
+            _add_to_aggregates(Counter(
+                (patient_id, timezone.localdate(created_at), event)
+                for _, patient_id, event, created_at in rows
+            ))
+            ActivityEvent.objects.filter(id__in=[row[0] for row in rows]).delete()
+            compacted += len(rows)
+
+    logger.info("Compacted %s activity events older than %s", compacted, cutoff)
+    return compacted
@@ -1,4 +1,10 @@
+import logging
+import time
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class UsersConfig(AppConfig):
@@ -9,4 +15,46 @@ class UsersConfig(AppConfig):
 
     def ready(self):
         # Import signals here to ensure they are connected when the app is ready
-        import surgicalm.users.signals
\ No newline at end of file
+        import surgicalm.users.signals
+
+    def warm_up(self):
+        """
+        Does the work a fresh instance would otherwise do on its first request:
+        loads the URLconf (and with it every view module), opens the database
+        and cache connections and builds the token blacklist filter. Called by
+        wsgi.py/asgi.py rather than ready(), so management commands skip it.
+        A failing step is logged and skipped. Returns {step: seconds}.
+        """
+        if not settings.WARM_UP_ON_START:
+            return {}
+
+        from django.core.cache import cache
+        from django.db import connection
+        from django.urls import get_resolver
+        from .search import get_search_backend
+        from .token_blacklist import load_filter
+
+        def open_database():
+            connection.ensure_connection()
+            # Without CONN_MAX_AGE this hands the connection straight back to the pool
+            connection.close_if_unusable_or_obsolete()
+
+        steps = [
+            ('urlconf', lambda: get_resolver().url_patterns),
+            ('database', open_database),
+            ('cache', lambda: cache.get('warm-up')),
+            ('token_blacklist', load_filter),
+            ('search_backend', get_search_backend),
+        ]
+        timings = {}
+        for name, step in steps:
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                logger.warning(f"[WARM_UP] {name} failed: {e}")
+            timings[name] = time.perf_counter() - started
+
+        logger.info("[WARM_UP] Finished in %.3fs (%s)", sum(timings.values()),
+                    ', '.join(f'{name}={seconds * 1000:.0f}ms' for name, seconds in timings.items()))
+        return timings
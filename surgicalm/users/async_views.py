@@ -0,0 +1,172 @@
+"""
+Async versions of the hot patient endpoints, served in place of the views in
+views.py when ASYNC_VIEWS is on (the default under asgi.py). DRF views are
+sync-only, so these are plain Django async views: async_api_view does the
+method check, JWT authentication and JSON parsing that api_view and
+IsAuthenticated do for the sync views, and responses keep the same payloads.
+"""
+import functools
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .activity import alog_activity
+from .authentication import ClaimsJWTAuthentication
+from .models import (
+    ActivityEvent, AssignedModules, AssignedQuote, AssignedTask, ModulesList, PushNotificationToken,
+)
+from .serializers import AssignedModuleSerializer, AssignedQuoteSerializer, AssignedTaskSerializer
+from .services import acalculate_weekly_watched_data, complete_assignments, complete_video
+from .storage import generate_signed_url
+
+logger = logging.getLogger(__name__)
+
+_authenticator = ClaimsJWTAuthentication()
+
+
+def _error_response(exc):
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    return JsonResponse(data, status=exc.status_code, safe=False)
+
+
+def async_api_view(methods):
+    """
+    Wraps an async view so it only accepts `methods` from an authenticated
+    user. Sets request.user, request.auth and, for POSTs, request.data.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'},
+                                    status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+            try:
+                auth = await _authenticator.aauthenticate(request)
+            except APIException as exc:
+                response = _error_response(exc)
+                response['WWW-Authenticate'] = _authenticator.authenticate_header(request)
+                return response
+            if auth is None:
+                response = JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                                        status=status.HTTP_401_UNAUTHORIZED)
+                response['WWW-Authenticate'] = _authenticator.authenticate_header(request)
+                return response
+            request.user, request.auth = auth
+
+            if request.method == 'POST':
+                if request.content_type == 'application/json':
+                    try:
+                        request.data = json.loads(request.body) if request.body else {}
+                    except ValueError as e:
+                        return JsonResponse({'detail': f'JSON parse error - {e}'}, status=status.HTTP_400_BAD_REQUEST)
+                else:
+                    request.data = request.POST
+
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@async_api_view(['GET'])
+async def get_module_signed_url(request, module_id):
+    logger.info(f"[SIGNED_URL] Request received for module {module_id} by user {request.user.id} "
+                f"(hospital={request.user.hospital_id})")
+
+    try:
+        module = await ModulesList.objects.aget(id=module_id, hospital_id=request.user.hospital_id)
+    except ModulesList.DoesNotExist:
+        logger.warning(f"[SIGNED_URL] Module {module_id} not found or not in hospital {request.user.hospital_id}")
+        return JsonResponse({"error": "Module not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    # Signing calls the IAM API; run it off the loop without tying up the ORM's thread
+    try:
+        signed_url = await sync_to_async(generate_signed_url, thread_sensitive=False)(module.url)
+    except Exception as gen_err:
+        logger.error(f"[SIGNED_URL] Failed to generate signed URL for module {module_id}: {gen_err}", exc_info=True)
+        return JsonResponse({"error": "Signed URL generation failed."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    logger.info(f"[SIGNED_URL] Successfully generated signed URL for module {module_id}")
+    return JsonResponse({"signedUrl": signed_url}, status=status.HTTP_200_OK)
+
+
+@async_api_view(['GET'])
+async def dashboard(request):
+    user = request.user
+
+    assigned_videos = [
+        assigned async for assigned in AssignedModules.objects.filter(patient=user).select_related('video__category')
+    ]
+    assigned_tasks = [assigned async for assigned in AssignedTask.objects.filter(patient=user).select_related('task')]
+    assigned_quote = await AssignedQuote.objects.filter(patient=user).select_related('quote').afirst()
+
+    week_data = await acalculate_weekly_watched_data(user)
+    await alog_activity(user.id, ActivityEvent.DASHBOARD_OPENED)
+
+    return JsonResponse({
+        'generalVideos': AssignedModuleSerializer(assigned_videos, many=True).data,
+        'tasks': AssignedTaskSerializer(assigned_tasks, many=True).data,
+        'quote': AssignedQuoteSerializer(assigned_quote).data if assigned_quote else None,
+        'weekData': week_data,
+    }, status=status.HTTP_200_OK)
+
+
+@async_api_view(['POST'])
+async def update_task_completion(request, taskId):
+    user = request.user
+
+    try:
+        # The update, change feed and activity share a transaction, which the async ORM can't hold
+        results = await sync_to_async(complete_assignments)(user, [taskId], [])
+        result = results['tasks'][taskId]
+        if result == 'not_found':
+            return JsonResponse({'error': 'Assigned task not found for this user.'}, status=status.HTTP_404_NOT_FOUND)
+        if result == 'already_completed':
+            return JsonResponse({'message': 'Task has already been completed'}, status=status.HTTP_200_OK)
+        return JsonResponse({'message': 'Task completion status updated successfully.'}, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_api_view(['POST'])
+async def update_video_completion(request, videoId):
+    user = request.user
+
+    if 'isCompleted' not in request.data:
+        return JsonResponse({'error': "'isCompleted' field is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+    is_completed = request.data.get('isCompleted')
+
+    try:
+        # The update, change feed and watch record share a transaction, which the async ORM can't hold
+        if not await sync_to_async(complete_video)(user, videoId, is_completed):
+            return JsonResponse({'message': 'Video has already been completed'}, status=status.HTTP_200_OK)
+        return JsonResponse({'message': 'Video completion status updated successfully.'}, status=status.HTTP_200_OK)
+
+    except AssignedModules.DoesNotExist:
+        return JsonResponse({'error': 'Assigned video not found for this user.'}, status=status.HTTP_404_NOT_FOUND)
+
+    except ObjectDoesNotExist:
+        return JsonResponse({'error': 'Data collection record not found, failed to update statistics.'},
+                            status=status.HTTP_404_NOT_FOUND)
+
+    except Exception as e:
+        return JsonResponse({'error': f'An unexpected error occurred: {str(e)}'},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_api_view(['POST'])
+async def save_push_token(request):
+    token = request.data.get('pushToken')
+    if not token:
+        return JsonResponse({'error': 'Missing pushToken'}, status=status.HTTP_400_BAD_REQUEST)
+    await PushNotificationToken.objects.aupdate_or_create(token=token, defaults={'patient': request.user})
+    return JsonResponse({'status': 'Token saved'}, status=status.HTTP_200_OK)
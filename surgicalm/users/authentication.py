@@ -0,0 +1,115 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import CustomUser
+from .token_blacklist import is_blacklisted, mark_blacklisted
+
+# Claims copied into every token so views can skip the user row
+USER_CLAIMS = ('user_type', 'hospital_id')
+
+
+class HospitalRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the user's type and hospital, inherited by its
+    access tokens. Blacklist checks go through the cache and bloom filter in
+    token_blacklist before the database.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM], self.payload['exp']):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        mark_blacklisted(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+        return result
+
+
+def _inactive_key(user_id):
+    return f'user-inactive:{user_id}'
+
+
+def mark_inactive(user_id):
+    """
+    Flags a deactivated or deleted user so claims-authenticated requests are
+    refused. The flag only has to outlive the access tokens already issued;
+    refreshing a token checks the user row itself.
+    """
+    cache.set(_inactive_key(user_id), True, int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()))
+
+
+def clear_inactive(user_id):
+    cache.delete(_inactive_key(user_id))
+
+
+def has_user_claims(validated_token):
+    return api_settings.USER_ID_CLAIM in validated_token and all(claim in validated_token for claim in USER_CLAIMS)
+
+
+def user_from_claims(validated_token):
+    """
+    Builds a CustomUser from token claims without touching the database. Every
+    other field is deferred and loaded on first read, and save() writes back
+    just the fields that were loaded or changed.
+    """
+    loaded = {
+        'id': validated_token[api_settings.USER_ID_CLAIM],
+        **{claim: validated_token[claim] for claim in USER_CLAIMS},
+    }
+    fields = [f.attname for f in CustomUser._meta.concrete_fields if f.attname in loaded]
+    return CustomUser.from_db(DEFAULT_DB_ALIAS, fields, [loaded[name] for name in fields])
+
+
+def _active_user_from_claims(validated_token, inactive):
+    if inactive:
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+    return user_from_claims(validated_token)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that trusts the user claims in the token instead of
+    loading the user row on every request. Tokens issued before the claims
+    existed fall back to the regular lookup.
+
+    Deactivated and deleted users are refused through the cached flag that
+    the user signals set (see mark_inactive).
+    """
+
+    def get_user(self, validated_token):
+        if has_user_claims(validated_token):
+            inactive = cache.get(_inactive_key(validated_token[api_settings.USER_ID_CLAIM]))
+            return _active_user_from_claims(validated_token, inactive)
+        return super().get_user(validated_token)
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() for async views. Validating the token is CPU only, so
+        just the inactive flag and the fallback user lookup for claimless
+        tokens leave the loop.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        if has_user_claims(validated_token):
+            inactive = await cache.aget(_inactive_key(validated_token[api_settings.USER_ID_CLAIM]))
+            return _active_user_from_claims(validated_token, inactive), validated_token
+        return await sync_to_async(super().get_user)(validated_token), validated_token
@@ -0,0 +1,128 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import CustomUser
+
+PREFIX_CACHE_TIMEOUT = 60
+PREFIX_CACHE_CANDIDATES = 500
+
+_indexes = {}
+_build_lock = threading.Lock()
+
+
+def _version_key(hospital_id):
+    return f'patient-search-version:{hospital_id}'
+
+
+def get_index_version(hospital_id):
+    """Returns the current patient-list version for a hospital."""
+    key = _version_key(hospital_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_hospital(hospital_id):
+    """Bumps the hospital's version so every process drops its prefix index."""
+    key = _version_key(hospital_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+class PrefixIndex:
+    """Sorted (lowercased key, patient) pairs for one hospital, searched with bisect."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = {}
+        entries = []
+        for row in rows:
+            pk, username, email = row
+            self.rows[pk] = row
+            entries.append((username.lower(), pk))
+            if email:
+                entries.append((email.lower(), pk))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.ids = [pk for _, pk in entries]
+
+    def lookup(self, prefix, limit):
+        """Returns up to `limit` rows whose username or email starts with `prefix`."""
+        matches = []
+        seen = set()
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and self.keys[position].startswith(prefix):
+            pk = self.ids[position]
+            if pk not in seen:
+                seen.add(pk)
+                matches.append(self.rows[pk])
+                if len(matches) >= limit:
+                    break
+            position += 1
+        return matches
+
+
+def get_prefix_index(hospital_id, version):
+    index = _indexes.get(hospital_id)
+    if index is not None and index.version == version:
+        return index
+
+    with _build_lock:
+        index = _indexes.get(hospital_id)
+        if index is None or index.version != version:
+            rows = CustomUser.objects.filter(
+                user_type='patient', hospital_id=hospital_id
+            ).values_list('id', 'username', 'email')
+            index = PrefixIndex(version, list(rows))
+            _indexes[hospital_id] = index
+    return index
+
+
+def _match_key(row, prefix):
+    keys = [field.lower() for field in row[1:] if field and field.lower().startswith(prefix)]
+    return min(keys) if keys else None
+
+
+def autocomplete(nurse_id, hospital_id, query, limit):
+    """
+    Top-`limit` patients whose username or email starts with `query`.
+    If the nurse's previous query was a prefix of this one and its candidate
+    set was complete, that set is filtered instead of hitting the index.
+    """
+    prefix = query.strip().lower()
+    version = get_index_version(hospital_id)
+    cache_key = f'patient-autocomplete:{nurse_id}'
+    previous = cache.get(cache_key)
+
+    if (previous and previous['version'] == version and previous['complete']
+            and prefix.startswith(previous['prefix'])):
+        keyed = [(_match_key(row, prefix), row) for row in previous['rows']]
+        candidates = [row for key, row in sorted(
+            (item for item in keyed if item[0] is not None), key=lambda item: (item[0], item[1][0])
+        )]
+        complete = True
+    else:
+        candidates = get_prefix_index(hospital_id, version).lookup(prefix, PREFIX_CACHE_CANDIDATES + 1)
+        complete = len(candidates) <= PREFIX_CACHE_CANDIDATES
+        candidates = candidates[:PREFIX_CACHE_CANDIDATES]
+
+    cache.set(cache_key, {
+        'version': version,
+        'prefix': prefix,
+        'complete': complete,
+        'rows': candidates,
+    }, PREFIX_CACHE_TIMEOUT)
+
+    limit = max(1, min(limit, settings.PATIENT_AUTOCOMPLETE_LIMIT))
+    return [
+        {'id': pk, 'username': username, 'email': email}
+        for pk, username, email in candidates[:limit]
+    ]
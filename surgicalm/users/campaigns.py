@@ -0,0 +1,85 @@
+from string import Formatter
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import (
+    ActivityDailyAggregate, ActivityEvent, AssignedModules, AssignedTask,
+    CustomUser, PushNotificationToken,
+)
+
+PERSONALIZATION_FIELDS = {'username', 'remaining_tasks', 'remaining_modules'}
+AUDIENCE_BATCH_SIZE = 1000
+
+
+def template_fields(body):
+    """Returns the placeholder names used in a campaign body, raising ValueError on bad ones."""
+    fields = {name for _, name, _, _ in Formatter().parse(body) if name is not None}
+    unknown = fields - PERSONALIZATION_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown placeholders: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def audience_queryset(campaign):
+    """
+    Push tokens for a campaign's audience, filtered with semi-joins on the
+    assignment and activity tables rather than per-patient lookups.
+    """
+    tokens = PushNotificationToken.objects.all()
+    if campaign.hospital_id:
+        tokens = tokens.filter(patient__hospital_id=campaign.hospital_id)
+
+    if campaign.audience == 'incomplete_today':
+        tokens = tokens.filter(
+            Q(patient_id__in=AssignedTask.objects.filter(isCompleted=False).values('patient_id'))
+            | Q(patient_id__in=AssignedModules.objects.filter(isCompleted=False).values('patient_id'))
+        )
+    elif campaign.audience == 'inactive':
+        cutoff = timezone.now() - timezone.timedelta(days=campaign.inactive_days or 7)
+        tokens = tokens.exclude(
+            patient_id__in=ActivityEvent.objects.filter(created_at__gte=cutoff).values('patient_id')
+        ).exclude(
+            patient_id__in=ActivityDailyAggregate.objects.filter(date__gte=cutoff.date()).values('patient_id')
+        )
+    return tokens
+
+
+def _personalization(patient_ids, fields):
+    """One grouped query per placeholder kind for a whole batch of patients."""
+    values = {pk: {} for pk in patient_ids}
+    if 'username' in fields:
+        for pk, username in CustomUser.objects.filter(id__in=patient_ids).values_list('id', 'username'):
+            values[pk]['username'] = username
+    for field, model in (('remaining_tasks', AssignedTask), ('remaining_modules', AssignedModules)):
+        if field in fields:
+            counts = dict(
+                model.objects.filter(patient_id__in=patient_ids, isCompleted=False)
+                .values('patient_id').annotate(n=Count('id')).values_list('patient_id', 'n')
+            )
+            for pk in patient_ids:
+                values[pk][field] = counts.get(pk, 0)
+    return values
+
+
+def audience_batch(campaign, after_id=0, batch_size=AUDIENCE_BATCH_SIZE):
+    """
+    Returns (last_token_id, rows) for the next keyset page of a campaign's
+    audience after token id `after_id`; rows are (token, patient_id, body),
+    and `body` is None when the campaign has no placeholders and the shared
+    body applies. An empty page means the audience is exhausted.
+    """
+    fields = template_fields(campaign.body)
+    page = list(
+        audience_queryset(campaign).filter(id__gt=after_id)
+        .order_by('id').values_list('id', 'token', 'patient_id')[:batch_size]
+    )
+    if not page:
+        return after_id, []
+    if not fields:
+        return page[-1][0], [(token, patient_id, None) for _, token, patient_id in page]
+    values = _personalization({patient_id for _, _, patient_id in page}, fields)
+    return page[-1][0], [
+        (token, patient_id, campaign.body.format_map(values[patient_id]))
+        for _, token, patient_id in page
+    ]
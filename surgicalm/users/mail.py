@@ -0,0 +1,192 @@
+import logging
+import smtplib
+import time
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .models import CustomUser, OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+STALE_SENDING_AFTER = timezone.timedelta(minutes=10)
+
+
+def enqueue_email(to_email, subject, body):
+    return OutgoingEmail.objects.create(to_email=to_email, subject=subject, body=body)
+
+
+def enqueue_password_reset(email):
+    """
+    Queues a reset email for `email` without checking whether it is registered,
+    so the request does the same single INSERT either way.
+    """
+    return OutgoingEmail.objects.create(kind='password_reset', to_email=email)
+
+
+def render_password_reset(email):
+    """Returns (subject, body) for the account's reset link, or None if there is no account."""
+    user = CustomUser.objects.with_email(email).first()
+    if not user:
+        return None
+    token = default_token_generator.make_token(user)
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    reset_path = reverse('password_reset_confirm', kwargs={'uidb64': uid, 'token': token})
+    reset_link = f"{settings.BASE_URL}{reset_path}"
+    return "Password Reset", f"Use the link below to reset your password:\n{reset_link}"
+
+
+def _claim_emails(limit):
+    now = timezone.now()
+
+    # Recover rows left in flight by a worker that died mid-send
+    OutgoingEmail.objects.filter(status='sending', updated_at__lt=now - STALE_SENDING_AFTER).update(
+        status='queued', updated_at=now
+    )
+
+    with transaction.atomic():
+        queryset = OutgoingEmail.objects.filter(status='queued', next_attempt_at__lte=now).order_by('next_attempt_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        emails = list(queryset[:limit])
+        OutgoingEmail.objects.filter(id__in=[e.id for e in emails]).update(status='sending', updated_at=now)
+    return emails
+
+
+def is_transient(error):
+    """Connection drops, timeouts and 4xx replies are worth retrying; 5xx rejections are not."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+def _build_messages(emails, stats):
+    """Pairs each claimed email with its EmailMessage, discarding resets for unknown accounts."""
+    messages = []
+    discarded = []
+    for email in emails:
+        subject, body = email.subject, email.body
+        if email.kind == 'password_reset':
+            # The reset link is never stored in the outbox
+            rendered = render_password_reset(email.to_email)
+            if rendered is None:
+                discarded.append(email.id)
+                continue
+            subject, body = rendered
+        messages.append((email, EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [email.to_email])))
+
+    if discarded:
+        OutgoingEmail.objects.filter(id__in=discarded).update(status='discarded', updated_at=timezone.now())
+        stats['discarded'] += len(discarded)
+    return messages
+
+
+def _send_batch(smtp, messages, stats):
+    """
+    Sends one batch over the open connection and writes the outcomes back with
+    one bulk UPDATE. Each message goes through send_messages on its own so a
+    failure is attributed to the right row and nothing is sent twice. If the
+    connection can't be opened (bad credentials, server down) the rest of the
+    batch is requeued without using up an attempt and False is returned.
+    """
+    now = timezone.now()
+    connected = True
+    for index, (email, message) in enumerate(messages):
+        try:
+            # No-op while the connection is up; reconnects after a drop
+            smtp.open()
+        except Exception as e:
+            # A failed login leaves a half-open connection behind that every
+            # later send would trip over
+            smtp.close()
+            connected = False
+            pending = messages[index:]
+            retry_at = now + timezone.timedelta(seconds=settings.EMAIL_OUTBOX_RETRY_DELAY)
+            for deferred, _ in pending:
+                deferred.status, deferred.error, deferred.next_attempt_at = 'queued', str(e)[:255], retry_at
+            stats['deferred'] += len(pending)
+            logger.error(f"Could not open the SMTP connection, deferring {len(pending)} emails: {e}")
+            break
+
+        started = time.monotonic()
+        try:
+            smtp.send_messages([message])
+        except Exception as e:
+            email.attempts += 1
+            email.error = str(e)[:255]
+            if is_transient(e) and email.attempts < settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                delay = settings.EMAIL_OUTBOX_RETRY_DELAY * (2 ** (email.attempts - 1))
+                email.status, email.next_attempt_at = 'queued', now + timezone.timedelta(seconds=delay)
+                stats['retried'] += 1
+            else:
+                email.status = 'failed'
+                stats['failed'] += 1
+            logger.warning(f"Failed to send {email.kind} email {email.id} (attempt {email.attempts}): {e}")
+            if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                # The connection itself failed; reopen it for the next message
+                smtp.close()
+            continue
+
+        latency = time.monotonic() - started
+        email.status, email.error, email.sent_at = 'sent', None, timezone.now()
+        email.attempts += 1
+        email.latency_ms = round(latency * 1000)
+        stats['sent'] += 1
+        stats['latencies'].append(latency)
+
+    for email, _ in messages:
+        email.updated_at = timezone.now()
+    OutgoingEmail.objects.bulk_update(
+        [email for email, _ in messages],
+        ['status', 'error', 'attempts', 'next_attempt_at', 'latency_ms', 'sent_at', 'updated_at'],
+    )
+    return connected
+
+
+def drain_email_outbox(batch_size=None, max_messages=None, smtp=None):
+    """
+    Sends queued emails in batches over a single SMTP connection, opened once
+    and kept for the whole pass. Pass `smtp` to reuse a connection across
+    passes. Returns a stats dict with send latency percentiles.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    stats = {'sent': 0, 'retried': 0, 'failed': 0, 'discarded': 0, 'deferred': 0, 'latencies': []}
+    owns_connection = smtp is None
+    smtp = smtp or get_connection()
+    started = time.monotonic()
+    processed = 0
+
+    try:
+        while max_messages is None or processed < max_messages:
+            limit = batch_size if max_messages is None else min(batch_size, max_messages - processed)
+            emails = _claim_emails(limit)
+            if not emails:
+                break
+            processed += len(emails)
+            messages = _build_messages(emails, stats)
+            if messages and not _send_batch(smtp, messages, stats):
+                # Try again on the next pass rather than failing every batch
+                break
+    finally:
+        if owns_connection:
+            smtp.close()
+
+    latencies = sorted(stats.pop('latencies'))
+    elapsed = time.monotonic() - started
+    stats['elapsed'] = elapsed
+    stats['latency_p50_ms'] = latencies[len(latencies) // 2] * 1000 if latencies else 0.0
+    stats['latency_p95_ms'] = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+    if processed:
+        logger.info(
+            "Email outbox: %s sent, %s retried, %s failed in %.2fs (p50 %.1f ms)",
+            stats['sent'], stats['retried'], stats['failed'], elapsed, stats['latency_p50_ms'],
+        )
+    return stats
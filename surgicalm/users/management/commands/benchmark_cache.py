@@ -0,0 +1,64 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import RequestFactory, override_settings
+from django_ratelimit.core import is_ratelimited
+
+
+class Command(BaseCommand):
+    help = 'Measures per-request rate limit overhead and checks counter atomicity for each configured cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cache', action='append', help='Cache alias to test (default: all in CACHES)')
+        parser.add_argument('--requests', type=int, default=2000, help='Rate-limited calls to time')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent incrementers for the atomicity check')
+        parser.add_argument('--increments', type=int, default=200, help='Increments per thread')
+
+    def _ratelimit_overhead(self, alias, count):
+        request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.1')
+        group = f'benchmark-{uuid.uuid4().hex}'
+        with override_settings(RATELIMIT_USE_CACHE=alias):
+            started = time.perf_counter()
+            for _ in range(count):
+                is_ratelimited(request, group=group, key='ip', rate=f'{count * 2}/h', method='POST', increment=True)
+            return (time.perf_counter() - started) / count
+
+    def _concurrent_increments(self, alias, threads, increments):
+        cache = caches[alias]
+        key = f'benchmark-counter-{uuid.uuid4().hex}'
+        cache.add(key, 0, 60)
+        errors = []
+
+        def worker():
+            for _ in range(increments):
+                try:
+                    caches[alias].incr(key)
+                except Exception as e:
+                    errors.append(e)
+            connections.close_all()
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        total = cache.get(key)
+        cache.delete(key)
+        return total, len(errors)
+
+    def handle(self, *args, **options):
+        for alias in options['cache'] or list(settings.CACHES):
+            backend = settings.CACHES[alias]['BACKEND']
+            per_call = self._ratelimit_overhead(alias, options['requests'])
+            expected = options['threads'] * options['increments']
+            total, errors = self._concurrent_increments(alias, options['threads'], options['increments'])
+
+            self.stdout.write(f'{alias} ({backend})')
+            self.stdout.write(f'  ratelimit check: {per_call * 1000:.3f} ms per request')
+            style = self.style.SUCCESS if total == expected else self.style.ERROR
+            self.stdout.write(style(f'  concurrent incr: {total}/{expected} counted, {errors} errors'))
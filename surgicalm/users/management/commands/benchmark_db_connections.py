@@ -0,0 +1,112 @@
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+
+POOL_ENGINE = 'surgicalm.backend.mysql_pool'
+
+# (CONN_MAX_AGE, pool) per mode
+MODES = {
+    'fresh': (0, False),
+    'persistent': (600, False),
+    'pooled': (0, True),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares per-request latency with a new connection per request, persistent connections and the '
+        'connection pool. Each request is one SELECT between the request_started and request_finished signals.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per mode')
+        parser.add_argument('--threads', type=int, default=1, help='Concurrent request threads')
+        parser.add_argument('--modes', default='fresh,persistent,pooled', help='Comma-separated modes to run')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        settings_dict = connections[alias].settings_dict
+        pooled_backend = settings_dict['ENGINE'] == POOL_ENGINE
+        modes = options['modes'].split(',')
+        for mode in modes:
+            if mode not in MODES:
+                raise CommandError(f'Unknown mode {mode}')
+        if 'pooled' in modes and not pooled_backend:
+            self.stdout.write(self.style.WARNING(f'Skipping pooled: {alias} does not use {POOL_ENGINE}'))
+            modes.remove('pooled')
+
+        original_max_age = settings_dict['CONN_MAX_AGE']
+        original_pool = settings_dict['OPTIONS'].get('pool', False)
+        try:
+            for mode in modes:
+                max_age, pool = MODES[mode]
+                connections.close_all()
+                settings_dict['CONN_MAX_AGE'] = max_age
+                if pooled_backend:
+                    from surgicalm.backend.mysql_pool.base import close_pools
+                    close_pools()
+                    settings_dict['OPTIONS']['pool'] = settings.DB_POOL if pool else False
+
+                latencies, connects, connect_seconds = self.run_mode(alias, options['requests'], options['threads'],
+                                                                     pooled_backend)
+                latencies.sort()
+                connect_note = f', {connects} connects averaging {connect_seconds / connects * 1000:.1f}ms' if connects else ''
+                self.stdout.write(
+                    f'{mode:<11} p50 {statistics.median(latencies):6.2f}ms  '
+                    f'p95 {latencies[int(len(latencies) * 0.95) - 1]:6.2f}ms  '
+                    f'mean {statistics.fmean(latencies):6.2f}ms{connect_note}'
+                )
+        finally:
+            connections.close_all()
+            settings_dict['CONN_MAX_AGE'] = original_max_age
+            if pooled_backend:
+                from surgicalm.backend.mysql_pool.base import close_pools
+                close_pools()
+                settings_dict['OPTIONS']['pool'] = original_pool
+
+    def run_mode(self, alias, total, threads, pooled_backend):
+        if pooled_backend:
+            from surgicalm.backend.mysql_pool.base import connection_stats
+            before = connection_stats().get(alias, {})
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(count):
+            timings = []
+            for _ in range(count):
+                started = time.perf_counter()
+                request_started.send(sender=self.__class__)
+                try:
+                    with connections[alias].cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                        cursor.fetchone()
+                finally:
+                    request_finished.send(sender=self.__class__)
+                timings.append((time.perf_counter() - started) * 1000)
+            connections.close_all()
+            with lock:
+                latencies.extend(timings)
+
+        workers = [
+            threading.Thread(target=worker, args=(total // threads + (i < total % threads),))
+            for i in range(threads)
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        if not pooled_backend:
+            return latencies, 0, 0.0
+        after = connection_stats().get(alias, {})
+        return (
+            latencies,
+            after.get('connects', 0) - before.get('connects', 0),
+            after.get('connect_seconds', 0.0) - before.get('connect_seconds', 0.0),
+        )
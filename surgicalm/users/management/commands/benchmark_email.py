@@ -0,0 +1,100 @@
+import socketserver
+import threading
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from surgicalm.users.mail import drain_email_outbox, enqueue_email
+from surgicalm.users.models import OutgoingEmail
+
+
+def make_sink_handler(connect_latency, latency, counter):
+    class SMTPSinkHandler(socketserver.StreamRequestHandler):
+        """Accepts and drops mail like a minimal SMTP server; `connect_latency` stands in for the TLS handshake."""
+
+        def reply(self, line):
+            self.wfile.write(f'{line}\r\n'.encode())
+
+        def handle(self):
+            time.sleep(connect_latency)
+            self.reply('220 localhost SMTP sink')
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line.decode(errors='replace').strip().upper()
+                if command.startswith('EHLO'):
+                    self.reply('250-localhost')
+                    self.reply('250 8BITMIME')
+                elif command.startswith('DATA'):
+                    self.reply('354 End data with <CR><LF>.<CR><LF>')
+                    while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                        pass
+                    time.sleep(latency)
+                    counter.append(1)
+                    self.reply('250 OK')
+                elif command.startswith('QUIT'):
+                    self.reply('221 Bye')
+                    return
+                else:
+                    # HELO, MAIL, RCPT, RSET, NOOP
+                    self.reply('250 OK')
+
+    return SMTPSinkHandler
+
+
+class Command(BaseCommand):
+    help = 'Measures email outbox throughput against a local SMTP sink, with and without connection reuse.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500, help='Emails to queue per run')
+        parser.add_argument('--connect-latency', type=float, default=0.05, help='Sink delay before the greeting, in seconds')
+        parser.add_argument('--latency', type=float, default=0.002, help='Sink delay per message, in seconds')
+        parser.add_argument('--batch-size', type=int, default=50, help='Emails claimed per batch')
+
+    def handle(self, *args, **options):
+        counter = []
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        server = socketserver.ThreadingTCPServer(
+            ('127.0.0.1', 0), make_sink_handler(options['connect_latency'], options['latency'], counter)
+        )
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def connection():
+            return get_connection(
+                'django.core.mail.backends.smtp.EmailBackend', host='127.0.0.1', port=server.server_address[1],
+                username='', password='', use_tls=False, use_ssl=False,
+            )
+
+        try:
+            for reuse in (False, True):
+                ids = [
+                    enqueue_email(f'bench{i}@example.com', 'Benchmark', 'Benchmark body').id
+                    for i in range(options['messages'])
+                ]
+                if reuse:
+                    smtp = connection()
+                    stats = drain_email_outbox(options['batch_size'], options['messages'], smtp=smtp)
+                    smtp.close()
+                else:
+                    # What send_mail() does today: a new connection per email
+                    stats = {'sent': 0, 'elapsed': 0.0}
+                    while stats['sent'] < options['messages']:
+                        smtp = connection()
+                        run = drain_email_outbox(1, 1, smtp=smtp)
+                        smtp.close()
+                        if not run['sent'] and not run['retried']:
+                            break
+                        stats['sent'] += run['sent']
+                        stats['elapsed'] += run['elapsed']
+                OutgoingEmail.objects.filter(id__in=ids).delete()
+
+                label = 'one connection' if reuse else 'connection per email'
+                self.stdout.write(
+                    f"{label:<21} {stats['sent']} emails in {stats['elapsed']:.2f}s "
+                    f"({stats['sent'] / max(stats['elapsed'], 1e-9):.0f} emails/s)"
+                )
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,52 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from surgicalm.users.models import CustomUser, PartnerHospitals
+from surgicalm.users.search import get_search_backend
+
+class Command(BaseCommand):
+    help = 'Times patient search against a synthetic hospital. All rows are rolled back afterwards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100000, help='Patients to generate for the hospital')
+        parser.add_argument('--queries', type=int, default=200, help='Search queries to time')
+        parser.add_argument('--limit', type=int, default=20, help='Result limit per query')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        rng = random.Random(42)
+
+        with transaction.atomic():
+            hospital = PartnerHospitals.objects.create(hospital_name=f'benchmark-{time.time_ns()}')
+            usernames = [
+                ''.join(rng.choices(string.ascii_lowercase, k=6)) + str(i)
+                for i in range(options['patients'])
+            ]
+            CustomUser.objects.bulk_create([
+                CustomUser(
+                    username=f'{name}{hospital.id}', email=f'{name}@bench.example.com',
+                    user_type='patient', hospital=hospital, password='!'
+                ) for name in usernames
+            ], batch_size=5000)
+
+            started = time.perf_counter()
+            backend.rebuild(hospital_id=hospital.id)
+            self.stdout.write(f'Index build: {time.perf_counter() - started:.2f}s for {options["patients"]} patients')
+
+            timings = []
+            for _ in range(options['queries']):
+                name = rng.choice(usernames)
+                query = name[:rng.randint(2, len(name))]
+                started = time.perf_counter()
+                backend.search(hospital.id, query, options['limit'])
+                timings.append(time.perf_counter() - started)
+
+            timings.sort()
+            p50 = timings[len(timings) // 2] * 1000
+            p95 = timings[int(len(timings) * 0.95) - 1] * 1000
+            self.stdout.write(self.style.SUCCESS(f'{type(backend).__name__}: p50={p50:.2f}ms p95={p95:.2f}ms'))
+
+            transaction.set_rollback(True)
@@ -0,0 +1,59 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from surgicalm.users.push import EXPO_BATCH_SIZE, ExpoPushClient, build_messages
+
+
+def make_stub_handler(latency):
+    class ExpoStubHandler(BaseHTTPRequestHandler):
+        """Answers like the Expo push API: one 'ok' ticket per message."""
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            messages = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            time.sleep(latency)
+            payload = json.dumps({'data': [{'status': 'ok', 'id': str(i)} for i in range(len(messages))]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return ExpoStubHandler
+
+
+class Command(BaseCommand):
+    help = 'Measures push throughput (msg/s) against a local Expo stub server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10000, help='Synthetic messages to send')
+        parser.add_argument('--latency', type=float, default=0.05, help='Stub response delay per batch in seconds')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16], help='Concurrency levels to compare')
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_stub_handler(options['latency']))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        push_url = f'http://127.0.0.1:{server.server_port}/--/api/v2/push/send'
+
+        try:
+            tokens = [f'ExponentPushToken[bench{i}]' for i in range(options['messages'])]
+            for workers in options['workers']:
+                it = iter(tokens)
+                batches = (build_messages(batch, 'Benchmark', 'Benchmark') for batch in iter(lambda: list(islice(it, EXPO_BATCH_SIZE)), []))
+
+                started = time.monotonic()
+                sent = 0
+                with ExpoPushClient(push_url=push_url, max_workers=workers, max_retries=0) as client:
+                    for result in client.send(batches):
+                        sent += len(result.tickets)
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'workers={workers:<3} {sent} messages in {elapsed:.2f}s ({sent / elapsed:.0f} msg/s)')
+        finally:
+            server.shutdown()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from surgicalm.users.activity import COMPACTION_CHUNK_SIZE, compact_activity_log
+
+class Command(BaseCommand):
+    help = 'Rolls old patient activity events into per-day aggregates and deletes them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=None, help='Keep raw events newer than this')
+        parser.add_argument('--chunk-size', type=int, default=COMPACTION_CHUNK_SIZE, help='Events per transaction')
+
+    def handle(self, *args, **options):
+        compacted = compact_activity_log(options['retention_days'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Compacted {compacted} activity events.'))
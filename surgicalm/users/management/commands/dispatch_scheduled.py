@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from surgicalm.users.scheduling import dispatch_refreshes, dispatch_reminders
+
+class Command(BaseCommand):
+    help = 'Runs daily refreshes and reminders for hospitals whose local scheduled time has arrived.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=60, help='Minutes after the local time a run may still start')
+        parser.add_argument('--skip-refresh', action='store_true', help='Only send reminders')
+        parser.add_argument('--skip-reminders', action='store_true', help='Only refresh assignments')
+        parser.add_argument('--rate', type=float, default=None, help='Maximum push messages per second')
+
+    def handle(self, *args, **options):
+        window = timedelta(minutes=options['window'])
+
+        if not options['skip_refresh']:
+            refreshed = dispatch_refreshes(window=window)
+            self.stdout.write(f'Refreshed {refreshed} patients.')
+
+        if not options['skip_reminders']:
+            stats = dispatch_reminders(window=window, rate=options['rate'])
+            if stats is None:
+                self.stdout.write('No reminder buckets due.')
+            else:
+                self.stdout.write(f"Reminders: queued {stats['queued']}, sent {stats['sent']}, failed {stats['failed']}.")
+
+        self.stdout.write(self.style.SUCCESS('Dispatch complete.'))
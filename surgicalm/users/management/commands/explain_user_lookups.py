@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from surgicalm.users.models import CustomUser
+
+INDEXES = {
+    'email': 'users_customuser_email_ci_uniq',
+    'username': 'users_customuser_username_ci_uniq',
+}
+
+
+class Command(BaseCommand):
+    help = 'Prints EXPLAIN for the case-insensitive account lookups and checks they use the functional indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', default='someone@example.com')
+        parser.add_argument('--username', default='someone')
+
+    def handle(self, *args, **options):
+        lookups = [
+            ('email', 'with_email', CustomUser.objects.with_email(options['email'])),
+            ('username', 'with_username', CustomUser.objects.with_username(options['username'])),
+            ('email', 'email__iexact (old)', CustomUser.objects.filter(email__iexact=options['email'])),
+            ('username', 'username__iexact (old)', CustomUser.objects.filter(username__iexact=options['username'])),
+        ]
+
+        failed = False
+        for field, label, queryset in lookups:
+            plan = queryset.only('id').explain()
+            uses_index = INDEXES[field] in plan
+            self.stdout.write(f'{label}:')
+            self.stdout.write('  ' + plan.replace('\n', '\n  '))
+            if uses_index:
+                self.stdout.write(self.style.SUCCESS(f'  uses {INDEXES[field]}'))
+            elif not label.endswith('(old)'):
+                failed = True
+                self.stdout.write(self.style.ERROR(f'  does not use {INDEXES[field]}'))
+
+        if failed:
+            raise SystemExit(1)
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from surgicalm.users.watch_buffer import buffer_stats, flush_watch_buffer
+
+class Command(BaseCommand):
+    help = 'Flushes buffered video completion events into WatchedData and the daily rollups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.WATCH_BUFFER_BATCH_SIZE, help='Events per transaction')
+        parser.add_argument('--interval', type=float, default=0, help='Keep running, flushing every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            total = 0
+            batches = []
+            while True:
+                flushed, lag = flush_watch_buffer(options['batch_size'])
+                if not flushed:
+                    break
+                total += flushed
+                batches.append(flushed)
+                self.stdout.write(f'Flushed batch of {flushed} events (oldest was {lag:.1f}s old)')
+                if flushed < options['batch_size']:
+                    break
+
+            stats = buffer_stats()
+            self.stdout.write(self.style.SUCCESS(
+                f'{total} events in {len(batches)} batches, '
+                f'{stats["pending"]} pending, lag {stats["lag_seconds"]:.1f}s'
+            ))
+
+            if not options['interval']:
+                return
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
@@ -0,0 +1,39 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from surgicalm.users.models import PartnerHospitals
+from surgicalm.users.onboarding import import_patient_rows, parse_rows
+
+class Command(BaseCommand):
+    help = 'Bulk-enrolls patients into a hospital from a CSV (username,email,password) or JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='CSV or JSON file')
+        parser.add_argument('--hospital', type=int, required=True, help='PartnerHospitals id')
+        parser.add_argument('--format', choices=['csv', 'json'], default=None, help='Defaults to the file extension')
+        parser.add_argument('--workers', type=int, default=settings.PATIENT_IMPORT_HASH_WORKERS, help='Password hashing processes')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not PartnerHospitals.objects.filter(id=options['hospital']).exists():
+            raise CommandError(f"Hospital {options['hospital']} does not exist.")
+
+        file_format = options['format'] or ('json' if path.suffix.lower() == '.json' else 'csv')
+        try:
+            rows = parse_rows(path.read_bytes(), file_format)
+            result = import_patient_rows(options['hospital'], rows, dry_run=options['dry_run'], workers=options['workers'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if result['errors']:
+            for number, errors in sorted(result['errors'].items()):
+                self.stderr.write(f'Row {number}: {json.dumps(errors)}')
+            raise CommandError(f"{len(result['errors'])} invalid rows; no patients were created.")
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{len(rows)} rows are valid.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Created {len(result['created'])} patients."))
@@ -0,0 +1,175 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from surgicalm.users.authentication import HospitalRefreshToken
+from surgicalm.users.models import CustomUser
+
+SERVERS = {
+    'wsgi': ['surgicalm.backend.wsgi:application'],
+    'asgi': ['-k', 'uvicorn.workers.UvicornWorker', 'surgicalm.backend.asgi:application'],
+}
+
+
+def process_tree_rss(pid):
+    """Resident memory of a process and its children (the gunicorn master and workers), in KiB."""
+    pids = {pid}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                    pids.add(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    total = 0
+    for child in pids:
+        try:
+            with open(f'/proc/{child}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total
+
+
+class RSSSampler(threading.Thread):
+    """Tracks the peak RSS of a server's process tree while a run is in flight."""
+
+    def __init__(self, pid, interval=0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, process_tree_rss(self.pid))
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load tests a patient endpoint at increasing concurrency and reports throughput, latency and server '
+        'memory. Without --url it starts the WSGI and ASGI servers in turn with the same worker count.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', required=True, help='Username of the patient to send requests as')
+        parser.add_argument('--endpoint', default='/users/dashboard/', help='Path to request')
+        parser.add_argument('--method', default='GET', choices=['GET', 'POST'])
+        parser.add_argument('--body', default=None, help='JSON body for POST requests')
+        parser.add_argument('--concurrency', default='10,50,100', help='Comma-separated client concurrency levels')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per concurrency level')
+        parser.add_argument('--workers', type=int, default=2, help='Gunicorn workers for both servers')
+        parser.add_argument('--servers', default='wsgi,asgi', help='Servers to start, from: wsgi, asgi')
+        parser.add_argument('--url', default=None, help='Test an already running server instead')
+        parser.add_argument('--pid', type=int, default=None, help='Server pid for memory sampling with --url')
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options['patient'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No user named {options['patient']}")
+        token = str(HospitalRefreshToken.for_user(user).access_token)
+        levels = [int(level) for level in options['concurrency'].split(',')]
+
+        if options['url']:
+            self.run_levels('server', options['url'], options['pid'], token, levels, options)
+            return
+
+        for name in options['servers'].split(','):
+            if name not in SERVERS:
+                raise CommandError(f'Unknown server {name}')
+            port = free_port()
+            env = {**os.environ, 'ASYNC_VIEWS': str(name == 'asgi').lower(),
+                   'PYTHONPATH': os.pathsep.join(path for path in sys.path if path)}
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '--workers', str(options['workers']),
+                 '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', *SERVERS[name]],
+                env=env,
+            )
+            try:
+                base_url = f'http://127.0.0.1:{port}'
+                self.wait_until_up(base_url, server)
+                self.run_levels(name, base_url, server.pid, token, levels, options)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+    def wait_until_up(self, base_url, server, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'Server exited with code {server.returncode}')
+            try:
+                requests.get(f'{base_url}/users/health-check/', timeout=1)
+                return
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        raise CommandError(f'Server at {base_url} did not start')
+
+    def run_levels(self, name, base_url, pid, token, levels, options):
+        url = f"{base_url}{options['endpoint']}"
+        headers = {'Authorization': f'Bearer {token}'}
+        if options['body']:
+            headers['Content-Type'] = 'application/json'
+        local = threading.local()
+
+        def send(_):
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            start = time.perf_counter()
+            try:
+                response = session.request(options['method'], url, headers=headers, data=options['body'], timeout=60)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            return ok, (time.perf_counter() - start) * 1000
+
+        # Warm up imports and connections in every worker before measuring
+        with ThreadPoolExecutor(max_workers=options['workers'] * 2) as pool:
+            list(pool.map(send, range(options['workers'] * 4)))
+        idle_rss = process_tree_rss(pid) if pid else 0
+
+        for level in levels:
+            sampler = RSSSampler(pid) if pid else None
+            if sampler:
+                sampler.start()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=level) as pool:
+                results = list(pool.map(send, range(options['requests'])))
+            elapsed = time.perf_counter() - start
+            peak_rss = sampler.stop() if sampler else 0
+
+            latencies = sorted(latency for _, latency in results)
+            errors = sum(1 for ok, _ in results if not ok)
+            p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+            self.stdout.write(
+                f'{name} c={level:<4} {len(results) / elapsed:7.1f} req/s  '
+                f'p50 {statistics.median(latencies):7.1f}ms  p95 {p95:7.1f}ms  errors {errors}  '
+                f'rss idle {idle_rss / 1024:.0f}MiB peak {peak_rss / 1024:.0f}MiB'
+            )
@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from surgicalm.users.mail import drain_email_outbox
+
+class Command(BaseCommand):
+    help = 'Sends queued emails from the outbox in batches over one SMTP connection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE, help='Emails claimed per batch')
+        parser.add_argument('--max-messages', type=int, default=None, help='Stop after this many emails per pass')
+        parser.add_argument('--smtp-host', type=str, default=None, help='Send through this SMTP server instead (e.g. a local stand-in)')
+        parser.add_argument('--smtp-port', type=int, default=25, help='Port for --smtp-host')
+        parser.add_argument('--interval', type=float, default=0, help='Keep running, draining every N seconds')
+
+    def handle(self, *args, **options):
+        if options['smtp_host']:
+            smtp = get_connection(
+                'django.core.mail.backends.smtp.EmailBackend', host=options['smtp_host'], port=options['smtp_port'],
+                username='', password='', use_tls=False, use_ssl=False,
+            )
+        else:
+            smtp = get_connection()
+
+        # Held across passes so the worker authenticates once
+        try:
+            while True:
+                started = time.monotonic()
+                stats = drain_email_outbox(options['batch_size'], options['max_messages'], smtp=smtp)
+                self.stdout.write(
+                    f"Sent {stats['sent']}, retried {stats['retried']}, failed {stats['failed']}, "
+                    f"discarded {stats['discarded']}, deferred {stats['deferred']} in {stats['elapsed']:.2f}s; "
+                    f"latency p50 {stats['latency_p50_ms']:.1f} ms, p95 {stats['latency_p95_ms']:.1f} ms."
+                )
+
+                if not options['interval']:
+                    return
+                time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
+        finally:
+            smtp.close()
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from surgicalm.users.outbox import drain_outbox
+
+class Command(BaseCommand):
+    help = 'Delivers queued notification campaigns and reconciles Expo push receipts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=None, help='Maximum messages per second')
+        parser.add_argument('--max-messages', type=int, default=None, help='Stop sending after this many messages per pass')
+        parser.add_argument('--workers', type=int, default=None, help='Batches sent concurrently')
+        parser.add_argument('--push-url', type=str, default=None, help='Override the Expo push endpoint (e.g. a local stub)')
+        parser.add_argument('--interval', type=float, default=0, help='Keep running, draining every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            stats = drain_outbox(
+                max_messages=options['max_messages'], rate=options['rate'],
+                workers=options['workers'], push_url=options['push_url'],
+            )
+            self.stdout.write(
+                f"Queued {stats['queued']}, sent {stats['sent']}, failed {stats['failed']}, "
+                f"unregistered {stats['unregistered']}; receipts: {stats['receipts']}; "
+                f"{stats['campaigns_completed']} campaigns completed."
+            )
+
+            if not options['interval']:
+                return
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
@@ -0,0 +1,76 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+IMPORT_TIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)$')
+
+# What a gunicorn worker does on boot, timed from inside a fresh interpreter. The
+# entrypoint is imported with warm-up off so that it can be timed separately.
+BOOT_SCRIPT = '''
+import json, time
+started = time.perf_counter()
+import {module}
+booted = time.perf_counter()
+from django.apps import apps
+from django.conf import settings
+settings.WARM_UP_ON_START = True
+print(json.dumps({{'boot': booted - started, 'warm_up': apps.get_app_config('users').warm_up()}}))
+'''
+
+
+def parse_import_times(stderr):
+    """Parses `python -X importtime` output into (module, self_us, cumulative_us) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Boots the WSGI or ASGI entrypoint in a fresh interpreter under -X importtime and reports the cold '
+        'start time and the slowest modules to import.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entrypoint', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--top', type=int, default=20, help='Number of modules to list')
+        parser.add_argument('--sort', choices=['self', 'cumulative'], default='cumulative',
+                            help='Rank by time spent in the module alone or including its imports')
+        parser.add_argument('--prefix', default=None, help='Only list modules starting with this prefix')
+
+    def handle(self, *args, **options):
+        env = {**os.environ, 'WARM_UP_ON_START': 'false',
+               'PYTHONPATH': os.pathsep.join(path for path in sys.path if path)}
+        script = BOOT_SCRIPT.format(module=f"surgicalm.backend.{options['entrypoint']}")
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                                env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise CommandError(f'Boot failed:\n{result.stderr[-2000:]}')
+
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        rows = parse_import_times(result.stderr)
+        total_imports = sum(self_us for _, self_us, _ in rows) / 1000
+        warm_up = report['warm_up']
+
+        self.stdout.write(
+            f"cold start {(report['boot'] + sum(warm_up.values())) * 1000:.0f}ms: "
+            f"boot {report['boot'] * 1000:.0f}ms, warm-up {sum(warm_up.values()) * 1000:.0f}ms, "
+            f"{len(rows)} modules imported in {total_imports:.0f}ms"
+        )
+        for step, seconds in warm_up.items():
+            self.stdout.write(f'  warm-up {step:<16} {seconds * 1000:8.1f}ms')
+
+        if options['prefix']:
+            rows = [row for row in rows if row[0].startswith(options['prefix'])]
+        key = 1 if options['sort'] == 'self' else 2
+        self.stdout.write(f"\n{'self ms':>9} {'cumul ms':>9}  module")
+        for module, self_us, cumulative_us in sorted(rows, key=lambda row: row[key], reverse=True)[:options['top']]:
+            self.stdout.write(f'{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {module}')
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from surgicalm.users.token_blacklist import prune_expired_tokens
+
+class Command(BaseCommand):
+    help = 'Deletes expired outstanding and blacklisted refresh tokens in bounded batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.TOKEN_PRUNE_BATCH_SIZE, help='Tokens per transaction')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        deleted, batches = prune_expired_tokens(options['batch_size'], options['max_batches'], options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired tokens in {batches} batches'))
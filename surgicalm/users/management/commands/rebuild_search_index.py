@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from surgicalm.users.search import get_search_backend
+
+class Command(BaseCommand):
+    help = 'Rebuilds the patient search index for one hospital or for all hospitals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospital', type=int, default=None, help='Only rebuild this hospital id')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        indexed = backend.rebuild(hospital_id=options['hospital'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed or 0} patients with {type(backend).__name__}.'))
@@ -1,16 +1,12 @@
 from django.core.management.base import BaseCommand
-from surgicalm.users.models import CustomUser
-from surgicalm.users.tasks import refresh_daily_data_for_user
+from surgicalm.users.scheduling import dispatch_refreshes
 
 class Command(BaseCommand):
-    help = 'Dispatches a Celery task to refresh daily data for all active patients.'
+    help = (
+        "Refreshes daily data for every hospital not yet refreshed on its local date. "
+        "Use `dispatch_scheduled` to refresh each hospital at its own local refresh time instead."
+    )
 
     def handle(self, *args, **options):
-        patients = CustomUser.objects.filter(user_type='patient', is_active=True)
-        self.stdout.write(f'Found {patients.count()} active patients to refresh.')
-
-        for user in patients:
-            refresh_daily_data_for_user.delay(user.id)
-            self.stdout.write(f'Dispatched refresh task for user: {user.id}')
-
-        self.stdout.write(self.style.SUCCESS('All refresh tasks have been dispatched.'))
\ No newline at end of file
+        refreshed = dispatch_refreshes(window=None)
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {refreshed} patients.'))
@@ -1,14 +1,11 @@
-import requests
-from itertools import islice
-from django.core.management.base import BaseCommand
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
 from surgicalm.users.models import PushNotificationToken
-
-EXPO_PUSH_URL = 'https://exp.host/--/api/v2/push/send'
-
-def chunked(iterable, size):
-    it = iter(iterable)
-    while chunk := list(islice(it, size)):
-        yield chunk
+from surgicalm.users.outbox import enqueue_campaign
+from surgicalm.users.push import (
+    EXPO_BATCH_SIZE, ExpoPushClient, build_messages, iter_token_batches, prune_unregistered_tokens,
+)
 
 
 class Command(BaseCommand):
@@ -17,11 +14,37 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--title', type=str, default='Daily Reminder 🚀', help='Notification title')
         parser.add_argument('--body', type=str, default='Time to check your app!', help='Notification body')
+        parser.add_argument('--workers', type=int, default=None, help='Batches sent concurrently')
+        parser.add_argument('--push-url', type=str, default=None, help='Override the Expo push endpoint (e.g. a local stub)')
+        parser.add_argument('--queue', action='store_true', help='Queue a campaign in the outbox instead of sending now')
+        parser.add_argument('--at', type=str, default=None, help='ISO 8601 send time for --queue')
+        parser.add_argument('--audience', type=str, default='all', choices=['all', 'incomplete_today', 'inactive'],
+                            help='Target audience for --queue')
+        parser.add_argument('--hospital', type=int, default=None, help='Limit a queued campaign to one hospital id')
+        parser.add_argument('--inactive-days', type=int, default=None, help='Inactivity window for --audience inactive')
 
     def handle(self, *args, **options):
-        tokens = list(PushNotificationToken.objects.values_list('token', flat=True))
+        if options['queue']:
+            scheduled_at = None
+            if options['at']:
+                scheduled_at = parse_datetime(options['at'])
+                if scheduled_at is None:
+                    raise CommandError(f"Invalid --at value: {options['at']}")
+            try:
+                campaign = enqueue_campaign(
+                    options['title'], options['body'], scheduled_at,
+                    audience=options['audience'], hospital_id=options['hospital'],
+                    inactive_days=options['inactive_days'],
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"✅ Queued campaign {campaign.id} for {campaign.scheduled_at}."))
+            return
+
+        if options['audience'] != 'all' or options['hospital']:
+            raise CommandError("--audience and --hospital require --queue.")
 
-        if not tokens:
+        if not PushNotificationToken.objects.exists():
             self.stdout.write(self.style.WARNING("⚠️ No push tokens found."))
             return
 
@@ -29,35 +52,42 @@ class Command(BaseCommand):
         body = options['body']
         success_count = 0
         fail_count = 0
+        removed_count = 0
+
+        batches = (build_messages(batch, title, body) for batch in iter_token_batches(batch_size=EXPO_BATCH_SIZE))
+        started = time.monotonic()
+
+        with ExpoPushClient(push_url=options['push_url'], max_workers=options['workers']) as client:
+            for result in client.send(batches):
+                if result.error:
+                    fail_count += len(result.messages)
+                    self.stdout.write(self.style.ERROR(f"❌ Failed to send batch: {result.error}"))
+                    continue
+
+                unregistered = []
+                for message, ticket in zip(result.messages, result.tickets):
+                    token = message['to']
+                    if ticket.get('status') == 'ok':
+                        success_count += 1
+                    else:
+                        fail_count += 1
+                        error = ticket.get('message')
+                        self.stdout.write(self.style.WARNING(f"⚠️ Token error [{token}]: {error}"))
+
+                        if ticket.get('details', {}).get('error') == 'DeviceNotRegistered':
+                            unregistered.append(token)
 
-        for batch in chunked(tokens, 100):
-            messages = [{
-                'to': token,
-                'title': title,
-                'body': body,
-                'sound': 'default',
-            } for token in batch]
-
-            response = requests.post(EXPO_PUSH_URL, json=messages, headers={'Content-Type': 'application/json'})
-
-            if response.status_code != 200:
-                self.stdout.write(self.style.ERROR(f"❌ Failed to send batch: {response.text}"))
-                continue
-
-            results = response.json().get('data', [])
-            for i, result in enumerate(results):
-                token = batch[i]
-                if result.get('status') == 'ok':
-                    success_count += 1
-                else:
-                    fail_count += 1
-                    error = result.get('message')
-                    self.stdout.write(self.style.WARNING(f"⚠️ Token error [{token}]: {error}"))
-
-                    if result.get('details', {}).get('error') == 'DeviceNotRegistered':
-                        PushNotificationToken.objects.filter(token=token).delete()
-                        self.stdout.write(self.style.NOTICE(f"Removed unregistered token: {token}"))
+                # One DELETE per batch instead of one per dead token
+                if unregistered:
+                    removed = prune_unregistered_tokens(unregistered)
+                    removed_count += removed
+                    self.stdout.write(self.style.NOTICE(f"Removed {removed} unregistered tokens."))
 
+        elapsed = time.monotonic() - started
+        rate = (success_count + fail_count) / elapsed if elapsed else 0
         self.stdout.write(self.style.SUCCESS(f"✅ {success_count} notifications sent successfully."))
         if fail_count > 0:
-            self.stdout.write(self.style.WARNING(f"⚠️ {fail_count} notifications failed."))
\ No newline at end of file
+            self.stdout.write(self.style.WARNING(f"⚠️ {fail_count} notifications failed."))
+        if removed_count > 0:
+            self.stdout.write(self.style.NOTICE(f"Removed {removed_count} unregistered tokens in total."))
+        self.stdout.write(f"Sent {success_count + fail_count} messages in {elapsed:.2f}s ({rate:.0f} msg/s).")
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-19 14:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0067_assignedmodules_users_assig_patient_c387e6_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=32)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.partnerhospitals')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hospital', 'gram'], name='users_patie_hospita_9e7f97_idx')],
+                'constraints': [models.UniqueConstraint(fields=('patient', 'gram'), name='unique_gram_per_patient')],
+            },
+        ),
+    ]
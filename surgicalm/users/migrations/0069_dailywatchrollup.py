@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 14:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rollups(apps, schema_editor):
+    WatchedData = apps.get_model('users', 'WatchedData')
+    DailyWatchRollup = apps.get_model('users', 'DailyWatchRollup')
+
+    counts = WatchedData.objects.values('user_id', 'date').annotate(count=Count('id')).order_by()
+    DailyWatchRollup.objects.bulk_create(
+        (DailyWatchRollup(user_id=row['user_id'], date=row['date'], count=row['count']) for row in counts.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0068_patientsearchtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyWatchRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='unique_rollup_per_user_day')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
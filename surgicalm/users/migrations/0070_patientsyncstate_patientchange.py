@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-19 14:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0069_dailywatchrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField(default=0)),
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PatientChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('reset', 'Reset'), ('task', 'Task'), ('video', 'Video')], max_length=5)),
+                ('object_id', models.BigIntegerField(blank=True, null=True)),
+                ('isCompleted', models.BooleanField(default=False)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('patient', 'seq'), name='unique_change_seq_per_patient')],
+            },
+        ),
+    ]
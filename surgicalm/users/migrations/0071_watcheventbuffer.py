@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0070_patientsyncstate_patientchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchEventBuffer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patient_id', models.BigIntegerField()),
+                ('module_id', models.BigIntegerField()),
+                ('date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 14:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0071_watcheventbuffer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityDailyAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patient_id', models.BigIntegerField()),
+                ('date', models.DateField()),
+                ('event', models.PositiveSmallIntegerField(choices=[(1, 'Login'), (2, 'Dashboard opened'), (3, 'Task completed'), (4, 'Module completed')])),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('patient_id', 'date', 'event'), name='unique_activity_per_patient_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patient_id', models.BigIntegerField()),
+                ('event', models.PositiveSmallIntegerField(choices=[(1, 'Login'), (2, 'Dashboard opened'), (3, 'Task completed'), (4, 'Module completed')])),
+                ('object_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient_id', 'created_at'], name='users_activ_patient_c8f94c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-19 14:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0073_notificationcampaign_notificationdelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationcampaign',
+            name='hospital',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='users.partnerhospitals'),
+        ),
+        migrations.AddField(
+            model_name='notificationcampaign',
+            name='inactive_days',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationdelivery',
+            name='body',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='notificationcampaign',
+            name='audience',
+            field=models.CharField(choices=[('all', 'All registered devices'), ('incomplete_today', 'Patients with incomplete tasks or modules today'), ('inactive', 'Patients inactive for inactive_days')], default='all', max_length=20),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 14:33
+
+import datetime
+import surgicalm.users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0074_campaign_audience'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='partnerhospitals',
+            name='last_refresh_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='partnerhospitals',
+            name='last_reminder_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='partnerhospitals',
+            name='refresh_time',
+            field=models.TimeField(default=datetime.time(0, 0)),
+        ),
+        migrations.AddField(
+            model_name='partnerhospitals',
+            name='reminder_time',
+            field=models.TimeField(default=datetime.time(9, 0)),
+        ),
+        migrations.AddField(
+            model_name='partnerhospitals',
+            name='time_zone',
+            field=models.CharField(default='America/New_York', max_length=64, validators=[surgicalm.users.models.validate_time_zone]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-19 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0075_partnerhospitals_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('message', 'Message'), ('password_reset', 'Password reset')], default='message', max_length=20)),
+                ('to_email', models.EmailField(max_length=254)),
+                ('subject', models.CharField(blank=True, default='', max_length=255)),
+                ('body', models.TextField(blank=True, default='')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed'), ('discarded', 'Discarded')], default='queued', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='users_outgo_status_f69c3b_idx')],
+            },
+        ),
+    ]
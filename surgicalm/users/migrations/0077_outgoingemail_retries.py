@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-19 14:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0076_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='outgoingemail',
+            name='users_outgo_status_f69c3b_idx',
+        ),
+        migrations.AddField(
+            model_name='outgoingemail',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='outgoingemail',
+            name='error',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='outgoingemail',
+            name='latency_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='outgoingemail',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='outgoingemail',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='outgoingemail',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='users_outgo_status_fd378b_idx'),
+        ),
+    ]
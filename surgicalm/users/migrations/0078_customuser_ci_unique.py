@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-19 14:45
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+import surgicalm.users.models
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicates(apps, schema_editor):
+    # Fail with a readable list instead of a bare IntegrityError
+    CustomUser = apps.get_model('users', 'CustomUser')
+    keys = {
+        'username': django.db.models.functions.text.Lower('username'),
+        'email': django.db.models.functions.comparison.NullIf(
+            django.db.models.functions.text.Lower('email'), django.db.models.expressions.RawSQL("''", ())
+        ),
+    }
+    duplicates = []
+    for field, key in keys.items():
+        rows = (
+            CustomUser.objects.annotate(key=key).exclude(key=None)
+            .values('key').annotate(n=Count('id')).filter(n__gt=1).values_list('key', flat=True)
+        )
+        duplicates += [f"{field}={value}" for value in rows]
+    if duplicates:
+        raise RuntimeError(
+            "Merge or rename accounts that differ only by case before migrating: " + ", ".join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0077_outgoingemail_retries'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='customuser',
+            managers=[
+                ('objects', surgicalm.users.models.CustomUserManager()),
+            ],
+        ),
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='customuser',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('username'), name='users_customuser_username_ci_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='customuser',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.NullIf(django.db.models.functions.text.Lower('email'), django.db.models.expressions.RawSQL("''", ())), name='users_customuser_email_ci_uniq'),
+        ),
+    ]
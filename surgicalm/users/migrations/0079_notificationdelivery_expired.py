@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0078_customuser_ci_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notificationdelivery',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('delivered', 'Delivered'), ('expired', 'No receipt'), ('dead', 'Dead-lettered')], default='queued', max_length=10),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+from surgicalm.users.search import INDEX_BATCH_SIZE, patient_grams
+
+
+def backfill_search_tokens(apps, schema_editor):
+    # NgramIndexBackend is the default search backend, so index the patients
+    # that existed before 0068 rather than waiting for `rebuild_search_index`
+    CustomUser = apps.get_model('users', 'CustomUser')
+    PatientSearchToken = apps.get_model('users', 'PatientSearchToken')
+
+    PatientSearchToken.objects.all().delete()
+    patients = CustomUser.objects.filter(user_type='patient').values_list('id', 'hospital_id', 'username', 'email')
+    batch = []
+    for patient_id, hospital_id, username, email in patients.iterator(chunk_size=INDEX_BATCH_SIZE):
+        batch.extend(
+            PatientSearchToken(hospital_id=hospital_id, patient_id=patient_id, gram=gram, weight=weight)
+            for gram, weight in patient_grams(username, email).items()
+        )
+        if len(batch) >= INDEX_BATCH_SIZE:
+            PatientSearchToken.objects.bulk_create(batch, batch_size=INDEX_BATCH_SIZE)
+            batch = []
+    if batch:
+        PatientSearchToken.objects.bulk_create(batch, batch_size=INDEX_BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0080_create_cache_table'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-19 15:29
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_claimed_campaigns_materialized(apps, schema_editor):
+    # Campaigns already claimed were queued in one go before this migration
+    NotificationCampaign = apps.get_model('users', 'NotificationCampaign')
+    NotificationCampaign.objects.exclude(status='pending').update(materialized_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0081_backfill_patient_search_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationcampaign',
+            name='materialized_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationcampaign',
+            name='materialized_through',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(mark_claimed_campaigns_materialized, migrations.RunPython.noop),
+    ]
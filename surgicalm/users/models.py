@@ -1,16 +1,58 @@
+import datetime
+import zoneinfo
+
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.db.models import Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower, NullIf
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.utils.timezone import now
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 
 
+def validate_time_zone(value):
+    try:
+        zoneinfo.ZoneInfo(value)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(f"{value} is not a valid IANA time zone.")
+
+
 class PartnerHospitals(models.Model):
     hospital_name = models.CharField(max_length=255, unique=True, null=False, blank=False)
+    time_zone = models.CharField(max_length=64, default='America/New_York', validators=[validate_time_zone])
+    # Local times for the daily reminder push and assignment refresh
+    reminder_time = models.TimeField(default=datetime.time(9, 0))
+    refresh_time = models.TimeField(default=datetime.time(0, 0))
+    last_reminder_date = models.DateField(null=True, blank=True)
+    last_refresh_date = models.DateField(null=True, blank=True)
 
     class Meta:
         app_label = 'users'
 
+# Case-insensitive keys backing the unique functional indexes on CustomUser.
+# Blank emails map to NULL so accounts without one don't collide. The '' is
+# inlined rather than a parameter so queries match the index expression text.
+USERNAME_KEY = Lower('username')
+EMAIL_KEY = NullIf(Lower('email'), RawSQL("''", ()))
+
+
+class CustomUserManager(UserManager):
+
+    def with_username(self, username):
+        """Case-insensitive username match that seeks on the LOWER(username) index."""
+        return self.alias(username_key=USERNAME_KEY).filter(username_key=Lower(Value(username)))
+
+    def with_email(self, email):
+        """Case-insensitive email match that seeks on the LOWER(email) index."""
+        return self.alias(email_key=EMAIL_KEY).filter(email_key=Lower(Value(email)))
+
+    def get_by_natural_key(self, username):
+        # Login matches usernames the way the unique index compares them
+        return self.with_username(username).get()
+
+
 class CustomUser(AbstractUser):
     
     USER_TYPE_CHOICES = (
@@ -20,11 +62,17 @@ class CustomUser(AbstractUser):
     
     user_type = models.CharField(max_length = 10, choices = USER_TYPE_CHOICES, null=False, blank=False)
     hospital = models.ForeignKey(PartnerHospitals, on_delete=models.CASCADE, null=False, blank=False)
+
+    objects = CustomUserManager()
     
     class Meta(AbstractUser.Meta):
         indexes = [
             models.Index(fields=['hospital', 'user_type']),
         ]    
+        constraints = [
+            models.UniqueConstraint(USERNAME_KEY, name='users_customuser_username_ci_uniq'),
+            models.UniqueConstraint(EMAIL_KEY, name='users_customuser_email_ci_uniq'),
+        ]
 
 class Quotes(models.Model):
     Quote = models.CharField(max_length=255, null=False, blank=False, unique=True) 
@@ -120,3 +168,196 @@ class PushNotificationToken(models.Model):
 
 
 
+
+class PatientSearchToken(models.Model):
+    hospital = models.ForeignKey(PartnerHospitals, on_delete=models.CASCADE, null=False, blank=False)
+    patient = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=False, blank=False)
+    gram = models.CharField(max_length=32, null=False, blank=False)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'gram'], name='unique_gram_per_patient')
+        ]
+        indexes = [
+            models.Index(fields=['hospital', 'gram']),
+        ]
+
+class DailyWatchRollup(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=False, blank=False)
+    date = models.DateField(null=False, blank=False)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_rollup_per_user_day')
+        ]
+
+class PatientSyncState(models.Model):
+    patient = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
+    seq = models.BigIntegerField(default=0)
+
+class PatientChange(models.Model):
+
+    KIND_CHOICES = (
+        ('reset', 'Reset'),
+        ('task', 'Task'),
+        ('video', 'Video'),
+    )
+
+    patient = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=False, blank=False)
+    seq = models.BigIntegerField(null=False, blank=False)
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES, null=False, blank=False)
+    object_id = models.BigIntegerField(null=True, blank=True)
+    isCompleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'seq'], name='unique_change_seq_per_patient')
+        ]
+
+class WatchEventBuffer(models.Model):
+    # Plain ids rather than foreign keys so appends only touch the primary key
+    patient_id = models.BigIntegerField(null=False, blank=False)
+    module_id = models.BigIntegerField(null=False, blank=False)
+    date = models.DateField(null=False, blank=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class ActivityEvent(models.Model):
+
+    LOGIN = 1
+    DASHBOARD_OPENED = 2
+    TASK_COMPLETED = 3
+    MODULE_COMPLETED = 4
+
+    EVENT_CHOICES = (
+        (LOGIN, 'Login'),
+        (DASHBOARD_OPENED, 'Dashboard opened'),
+        (TASK_COMPLETED, 'Task completed'),
+        (MODULE_COMPLETED, 'Module completed'),
+    )
+
+    # Append-only and narrow: the auto-increment key orders rows by time
+    patient_id = models.BigIntegerField(null=False, blank=False)
+    event = models.PositiveSmallIntegerField(choices=EVENT_CHOICES, null=False, blank=False)
+    object_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(default=now, null=False, blank=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient_id', 'created_at']),
+        ]
+
+class ActivityDailyAggregate(models.Model):
+    patient_id = models.BigIntegerField(null=False, blank=False)
+    date = models.DateField(null=False, blank=False)
+    event = models.PositiveSmallIntegerField(choices=ActivityEvent.EVENT_CHOICES, null=False, blank=False)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient_id', 'date', 'event'], name='unique_activity_per_patient_day')
+        ]
+
+class NotificationCampaign(models.Model):
+
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('cancelled', 'Cancelled'),
+    )
+
+    AUDIENCE_CHOICES = (
+        ('all', 'All registered devices'),
+        ('incomplete_today', "Patients with incomplete tasks or modules today"),
+        ('inactive', 'Patients inactive for inactive_days'),
+    )
+
+    title = models.CharField(max_length=255, null=False, blank=False)
+    # May contain {username}, {remaining_tasks} and {remaining_modules}
+    body = models.TextField(null=False, blank=False)
+    audience = models.CharField(max_length=20, choices=AUDIENCE_CHOICES, default='all')
+    hospital = models.ForeignKey(PartnerHospitals, on_delete=models.CASCADE, null=True, blank=True)
+    inactive_days = models.PositiveSmallIntegerField(null=True, blank=True)
+    scheduled_at = models.DateTimeField(default=now)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    # Deliveries are queued in chunks; the last push token id queued so far,
+    # and when the whole audience had been queued
+    materialized_through = models.BigIntegerField(default=0)
+    materialized_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'scheduled_at']),
+        ]
+
+class NotificationDelivery(models.Model):
+
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('delivered', 'Delivered'),
+        ('expired', 'No receipt'),
+        ('dead', 'Dead-lettered'),
+    )
+
+    campaign = models.ForeignKey(NotificationCampaign, on_delete=models.CASCADE, related_name='deliveries')
+    patient = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    token = models.CharField(max_length=255, null=False, blank=False)
+    body = models.TextField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    ticket_id = models.CharField(max_length=64, null=True, blank=True)
+    error = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['campaign', 'status']),
+        ]
+
+
+class OutgoingEmail(models.Model):
+    """Email queued by a request and sent later by `manage.py process_email_outbox`."""
+
+    KIND_CHOICES = (
+        ('message', 'Message'),
+        # Rendered at send time, so the request never looks the account up
+        ('password_reset', 'Password reset'),
+    )
+
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('discarded', 'Discarded'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='message')
+    to_email = models.EmailField(null=False, blank=False)
+    subject = models.CharField(max_length=255, blank=True, default='')
+    body = models.TextField(blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    error = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now)
+    # Time spent in the SMTP exchange for the successful attempt
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} to {self.to_email} ({self.status})"
@@ -0,0 +1,114 @@
+import base64
+import json
+import logging
+import re
+import threading
+import time
+
+import requests
+import rsa
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = {'accounts.google.com', 'https://accounts.google.com'}
+DEFAULT_CACHE_SECONDS = 3600
+MIN_REFRESH_INTERVAL = 60
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+def _b64_int(value):
+    return int.from_bytes(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)), 'big')
+
+
+def _token_key_id(token):
+    header = token.split('.', 1)[0]
+    return json.loads(base64.urlsafe_b64decode(header + '=' * (-len(header) % 4))).get('kid')
+
+
+class JWKSCache:
+    """
+    Keeps a JWKS document in memory, as PEM public keys by key id, for as long
+    as its Cache-Control max-age allows. Fetched over one pooled session.
+    """
+
+    def __init__(self, url, session=None):
+        self.url = url
+        self.session = session or requests.Session()
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+
+    def _fetch(self):
+        response = self.session.get(self.url, timeout=5)
+        response.raise_for_status()
+
+        keys = {}
+        for key in response.json().get('keys', []):
+            if key.get('kty') != 'RSA':
+                continue
+            public_key = rsa.PublicKey(_b64_int(key['n']), _b64_int(key['e']))
+            keys[key['kid']] = public_key.save_pkcs1(format='PEM')
+
+        match = MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+        max_age = int(match.group(1)) if match else DEFAULT_CACHE_SECONDS
+        max_age -= int(response.headers.get('Age', 0) or 0)
+
+        now = time.monotonic()
+        self._keys = keys
+        self._fetched_at = now
+        self._expires_at = now + max(max_age, 0)
+        logger.info("[OIDC] Fetched %s signing keys, cached for %ss", len(keys), max_age)
+
+    def get_keys(self, force=False):
+        """Returns {kid: PEM}. `force` refetches unless we fetched very recently."""
+        now = time.monotonic()
+        if now < self._expires_at and not (force and now - self._fetched_at > MIN_REFRESH_INTERVAL):
+            return self._keys
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._expires_at or (force and now - self._fetched_at > MIN_REFRESH_INTERVAL):
+                self._fetch()
+        return self._keys
+
+
+class GoogleIdTokenVerifier:
+    """Verifies a Google-signed ID token once against a set of allowed audiences."""
+
+    def __init__(self, jwks_url, audiences):
+        self.jwks = JWKSCache(jwks_url)
+        self.audiences = list(audiences)
+
+    def verify(self, token):
+        """Returns the verified claims or raises ValueError."""
+        # Deferred: google.auth pulls in its crypto backends, and only the cron endpoints verify tokens
+        from google.auth import jwt
+
+        keys = self.jwks.get_keys()
+        if _token_key_id(token) not in keys:
+            # Google rotated its keys since we cached them
+            keys = self.jwks.get_keys(force=True)
+
+        claims = jwt.decode(token, certs=keys, audience=self.audiences)
+        if claims.get('iss') not in GOOGLE_ISSUERS:
+            raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+        return claims
+
+
+_verifier = None
+
+
+def get_verifier():
+    """Process-wide verifier so the key cache survives between requests."""
+    global _verifier
+    if _verifier is None:
+        audiences = [
+            settings.BASE_URL,  # https://api.surgicalm.com
+            "https://api.surgicalm.com",  # Explicit
+            "api.surgicalm.com",  # Without https
+            settings.CLOUD_RUN_URL,  # Cloud Run URL for scheduler
+        ]
+        # Filter out empty values
+        _verifier = GoogleIdTokenVerifier(settings.GOOGLE_OIDC_JWKS_URL, [aud for aud in audiences if aud])
+    return _verifier
@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+
+from .autocomplete import invalidate_hospital
+from .models import EMAIL_KEY, USERNAME_KEY, CustomUser
+from .search import get_search_backend
+from .serializers import PatientImportRowSerializer
+from .services import refresh_users_data
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FIELDS = ('username', 'email', 'password')
+INSERT_BATCH_SIZE = 500
+
+
+def parse_rows(content, format):
+    """
+    Parses an import into a list of row dicts. CSV needs a header row with
+    username, email and password; JSON is a list of objects or {"patients": [...]}.
+    Raises ValueError for anything else.
+    """
+    if format == 'json':
+        data = json.loads(content) if isinstance(content, (str, bytes)) else content
+        if isinstance(data, dict):
+            data = data.get('patients')
+        if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+            raise ValueError("JSON must be a list of patient objects.")
+        return data
+
+    if format == 'csv':
+        if isinstance(content, bytes):
+            content = content.decode('utf-8-sig')
+        reader = csv.DictReader(io.StringIO(content))
+        missing = set(IMPORT_FIELDS) - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"CSV is missing columns: {', '.join(sorted(missing))}.")
+        return [dict(row) for row in reader]
+
+    raise ValueError("format must be 'csv' or 'json'.")
+
+
+def validate_rows(rows):
+    """
+    Validates every row, then checks uniqueness for the whole batch: within the
+    file, and against existing accounts with one IN query per key. Returns
+    (valid, errors) where valid is [(row number, attrs)] and errors is {row number: errors}.
+    """
+    valid = []
+    errors = {}
+    for number, row in enumerate(rows, start=1):
+        serializer = PatientImportRowSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((number, serializer.validated_data))
+        else:
+            errors[number] = serializer.errors
+
+    for field, key in (('username', USERNAME_KEY), ('email', EMAIL_KEY)):
+        first_seen = {}
+        for number, attrs in valid:
+            value = attrs[field].lower()
+            if value in first_seen:
+                errors.setdefault(number, {})[field] = [f"Duplicate of row {first_seen[value]}."]
+            else:
+                first_seen[value] = number
+
+        taken = set(
+            CustomUser.objects.annotate(key=key).filter(key__in=list(first_seen)).values_list('key', flat=True)
+        )
+        for number, attrs in valid:
+            if attrs[field].lower() in taken:
+                errors.setdefault(number, {})[field] = [f"An account with this {field} already exists."]
+
+    return [(number, attrs) for number, attrs in valid if number not in errors], dict(sorted(errors.items()))
+
+
+def hash_passwords(passwords, workers=None):
+    """
+    Hashes passwords across a process pool; the hasher is CPU-bound and holds
+    the GIL. Workers are spawned rather than forked: this runs inside web
+    requests, where the server process has threads and open database and
+    cache sockets that a forked child would inherit.
+    """
+    workers = min(workers or settings.PATIENT_IMPORT_HASH_WORKERS, len(passwords))
+    if workers <= 1:
+        return [make_password(password) for password in passwords]
+    # Spawned workers start without Django configured. The initializer is
+    # django.setup itself: unpickling a function from this module would import
+    # the models before the app registry is ready
+    spawn = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=spawn, initializer=django.setup) as pool:
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def import_patient_rows(hospital_id, rows, dry_run=False, workers=None):
+    """
+    Creates patients for `rows` under `hospital_id`, all or nothing. Returns
+    {'created': [ids], 'errors': {row number: errors}}; nothing is created when
+    there are errors or `dry_run` is set.
+    """
+    if len(rows) > settings.PATIENT_IMPORT_MAX_ROWS:
+        raise ValueError(f"Imports are limited to {settings.PATIENT_IMPORT_MAX_ROWS} rows.")
+
+    started = time.monotonic()
+    valid, errors = validate_rows(rows)
+    if errors or dry_run or not valid:
+        return {'created': [], 'errors': errors}
+
+    hashes = hash_passwords([attrs['password'] for _, attrs in valid], workers)
+    hashed_at = time.monotonic()
+
+    users = [
+        CustomUser(
+            username=attrs['username'], email=attrs['email'], password=password,
+            user_type='patient', hospital_id=hospital_id,
+        )
+        for (_, attrs), password in zip(valid, hashes)
+    ]
+    try:
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(users, batch_size=INSERT_BATCH_SIZE)
+            # bulk_create doesn't return ids on MySQL, so read them back
+            created = list(
+                CustomUser.objects.filter(hospital_id=hospital_id, username__in=[user.username for user in users])
+                .only('id', 'username', 'email', 'user_type', 'hospital_id')
+            )
+            refresh_users_data(hospital_id, [user.id for user in created])
+            # bulk_create skips the post_save signals that keep search in step
+            get_search_backend().index_patients(created)
+    except IntegrityError:
+        raise ValueError("Another request created one of these accounts during the import; please retry.")
+    invalidate_hospital(hospital_id)
+
+    logger.info(
+        "Imported %s patients into hospital %s (validation and hashing %.2fs, total %.2fs)",
+        len(created), hospital_id, hashed_at - started, time.monotonic() - started,
+    )
+    return {'created': sorted(user.id for user in created), 'errors': {}}
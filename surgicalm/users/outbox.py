@@ -0,0 +1,264 @@
+import logging
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .campaigns import AUDIENCE_BATCH_SIZE, audience_batch, template_fields
+from .models import NotificationCampaign, NotificationDelivery
+from .push import (
+    EXPO_BATCH_SIZE, EXPO_RECEIPT_BATCH_SIZE, ExpoPushClient, prune_unregistered_tokens,
+)
+
+logger = logging.getLogger(__name__)
+
+STALE_SENDING_AFTER = timezone.timedelta(minutes=10)
+
+
+def enqueue_campaign(title, body, scheduled_at=None, **audience):
+    """
+    Queues a campaign for the outbox worker; returns immediately. `audience`
+    takes audience/hospital_id/inactive_days as on NotificationCampaign.
+    """
+    template_fields(body)
+    return NotificationCampaign.objects.create(
+        title=title, body=body, scheduled_at=scheduled_at or timezone.now(), **audience
+    )
+
+
+def materialize_due_campaigns(batch_size=AUDIENCE_BATCH_SIZE):
+    """
+    Creates one queued delivery per token for every campaign that is due,
+    one short transaction per audience chunk. The campaign's high-water mark
+    moves with each chunk, so a run that dies part way is resumed by the
+    next one instead of starting over.
+    """
+    created = 0
+    due = NotificationCampaign.objects.filter(
+        Q(status='pending', scheduled_at__lte=timezone.now()) | Q(status='sending', materialized_at=None)
+    )
+    for campaign in due:
+        started = time.monotonic()
+        # Claim the campaign so a second worker skips it
+        if campaign.status == 'pending':
+            claimed = NotificationCampaign.objects.filter(id=campaign.id, status='pending').update(status='sending')
+            if not claimed:
+                continue
+        while True:
+            with transaction.atomic():
+                # The campaign row serializes workers on this campaign; deliveries are never locked here
+                through = (
+                    NotificationCampaign.objects.select_for_update()
+                    .filter(id=campaign.id, materialized_at=None)
+                    .values_list('materialized_through', flat=True).first()
+                )
+                if through is None:
+                    break
+                last_id, rows = audience_batch(campaign, through, batch_size)
+                if not rows:
+                    NotificationCampaign.objects.filter(id=campaign.id).update(materialized_at=timezone.now())
+                    break
+                NotificationDelivery.objects.bulk_create([
+                    NotificationDelivery(campaign=campaign, token=token, patient_id=patient_id, body=body)
+                    for token, patient_id, body in rows
+                ])
+                NotificationCampaign.objects.filter(id=campaign.id).update(materialized_through=last_id)
+                created += len(rows)
+        logger.info("Queued campaign %s in %.2fs", campaign.id, time.monotonic() - started)
+    return created
+
+
+def _claim_deliveries(limit):
+    now = timezone.now()
+
+    # Recover rows left in flight by a worker that died mid-send
+    NotificationDelivery.objects.filter(status='sending', updated_at__lt=now - STALE_SENDING_AFTER).update(
+        status='queued', updated_at=now
+    )
+
+    with transaction.atomic():
+        queryset = NotificationDelivery.objects.filter(
+            status='queued', next_attempt_at__lte=now
+        ).order_by('next_attempt_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Lock only the delivery rows; locking the joined campaign too would
+            # make every worker wait on the one row they all share
+            of = ('self',) if connection.features.has_select_for_update_of else ()
+            queryset = queryset.select_for_update(skip_locked=True, of=of)
+        deliveries = list(queryset.select_related('campaign')[:limit])
+        NotificationDelivery.objects.filter(id__in=[d.id for d in deliveries]).update(status='sending', updated_at=now)
+    return deliveries
+
+
+def _retry_or_dead_letter(deliveries, errors):
+    """Requeues failed deliveries with backoff, dead-lettering those out of attempts."""
+    now = timezone.now()
+    by_attempts = defaultdict(list)
+    for delivery in deliveries:
+        by_attempts[delivery.attempts + 1].append(delivery.id)
+
+    dead = 0
+    for attempts, ids in by_attempts.items():
+        if attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+            NotificationDelivery.objects.filter(id__in=ids).update(
+                status='dead', attempts=attempts, error=errors[:255], updated_at=now
+            )
+            dead += len(ids)
+        else:
+            delay = settings.NOTIFICATION_RETRY_DELAY * (2 ** (attempts - 1))
+            NotificationDelivery.objects.filter(id__in=ids).update(
+                status='queued', attempts=attempts, error=errors[:255], updated_at=now,
+                next_attempt_at=now + timezone.timedelta(seconds=delay),
+            )
+    return dead
+
+
+def _apply_outcomes(outcomes):
+    """
+    Writes push results back in a handful of set-based UPDATEs.
+    `outcomes` is a list of (delivery, ticket or receipt) pairs.
+    """
+    now = timezone.now()
+    sent = []
+    unregistered = []
+    failed = defaultdict(list)
+
+    for delivery, outcome in outcomes:
+        if outcome.get('status') == 'ok':
+            delivery.status, delivery.ticket_id, delivery.error, delivery.updated_at = 'sent', outcome.get('id'), None, now
+            sent.append(delivery)
+        elif outcome.get('details', {}).get('error') == 'DeviceNotRegistered':
+            unregistered.append(delivery)
+        else:
+            failed[outcome.get('message') or 'Unknown error'].append(delivery)
+
+    # Ticket ids differ per row, so this is a single CASE-based UPDATE
+    NotificationDelivery.objects.bulk_update(sent, ['status', 'ticket_id', 'error', 'updated_at'], batch_size=EXPO_BATCH_SIZE)
+    if unregistered:
+        NotificationDelivery.objects.filter(id__in=[d.id for d in unregistered]).update(
+            status='dead', error='DeviceNotRegistered', updated_at=now
+        )
+        prune_unregistered_tokens([d.token for d in unregistered])
+    for error, deliveries in failed.items():
+        _retry_or_dead_letter(deliveries, error)
+
+    return len(sent), len(unregistered), sum(len(d) for d in failed.values())
+
+
+def send_queued(client, max_messages=None, rate=None):
+    """
+    Sends queued deliveries in batches, at most `rate` messages per second.
+    Returns a stats dict.
+    """
+    stats = {'sent': 0, 'unregistered': 0, 'failed': 0}
+    claim_size = EXPO_BATCH_SIZE * client.max_workers
+    started = time.monotonic()
+    processed = 0
+
+    while max_messages is None or processed < max_messages:
+        limit = claim_size if max_messages is None else min(claim_size, max_messages - processed)
+        deliveries = _claim_deliveries(limit)
+        if not deliveries:
+            break
+        processed += len(deliveries)
+
+        # Results come back with the same message lists, so map them back by identity
+        chunks = {}
+        for start in range(0, len(deliveries), EXPO_BATCH_SIZE):
+            chunk = deliveries[start:start + EXPO_BATCH_SIZE]
+            messages = [{
+                'to': d.token,
+                'title': d.campaign.title,
+                'body': d.body or d.campaign.body,
+                'sound': 'default',
+            } for d in chunk]
+            chunks[id(messages)] = (messages, chunk)
+
+        for result in client.send(messages for messages, _ in list(chunks.values())):
+            chunk = chunks[id(result.messages)][1]
+            if result.error:
+                _retry_or_dead_letter(chunk, result.error)
+                stats['failed'] += len(chunk)
+                continue
+            sent, unregistered, failed = _apply_outcomes(list(zip(chunk, result.tickets)))
+            stats['sent'] += sent
+            stats['unregistered'] += unregistered
+            stats['failed'] += failed
+
+        # Stay under the configured delivery rate
+        if rate:
+            ahead = processed / rate - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    return stats
+
+
+def reconcile_receipts(client):
+    """
+    Fetches Expo receipts for sent tickets old enough to have one and records
+    delivered / dead / retry. Tickets still without a receipt after
+    NOTIFICATION_RECEIPT_EXPIRY are marked expired and no longer polled.
+    Returns a stats dict.
+    """
+    now = timezone.now()
+    expired = NotificationDelivery.objects.filter(
+        status='sent', updated_at__lte=now - timezone.timedelta(seconds=settings.NOTIFICATION_RECEIPT_EXPIRY)
+    ).update(status='expired', error='No receipt', updated_at=now)
+    stats = {'delivered': 0, 'unregistered': 0, 'failed': 0, 'expired': expired}
+    cutoff = now - timezone.timedelta(seconds=settings.NOTIFICATION_RECEIPT_DELAY)
+    last_id = 0
+
+    while True:
+        deliveries = list(
+            NotificationDelivery.objects.filter(status='sent', updated_at__lte=cutoff, id__gt=last_id)
+            .exclude(ticket_id=None).order_by('id')[:EXPO_RECEIPT_BATCH_SIZE]
+        )
+        if not deliveries:
+            break
+        last_id = deliveries[-1].id
+
+        receipts = client.get_receipts([d.ticket_id for d in deliveries])
+        delivered = [d.id for d in deliveries if receipts.get(d.ticket_id, {}).get('status') == 'ok']
+        if delivered:
+            NotificationDelivery.objects.filter(id__in=delivered).update(status='delivered', updated_at=timezone.now())
+            stats['delivered'] += len(delivered)
+
+        errors = [
+            (d, receipts[d.ticket_id])
+            for d in deliveries
+            if d.ticket_id in receipts and receipts[d.ticket_id].get('status') != 'ok'
+        ]
+        if errors:
+            _, unregistered, failed = _apply_outcomes(errors)
+            stats['unregistered'] += unregistered
+            stats['failed'] += failed
+
+    return stats
+
+
+def complete_finished_campaigns():
+    """
+    Marks fully materialized campaigns with nothing left queued, in flight or
+    awaiting receipts as sent.
+    """
+    completed = 0
+    finished = NotificationCampaign.objects.filter(status='sending').exclude(materialized_at=None)
+    for campaign_id in finished.values_list('id', flat=True):
+        active = NotificationDelivery.objects.filter(campaign_id=campaign_id, status__in=['queued', 'sending', 'sent'])
+        if not active.exists():
+            completed += NotificationCampaign.objects.filter(id=campaign_id).update(status='sent', completed_at=timezone.now())
+    return completed
+
+
+def drain_outbox(max_messages=None, rate=None, workers=None, push_url=None):
+    """One pass of the outbox worker."""
+    materialized = materialize_due_campaigns()
+    with ExpoPushClient(push_url=push_url, max_workers=workers) as client:
+        sent = send_queued(client, max_messages=max_messages, rate=rate)
+        receipts = reconcile_receipts(client)
+    completed = complete_finished_campaigns()
+    return {'queued': materialized, **sent, 'receipts': receipts, 'campaigns_completed': completed}
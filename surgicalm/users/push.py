@@ -0,0 +1,158 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .models import PushNotificationToken
+
+logger = logging.getLogger(__name__)
+
+EXPO_BATCH_SIZE = 100
+EXPO_RECEIPT_BATCH_SIZE = 1000
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class PushBatchResult:
+    """Outcome of one batch: per-message tickets, or an error for the whole batch."""
+
+    def __init__(self, messages, tickets=None, error=None, attempts=1):
+        self.messages = messages
+        self.tickets = tickets or []
+        self.error = error
+        self.attempts = attempts
+
+
+class ExpoPushClient:
+    """
+    Sends Expo push batches concurrently over one pooled keep-alive session.
+    Parallelism is bounded by `max_workers`; each batch is retried with
+    exponential backoff on request errors, timeouts, 429 and 5xx.
+    """
+
+    def __init__(self, push_url=None, max_workers=None, timeout=None, max_retries=None, backoff=None):
+        self.push_url = push_url or settings.EXPO_PUSH_URL
+        self.max_workers = max_workers or settings.EXPO_PUSH_MAX_WORKERS
+        self.timeout = timeout or settings.EXPO_PUSH_TIMEOUT
+        self.max_retries = settings.EXPO_PUSH_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = settings.EXPO_PUSH_BACKOFF if backoff is None else backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+        })
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _post(self, url, payload):
+        """
+        Posts JSON with retries. Returns (data, error, attempts); request and
+        decoding failures come back as `error` rather than raising.
+        """
+        error = None
+        for attempt in range(1, self.max_retries + 2):
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+                if response.status_code == 200:
+                    return response.json()['data'], None, attempt
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code not in RETRY_STATUS_CODES:
+                    break
+            except (ValueError, KeyError, TypeError) as e:
+                # Expo accepted the request, so resending could deliver it twice
+                error = f"Invalid response: {e}"
+                break
+            except requests.RequestException as e:
+                error = str(e)
+
+            if attempt <= self.max_retries:
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+
+        return None, error, attempt
+
+    def send_batch(self, messages):
+        """Posts one batch (at most 100 messages), retrying transient failures."""
+        tickets, error, attempts = self._post(self.push_url, messages)
+        if error:
+            logger.warning("Push batch of %s failed after %s attempts: %s", len(messages), attempts, error)
+            return PushBatchResult(messages, error=error, attempts=attempts)
+        return PushBatchResult(messages, tickets=tickets or [], attempts=attempts)
+
+    def get_receipts(self, ticket_ids):
+        """
+        Fetches receipts for up to 1000 ticket ids. Returns {ticket_id: receipt};
+        tickets Expo has no receipt for yet are missing from the result.
+        """
+        receipts, error, attempts = self._post(settings.EXPO_RECEIPTS_URL, {'ids': list(ticket_ids)})
+        if error:
+            logger.warning("Receipt lookup for %s tickets failed after %s attempts: %s", len(ticket_ids), attempts, error)
+            return {}
+        return receipts or {}
+
+    def send(self, batches):
+        """
+        Sends every batch with at most `max_workers` in flight and yields a
+        PushBatchResult for each as it completes.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = set()
+            for batch in batches:
+                pending.add(executor.submit(self.send_batch, batch))
+                # Keep the queue short so a large generator isn't read up front
+                if len(pending) >= self.max_workers * 2:
+                    done = next(as_completed(pending))
+                    pending.remove(done)
+                    yield done.result()
+            for future in as_completed(pending):
+                yield future.result()
+
+
+def build_messages(tokens, title, body):
+    return [{
+        'to': token,
+        'title': title,
+        'body': body,
+        'sound': 'default',
+    } for token in tokens]
+
+
+def iter_token_rows(queryset=None, batch_size=EXPO_BATCH_SIZE):
+    """
+    Streams (token, patient_id) pairs in primary-key order, one keyset-paginated
+    query per batch, so memory stays bounded and deleting rows mid-run is safe.
+    """
+    queryset = PushNotificationToken.objects.all() if queryset is None else queryset
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', 'token', 'patient_id')[:batch_size])
+        if not rows:
+            return
+        yield [(token, patient_id) for _, token, patient_id in rows]
+        last_id = rows[-1][0]
+
+
+def iter_token_batches(queryset=None, batch_size=EXPO_BATCH_SIZE):
+    for rows in iter_token_rows(queryset, batch_size):
+        yield [token for token, _ in rows]
+
+
+def prune_unregistered_tokens(tokens):
+    """Deletes all of the given tokens with a single DELETE."""
+    if not tokens:
+        return 0
+    deleted, _ = PushNotificationToken.objects.filter(token__in=tokens).delete()
+    return deleted
@@ -0,0 +1,119 @@
+import logging
+import zoneinfo
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from surgicalm.backend.routers import replica_reads
+
+from .models import CustomUser, PartnerHospitals
+from .outbox import drain_outbox, enqueue_campaign
+from .services import refresh_users_data
+
+logger = logging.getLogger(__name__)
+
+# Patients refreshed per transaction
+REFRESH_BATCH_SIZE = 500
+
+SCHEDULES = {
+    'reminder': ('reminder_time', 'last_reminder_date'),
+    'refresh': ('refresh_time', 'last_refresh_date'),
+}
+
+
+def due_buckets(kind, now=None, window=timedelta(hours=1)):
+    """
+    Groups hospitals whose local `kind` time has passed today, by no more than
+    `window`, and that have not run yet today. With window=None every hospital
+    that hasn't run today is due, whatever its local time.
+    Returns {(tz, local time): [(hospital, local date)]}.
+    """
+    time_field, last_field = SCHEDULES[kind]
+    now = now or timezone.now()
+    buckets = defaultdict(list)
+
+    for hospital in PartnerHospitals.objects.only('id', 'time_zone', time_field, last_field):
+        local_now = now.astimezone(zoneinfo.ZoneInfo(hospital.time_zone))
+        local_date = local_now.date()
+        scheduled = datetime.combine(local_date, getattr(hospital, time_field), tzinfo=local_now.tzinfo)
+        if getattr(hospital, last_field) == local_date:
+            continue
+        if window is None or scheduled <= local_now < scheduled + window:
+            buckets[(hospital.time_zone, getattr(hospital, time_field))].append((hospital, local_date))
+    return buckets
+
+
+def _claim(hospital, kind, local_date):
+    """Records today's run so overlapping dispatchers don't repeat it."""
+    _, last_field = SCHEDULES[kind]
+    return PartnerHospitals.objects.filter(id=hospital.id).exclude(
+        **{last_field: local_date}
+    ).update(**{last_field: local_date})
+
+
+def _release(hospital, kind, local_date):
+    """Undoes _claim after a failed run so the next dispatch retries it."""
+    _, last_field = SCHEDULES[kind]
+    PartnerHospitals.objects.filter(id=hospital.id, **{last_field: local_date}).update(
+        **{last_field: getattr(hospital, last_field)}
+    )
+
+
+def dispatch_reminders(now=None, window=timedelta(hours=1), **drain_options):
+    """
+    Queues the daily reminder for every hospital in a due bucket, then drains
+    the outbox once so each bucket goes out in a single sweep.
+    """
+    queued = 0
+    for (tz, local_time), hospitals in due_buckets('reminder', now, window).items():
+        for hospital, local_date in hospitals:
+            if _claim(hospital, 'reminder', local_date):
+                enqueue_campaign(
+                    settings.DAILY_REMINDER_TITLE, settings.DAILY_REMINDER_BODY,
+                    audience='incomplete_today', hospital_id=hospital.id,
+                )
+                queued += 1
+        logger.info("Reminder bucket %s %s: %s hospitals", tz, local_time, len(hospitals))
+
+    if not queued:
+        return None
+    return drain_outbox(**drain_options)
+
+
+def dispatch_refreshes(now=None, window=timedelta(hours=1), batch_size=REFRESH_BATCH_SIZE):
+    """
+    Refreshes daily assignments for the patients of every hospital in a due
+    bucket, set-based in batches of `batch_size` patients per transaction.
+    Patients already refreshed since local midnight are skipped, and a
+    hospital with a failed batch is released so the next dispatch finishes it.
+    """
+    refreshed = 0
+    for (tz, local_time), hospitals in due_buckets('refresh', now, window).items():
+        for hospital, local_date in hospitals:
+            if not _claim(hospital, 'refresh', local_date):
+                continue
+            day_start = datetime.combine(local_date, time.min, tzinfo=zoneinfo.ZoneInfo(tz))
+            # The patient list is a bulk read; each batch is written on the primary
+            with replica_reads():
+                patient_ids = list(
+                    CustomUser.objects.filter(user_type='patient', hospital=hospital, is_active=True)
+                    .exclude(uservideorefresh__last_refreshed__gte=day_start)
+                    .order_by('id').values_list('id', flat=True)
+                )
+            failed = False
+            for start in range(0, len(patient_ids), batch_size):
+                batch = patient_ids[start:start + batch_size]
+                try:
+                    with transaction.atomic():
+                        refresh_users_data(hospital.id, batch)
+                    refreshed += len(batch)
+                except Exception as e:
+                    failed = True
+                    logger.error(f"Failed to refresh data for {len(batch)} patients of hospital {hospital.id}: {e}")
+            if failed:
+                _release(hospital, 'refresh', local_date)
+        logger.info("Refresh bucket %s %s: %s hospitals", tz, local_time, len(hospitals))
+    return refreshed
@@ -0,0 +1,163 @@
+import logging
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import CustomUser, PatientSearchToken
+
+logger = logging.getLogger(__name__)
+
+TERM_RE = re.compile(r'[a-z0-9]+')
+MAX_GRAM_LENGTH = 32
+INDEX_BATCH_SIZE = 1000
+
+# Row weights for the n-gram backend, highest wins when a gram appears twice
+USERNAME_EXACT = 4
+USERNAME_PREFIX = 3
+EMAIL_EXACT = 2
+EMAIL_PREFIX = 1
+
+
+def split_terms(text):
+    """Lowercases text and splits it into alphanumeric search terms."""
+    return [term[:MAX_GRAM_LENGTH] for term in TERM_RE.findall((text or '').lower())]
+
+
+def patient_grams(username, email):
+    """Returns {gram: weight} for every prefix of the username and email terms."""
+    grams = {}
+    for text, exact, prefix in ((username, USERNAME_EXACT, USERNAME_PREFIX), (email, EMAIL_EXACT, EMAIL_PREFIX)):
+        for term in split_terms(text):
+            for length in range(1, len(term) + 1):
+                weight = exact if length == len(term) else prefix
+                grams[term[:length]] = max(grams.get(term[:length], 0), weight)
+    return grams
+
+
+class SearchBackend:
+    """Interface for hospital-scoped patient search backends."""
+
+    def search(self, hospital_id, query, limit):
+        """Returns up to `limit` patient ids matching `query`, best match first."""
+        raise NotImplementedError
+
+    def index_patient(self, patient):
+        """Adds or refreshes a single patient in the index."""
+
+    def rebuild(self, hospital_id=None):
+        """Rebuilds the index for one hospital, or all hospitals if none is given."""
+
+    def index_patients(self, patients):
+        """Indexes many patients at once, e.g. after a bulk_create that skipped signals."""
+        for patient in patients:
+            self.index_patient(patient)
+
+
+class MySQLFulltextBackend(SearchBackend):
+    """
+    Uses the FULLTEXT index from migration 0067. MySQL only, and subject to
+    InnoDB's minimum token size, so short fragments may not match.
+    """
+
+    def search(self, hospital_id, query, limit):
+        # We add a '+' to each word to make it a boolean search for all terms.
+        terms = [f'+{term}' for term in query.split()]
+        if not terms:
+            return []
+        terms[-1] += '*'  # Add the wildcard to the last term
+        boolean_search_query = ' '.join(terms)
+
+        match = "MATCH(username, email) AGAINST(%s IN BOOLEAN MODE)"
+        return list(
+            CustomUser.objects.filter(user_type='patient', hospital_id=hospital_id)
+            .annotate(score=RawSQL(match, [boolean_search_query]))
+            .filter(score__gt=0)
+            .order_by('-score', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+
+
+class NgramIndexBackend(SearchBackend):
+    """
+    Prefix n-gram table that works on any database. Every prefix of every
+    username/email term is stored once per patient, so a query is an indexed
+    IN lookup on (hospital, gram) grouped by patient.
+    """
+
+    def search(self, hospital_id, query, limit):
+        terms = set(split_terms(query))
+        if not terms:
+            return []
+
+        # Every term has to match (same semantics as the '+term' boolean search)
+        rows = (
+            PatientSearchToken.objects.filter(hospital_id=hospital_id, gram__in=terms)
+            .values('patient_id')
+            .annotate(matched=Count('gram'), score=Sum('weight'))
+            .filter(matched=len(terms))
+            .order_by('-score', 'patient_id')[:limit]
+        )
+        return [row['patient_id'] for row in rows]
+
+    def build_tokens(self, patient):
+        return [
+            PatientSearchToken(hospital_id=patient.hospital_id, patient_id=patient.id, gram=gram, weight=weight)
+            for gram, weight in patient_grams(patient.username, patient.email).items()
+        ]
+
+    def index_patient(self, patient):
+        with transaction.atomic():
+            PatientSearchToken.objects.filter(patient_id=patient.id).delete()
+            if patient.user_type == 'patient':
+                PatientSearchToken.objects.bulk_create(self.build_tokens(patient))
+
+    def index_patients(self, patients):
+        patients = [patient for patient in patients if patient.user_type == 'patient']
+        tokens = [token for patient in patients for token in self.build_tokens(patient)]
+        with transaction.atomic():
+            PatientSearchToken.objects.filter(patient_id__in=[patient.id for patient in patients]).delete()
+            PatientSearchToken.objects.bulk_create(tokens, batch_size=INDEX_BATCH_SIZE)
+
+    def rebuild(self, hospital_id=None):
+        tokens = PatientSearchToken.objects.all()
+        patients = CustomUser.objects.filter(user_type='patient')
+        if hospital_id is not None:
+            tokens = tokens.filter(hospital_id=hospital_id)
+            patients = patients.filter(hospital_id=hospital_id)
+
+        indexed = 0
+        with transaction.atomic():
+            tokens.delete()
+            batch = []
+            for patient in patients.only('id', 'username', 'email', 'hospital_id', 'user_type').iterator(chunk_size=INDEX_BATCH_SIZE):
+                batch.extend(self.build_tokens(patient))
+                indexed += 1
+                if len(batch) >= INDEX_BATCH_SIZE:
+                    PatientSearchToken.objects.bulk_create(batch, batch_size=INDEX_BATCH_SIZE)
+                    batch = []
+            if batch:
+                PatientSearchToken.objects.bulk_create(batch, batch_size=INDEX_BATCH_SIZE)
+
+        logger.info("Rebuilt patient search index for %s patients (hospital=%s)", indexed, hospital_id)
+        return indexed
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Returns the backend configured by PATIENT_SEARCH_BACKEND."""
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.PATIENT_SEARCH_BACKEND)()
+    return _backend
+
+
+def search_patient_ids(hospital_id, query, limit=None):
+    max_results = settings.PATIENT_SEARCH_MAX_RESULTS
+    limit = max_results if limit is None else max(1, min(limit, max_results))
+    return get_search_backend().search(hospital_id, query, limit)
@@ -1,13 +1,30 @@
 # serializers.py
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from django.contrib.auth.password_validation import validate_password
+from django.db import IntegrityError, transaction
 from surgicalm.users.models import CustomUser, PartnerHospitals, AssignedModules, AssignedTask, AssignedQuote, ModuleCategories, ModuleSubcategories, TaskList
+from surgicalm.users.authentication import HospitalRefreshToken
+
+def save_new_user(user):
+    """Inserts a new user, reporting a lost race on the case-insensitive unique indexes as a validation error."""
+    try:
+        with transaction.atomic():
+            user.save()
+    except IntegrityError:
+        raise serializers.ValidationError({"username": "An account with this username or email already exists."})
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser  
         fields = ['id', 'username', 'email']
 
+class HospitalTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = HospitalRefreshToken
+
+class HospitalTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = HospitalRefreshToken
+
 class DevSerializer(serializers.Serializer):
     dev_key = serializers.CharField()
 
@@ -21,6 +38,9 @@ class PatientRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
     password2 = serializers.CharField(write_only=True, required=True)
 
+    # Bulk imports check existing accounts for the whole batch instead
+    check_existing = True
+
     class Meta:
         model = CustomUser  
         fields = ('email', 'username', 'password', 'password2')
@@ -33,7 +53,7 @@ class PatientRegistrationSerializer(serializers.ModelSerializer):
         password2 = attrs.get('password2')
 
         # Validate email (case-insensitive)
-        if CustomUser.objects.filter(email__iexact=email).exists():
+        if self.check_existing and CustomUser.objects.with_email(email).exists():
             raise serializers.ValidationError({"email": "An account with this email already exists."})
 
         # Validate username
@@ -44,7 +64,7 @@ class PatientRegistrationSerializer(serializers.ModelSerializer):
         if not username.isalnum():
             raise serializers.ValidationError({"username": "Username must contain only letters and numbers."})
         # Case-insensitive username check
-        if CustomUser.objects.filter(username__iexact=username).exists():
+        if self.check_existing and CustomUser.objects.with_username(username).exists():
             raise serializers.ValidationError({"username": "This username is already taken. Please choose a different one."})
 
         # Validate password
@@ -69,16 +89,26 @@ class PatientRegistrationSerializer(serializers.ModelSerializer):
         """Create a new patient user."""
         validated_data.pop('password2')  
 
-        user = CustomUser.objects.create(
+        user = CustomUser(
             username=validated_data['username'],
             email=validated_data['email'],
             user_type='patient',
-            hospital=self.context['hospital']
+            hospital_id=self.context['hospital_id']
         )
         user.set_password(validated_data['password'])
-        user.save()
+        save_new_user(user)
         return user
 
+class PatientImportRowSerializer(PatientRegistrationSerializer):
+    """One row of a bulk patient import; password2 defaults to password."""
+    password2 = serializers.CharField(write_only=True, required=False)
+    check_existing = False
+
+    def to_internal_value(self, data):
+        if 'password2' not in data and 'password' in data:
+            data = {**data, 'password2': data['password']}
+        return super().to_internal_value(data)
+
 class NurseRegistrationSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(required=True)
     username = serializers.CharField(required=True)
@@ -98,6 +128,11 @@ class NurseRegistrationSerializer(serializers.ModelSerializer):
         if not PartnerHospitals.objects.filter(id=attrs['hospital_id']).exists():
             raise serializers.ValidationError({"hospital_id": "Selected hospital does not exist."})
 
+        if CustomUser.objects.with_email(attrs['email']).exists():
+            raise serializers.ValidationError({"email": "An account with this email already exists."})
+        if CustomUser.objects.with_username(attrs['username']).exists():
+            raise serializers.ValidationError({"username": "This username is already taken."})
+
         return attrs
 
     def create(self, validated_data):
@@ -105,7 +140,7 @@ class NurseRegistrationSerializer(serializers.ModelSerializer):
         validated_data.pop('password2')  
         hospital = PartnerHospitals.objects.get(id=validated_data.pop('hospital_id'))  
 
-        user = CustomUser.objects.create(
+        user = CustomUser(
             username=validated_data['username'],
             email=validated_data['email'],
             user_type='nurse',
@@ -113,7 +148,7 @@ class NurseRegistrationSerializer(serializers.ModelSerializer):
         )
 
         user.set_password(validated_data['password']) 
-        user.save()
+        save_new_user(user)
         return user
     
 class PatientLoginSerializer(serializers.Serializer):
@@ -161,3 +196,21 @@ class AssignedQuoteSerializer(serializers.ModelSerializer):
         model = AssignedQuote
         # Exposing the original model id and the renamed quote_text field
         fields = ['id', 'quote_text']
+
+class BatchCompletionSerializer(serializers.Serializer):
+    tasks = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=100)
+    videos = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=100)
+
+    def validate(self, attrs):
+        if not attrs.get('tasks') and not attrs.get('videos'):
+            raise serializers.ValidationError("Provide at least one task or video id.")
+        return attrs
+
+class SyncEventSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=['task', 'video'])
+    id = serializers.IntegerField(min_value=1)
+    completedAt = serializers.DateTimeField()
+
+class SyncSerializer(serializers.Serializer):
+    cursor = serializers.IntegerField(min_value=0, default=0)
+    events = SyncEventSerializer(many=True, required=False, max_length=200)
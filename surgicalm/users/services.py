@@ -1,16 +1,32 @@
 import logging
+import operator
 from django.db import models
 from django.utils import timezone
-from django.db.models import Count
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Value, When
 from django.db.models.functions import TruncDate
-from random import randint
+from datetime import date as date_cls, datetime, time
+from collections import defaultdict
+from functools import reduce
+from random import choice, randint
 
 logger = logging.getLogger(__name__)
 from .models import (
     AssignedModules, AssignedTask, AssignedQuote, 
     DailyModuleCategories, ModulesList, TaskList, 
-    Quotes, UserVideoRefresh, WatchedData
+    Quotes, UserVideoRefresh, WatchedData, CustomUser, DailyWatchRollup,
+    WatchEventBuffer, ActivityEvent
 )
+from .sync import record_changes, record_resets
+from .activity import log_activity, log_activities
+
+WEEKDAY_LABELS = ['mon', 'tues', 'wed', 'thur', 'fri', 'sat', 'sun']
+ROSTER_CACHE_TIMEOUT = 30
+TIME_SERIES_BUCKETS = ('day', 'week', 'month')
+TIME_SERIES_MAX_DAYS = 3 * 366
+TIME_SERIES_MAX_POINTS = 366
 
 
 def refresh_user_data(user):
@@ -62,21 +78,77 @@ def refresh_user_data(user):
     # Step 6: Update Refresh Date
     user_refresh = UserVideoRefresh.objects.filter(patient=user).first()
     if user_refresh:
-        user_refresh.last_refreshed = timezone.now().date()
+        user_refresh.last_refreshed = timezone.now()
         user_refresh.save()
     else:
-        UserVideoRefresh.objects.create(patient=user, last_refreshed=timezone.now().date())
+        UserVideoRefresh.objects.create(patient=user, last_refreshed=timezone.now())
 
+    # Step 7: Tell syncing clients to replace their assignments
+    record_changes(user.id, [('reset', None, False)])
 
-def calculate_weekly_watched_data(user):
-    """Helper function to calculate weekly watched data for a user."""
+
+def refresh_users_data(hospital_id, user_ids):
+    """
+    Set-based refresh_user_data for many patients of one hospital: the same
+    random daily assignments, from a fixed number of queries and one bulk
+    insert per table however many patients there are.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+
+    # Step 1: Delete Existing Entries
+    AssignedModules.objects.filter(patient_id__in=user_ids).delete()
+    AssignedTask.objects.filter(patient_id__in=user_ids).delete()
+    AssignedQuote.objects.filter(patient_id__in=user_ids).delete()
+
+    # Step 2: Candidate videos per selected (category, subcategory)
+    selected = list(DailyModuleCategories.objects.filter(hospital_id=hospital_id).values_list('category', 'subcategory'))
+    candidates = defaultdict(list)
+    videos = ModulesList.objects.filter(hospital_id=hospital_id).values_list('id', 'category_id', 'subcategory_id')
+    for video_id, category, subcategory in videos:
+        candidates[(category, subcategory)].append(video_id)
+
+    task_ids = list(TaskList.objects.filter(hospital_id=hospital_id).values_list('id', flat=True))
+    quote_ids = list(Quotes.objects.values_list('id', flat=True))
+
+    # Step 3: Assign videos, tasks and a quote to every patient
+    modules, tasks, quotes = [], [], []
+    for user_id in user_ids:
+        for key in selected:
+            if candidates[key]:
+                modules.append(AssignedModules(patient_id=user_id, video_id=choice(candidates[key]), isCompleted=False))
+        tasks.extend(AssignedTask(patient_id=user_id, task_id=task_id, isCompleted=False) for task_id in task_ids)
+        if quote_ids:
+            quotes.append(AssignedQuote(patient_id=user_id, quote_id=choice(quote_ids)))
+    AssignedModules.objects.bulk_create(modules)
+    AssignedTask.objects.bulk_create(tasks)
+    AssignedQuote.objects.bulk_create(quotes)
+
+    # Step 4: Update Refresh Dates
+    now = timezone.now()
+    refreshed = set(UserVideoRefresh.objects.filter(patient_id__in=user_ids).values_list('patient_id', flat=True))
+    UserVideoRefresh.objects.filter(patient_id__in=refreshed).update(last_refreshed=now)
+    UserVideoRefresh.objects.bulk_create([
+        UserVideoRefresh(patient_id=user_id, last_refreshed=now) for user_id in user_ids if user_id not in refreshed
+    ])
+
+    # Step 5: Tell syncing clients to replace their assignments
+    record_resets(user_ids)
+    logger.info("Assigned %s modules, %s tasks and %s quotes to %s patients", len(modules), len(tasks), len(quotes), len(user_ids))
+
+
+def _weekly_watched_querysets(user):
     today = timezone.now().date()
     start_of_week = today - timezone.timedelta(days=today.weekday())
 
     watched_entries = WatchedData.objects.filter(user=user, date__gte=start_of_week)
     counts_by_day = watched_entries.annotate(day=TruncDate('date')).values('day').annotate(count=Count('id'))
+    return counts_by_day, WatchedData.objects.filter(user=user)
+
 
-    day_map = {i: day for i, day in enumerate(['mon', 'tues', 'wed', 'thur', 'fri', 'sat', 'sun'])}
+def _weekly_watched_data(counts_by_day, all_time):
+    day_map = {i: day for i, day in enumerate(WEEKDAY_LABELS)}
     week_data = {day: 0 for day in day_map.values()}
 
     for entry in counts_by_day:
@@ -86,5 +158,310 @@ def calculate_weekly_watched_data(user):
             week_data[day_label] = entry['count']
 
     week_data['week'] = sum(week_data.values())
-    week_data['all_time'] = WatchedData.objects.filter(user=user).count()
-    return week_data 
\ No newline at end of file
+    week_data['all_time'] = all_time
+    return week_data
+
+
+def calculate_weekly_watched_data(user):
+    """Helper function to calculate weekly watched data for a user."""
+    counts_by_day, all_watched = _weekly_watched_querysets(user)
+    return _weekly_watched_data(counts_by_day, all_watched.count())
+
+
+async def acalculate_weekly_watched_data(user):
+    """calculate_weekly_watched_data() for async views."""
+    counts_by_day, all_watched = _weekly_watched_querysets(user)
+    return _weekly_watched_data([entry async for entry in counts_by_day], await all_watched.acount())
+
+
+def build_patient_roster(hospital_id, cursor=0, limit=50):
+    """
+    Weekly watch stats and today's completion for a page of a hospital's patients.
+    Runs a fixed number of grouped queries per page, keyed on patient id.
+    """
+    today = timezone.now().date()
+    cache_key = f'patient-roster:{hospital_id}:{today}:{cursor}:{limit}'
+    roster = cache.get(cache_key)
+    if roster is not None:
+        return roster
+
+    start_of_week = today - timezone.timedelta(days=today.weekday())
+
+    # Step 1: Keyset page of patients (one extra row tells us if there is a next page)
+    patients = list(
+        CustomUser.objects.filter(user_type='patient', hospital_id=hospital_id, id__gt=cursor)
+        .order_by('id')
+        .values('id', 'username', 'email')[:limit + 1]
+    )
+    next_cursor = patients[limit - 1]['id'] if len(patients) > limit else None
+    patients = patients[:limit]
+    patient_ids = [patient['id'] for patient in patients]
+
+    # Step 2: Grouped watch counts for this week and all time
+    week_counts = (
+        WatchedData.objects.filter(user_id__in=patient_ids, date__gte=start_of_week)
+        .values('user_id', 'date').annotate(count=Count('id'))
+    )
+    all_time_counts = dict(
+        WatchedData.objects.filter(user_id__in=patient_ids)
+        .values('user_id').annotate(count=Count('id')).values_list('user_id', 'count')
+    )
+
+    # Step 3: Grouped completion counts for today's assignments
+    completion = Count('id', filter=Q(isCompleted=True))
+    task_counts = {
+        row['patient_id']: row for row in AssignedTask.objects.filter(patient_id__in=patient_ids)
+        .values('patient_id').annotate(total=Count('id'), completed=completion)
+    }
+    module_counts = {
+        row['patient_id']: row for row in AssignedModules.objects.filter(patient_id__in=patient_ids)
+        .values('patient_id').annotate(total=Count('id'), completed=completion)
+    }
+
+    week_data = {pk: {day: 0 for day in WEEKDAY_LABELS} for pk in patient_ids}
+    for entry in week_counts:
+        week_data[entry['user_id']][WEEKDAY_LABELS[entry['date'].weekday()]] += entry['count']
+
+    results = []
+    for patient in patients:
+        pk = patient['id']
+        week = week_data[pk]
+        week['week'] = sum(week.values())
+        week['all_time'] = all_time_counts.get(pk, 0)
+
+        tasks = task_counts.get(pk, {'total': 0, 'completed': 0})
+        modules = module_counts.get(pk, {'total': 0, 'completed': 0})
+        assigned = tasks['total'] + modules['total']
+        completed = tasks['completed'] + modules['completed']
+
+        results.append({
+            **patient,
+            'weekData': week,
+            'tasks': {'completed': tasks['completed'], 'total': tasks['total']},
+            'modules': {'completed': modules['completed'], 'total': modules['total']},
+            'completionRatio': round(completed / assigned, 3) if assigned else None,
+        })
+
+    roster = {'patients': results, 'nextCursor': next_cursor}
+    cache.set(cache_key, roster, ROSTER_CACHE_TIMEOUT)
+    return roster
+
+
+def bump_watch_rollups(counts):
+    """
+    Adds {(user_id, date): n} to the daily rollups in two statements however
+    many keys there are: an INSERT that skips existing rows creates the missing
+    ones at zero, then one UPDATE adds every count through a CASE.
+    """
+    if not counts:
+        return
+    DailyWatchRollup.objects.bulk_create(
+        [DailyWatchRollup(user_id=user_id, date=day, count=0) for user_id, day in counts],
+        ignore_conflicts=True,
+    )
+    keys = [Q(user_id=user_id, date=day) for user_id, day in counts]
+    DailyWatchRollup.objects.filter(reduce(operator.or_, keys)).update(count=F('count') + Case(
+        *[When(key, then=Value(count)) for key, count in zip(keys, counts.values())],
+        default=Value(0),
+    ))
+
+
+def record_watches(user, video_ids, day=None):
+    """
+    Stores completed videos in WatchedData and the daily rollup in bulk. With
+    WATCH_BUFFER_ENABLED the events are appended to WatchEventBuffer instead
+    and written later by flush_watch_buffer.
+    """
+    if not video_ids:
+        return
+    day = day or timezone.now().date()
+    if settings.WATCH_BUFFER_ENABLED:
+        WatchEventBuffer.objects.bulk_create([
+            WatchEventBuffer(patient_id=user.id, module_id=video_id, date=day) for video_id in video_ids
+        ])
+        return
+    WatchedData.objects.bulk_create([
+        WatchedData(user_id=user.id, video_id=video_id, date=day) for video_id in video_ids
+    ])
+    bump_watch_rollups({(user.id, day): len(video_ids)})
+
+
+def record_watch(user, video_id, day=None):
+    """Stores a completed video in WatchedData and the daily rollup."""
+    record_watches(user, [video_id], day)
+
+
+def complete_video(user, video_id, is_completed):
+    """
+    Sets an assigned video's completion and records the watch when it is
+    completed. Returns False without writing if the video was already
+    completed; raises AssignedModules.DoesNotExist if it isn't assigned.
+    """
+    with transaction.atomic():
+        # The conditional UPDATE both checks and sets completion in one statement
+        updated = AssignedModules.objects.filter(
+            patient=user, video_id=video_id, isCompleted=False
+        ).update(isCompleted=is_completed)
+        if not updated:
+            if not AssignedModules.objects.filter(patient=user, video_id=video_id).exists():
+                raise AssignedModules.DoesNotExist
+            return False
+        record_changes(user.id, [('video', video_id, bool(is_completed))])
+
+        if is_completed:
+            # With WATCH_BUFFER_ENABLED this is one buffer insert; the flush writes the rollup
+            record_watch(user, video_id)
+            log_activity(user.id, ActivityEvent.MODULE_COMPLETED, video_id)
+    return True
+
+
+def complete_assignments(user, task_ids, video_ids, day=None):
+    """
+    Marks a patient's assigned tasks and videos completed with one set-based
+    UPDATE per kind. Returns {'tasks': {id: status}, 'videos': {id: status}}
+    where status is 'completed', 'already_completed' or 'not_found'.
+    """
+    results = {'tasks': {}, 'videos': {}}
+
+    with transaction.atomic():
+        if task_ids:
+            current = dict(
+                AssignedTask.objects.select_for_update()
+                .filter(patient=user, task_id__in=task_ids)
+                .values_list('task_id', 'isCompleted')
+            )
+            AssignedTask.objects.filter(patient=user, task_id__in=task_ids, isCompleted=False).update(isCompleted=True)
+            for task_id in task_ids:
+                if task_id not in current:
+                    results['tasks'][task_id] = 'not_found'
+                else:
+                    results['tasks'][task_id] = 'already_completed' if current[task_id] else 'completed'
+
+        if video_ids:
+            current = dict(
+                AssignedModules.objects.select_for_update()
+                .filter(patient=user, video_id__in=video_ids)
+                .values_list('video_id', 'isCompleted')
+            )
+            pending = [video_id for video_id, completed in current.items() if not completed]
+            if pending:
+                AssignedModules.objects.filter(patient=user, video_id__in=pending).update(isCompleted=True)
+                record_watches(user, pending, day)
+            for video_id in video_ids:
+                if video_id not in current:
+                    results['videos'][video_id] = 'not_found'
+                else:
+                    results['videos'][video_id] = 'already_completed' if current[video_id] else 'completed'
+
+        record_changes(user.id, [
+            (kind[:-1], object_id, True)
+            for kind in ('tasks', 'videos')
+            for object_id, result in results[kind].items() if result == 'completed'
+        ])
+        log_activities(user.id, ActivityEvent.TASK_COMPLETED, [
+            task_id for task_id, result in results['tasks'].items() if result == 'completed'
+        ])
+        log_activities(user.id, ActivityEvent.MODULE_COMPLETED, [
+            video_id for video_id, result in results['videos'].items() if result == 'completed'
+        ])
+
+    return results
+
+
+def record_history(user, task_ids, video_ids, day, tz, completed_at):
+    """
+    Records completions made before the patient's last refresh. The assignment
+    rows they referred to have been replaced since, so only the watch and
+    activity history is written, dated `day` in `tz`. Ids that aren't a task or
+    video of the patient's hospital are reported 'invalid', and ids already
+    logged that day are skipped so a retried upload doesn't count twice.
+    Returns the same shape as complete_assignments, with 'recorded' for
+    written ids.
+    """
+    known_tasks = set(TaskList.objects.filter(hospital_id=user.hospital_id, id__in=task_ids).values_list('id', flat=True))
+    known_videos = set(ModulesList.objects.filter(hospital_id=user.hospital_id, id__in=video_ids).values_list('id', flat=True))
+
+    day_start = datetime.combine(day, time.min, tzinfo=tz)
+    logged = set(
+        ActivityEvent.objects.filter(
+            patient_id=user.id,
+            event__in=[ActivityEvent.TASK_COMPLETED, ActivityEvent.MODULE_COMPLETED],
+            object_id__in=[*known_tasks, *known_videos],
+            created_at__gte=day_start, created_at__lt=day_start + timezone.timedelta(days=1),
+        ).values_list('event', 'object_id')
+    )
+
+    def status(event, object_id, known):
+        if object_id not in known:
+            return 'invalid'
+        return 'already_completed' if (event, object_id) in logged else 'recorded'
+
+    results = {
+        'tasks': {task_id: status(ActivityEvent.TASK_COMPLETED, task_id, known_tasks) for task_id in task_ids},
+        'videos': {video_id: status(ActivityEvent.MODULE_COMPLETED, video_id, known_videos) for video_id in video_ids},
+    }
+    new_tasks = [task_id for task_id, result in results['tasks'].items() if result == 'recorded']
+    new_videos = [video_id for video_id, result in results['videos'].items() if result == 'recorded']
+
+    with transaction.atomic():
+        record_watches(user, new_videos, day)
+        log_activities(user.id, ActivityEvent.TASK_COMPLETED, new_tasks, completed_at)
+        log_activities(user.id, ActivityEvent.MODULE_COMPLETED, new_videos, completed_at)
+    return results
+
+
+def _bucket_index(day, start, bucket):
+    if bucket == 'day':
+        return (day - start).days
+    if bucket == 'week':
+        return (day - start).days // 7
+    return (day.year - start.year) * 12 + day.month - start.month
+
+
+def _bucket_start(index, start, bucket):
+    if bucket == 'day':
+        return start + timezone.timedelta(days=index)
+    if bucket == 'week':
+        return start + timezone.timedelta(weeks=index)
+    month = start.month - 1 + index
+    return date_cls(start.year + month // 12, month % 12 + 1, 1)
+
+
+def watched_time_series(user, start, end, bucket='day'):
+    """
+    Watch counts for `user` between `start` and `end` (inclusive), read from
+    the daily rollups and grouped into day, week (Monday) or month buckets.
+    Raises ValueError for ranges that would not fit a bounded response.
+    """
+    if bucket not in TIME_SERIES_BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(TIME_SERIES_BUCKETS)}.")
+    if start > end:
+        raise ValueError("'from' must not be after 'to'.")
+    if (end - start).days + 1 > TIME_SERIES_MAX_DAYS:
+        raise ValueError(f"Range cannot exceed {TIME_SERIES_MAX_DAYS} days.")
+
+    # Align the first bucket so every bucket covers a whole day/week/month
+    if bucket == 'week':
+        start = start - timezone.timedelta(days=start.weekday())
+    elif bucket == 'month':
+        start = start.replace(day=1)
+
+    size = _bucket_index(end, start, bucket) + 1
+    if size > TIME_SERIES_MAX_POINTS:
+        raise ValueError(f"Too many {bucket} buckets; use a coarser bucket or a shorter range.")
+
+    counts = [0] * size
+    rows = DailyWatchRollup.objects.filter(user=user, date__gte=start, date__lte=end).values_list('date', 'count')
+    for day, count in rows:
+        counts[_bucket_index(day, start, bucket)] += count
+
+    return {
+        'bucket': bucket,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'total': sum(counts),
+        'series': [
+            {'start': _bucket_start(index, start, bucket).isoformat(), 'count': count}
+            for index, count in enumerate(counts)
+        ],
+    }
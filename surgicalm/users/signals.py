@@ -1 +1,56 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 
+from .authentication import clear_inactive, mark_inactive
+from .autocomplete import invalidate_hospital
+from .models import CustomUser
+from .search import get_search_backend
+
+SEARCH_FIELDS = {'username', 'email', 'user_type', 'hospital', 'hospital_id'}
+
+
+@receiver(pre_save, sender=CustomUser)
+def remember_previous_hospital(sender, instance, update_fields=None, **kwargs):
+    """Notes the stored hospital so a patient moved to another one leaves the old hospital's autocomplete."""
+    if instance._state.adding or (update_fields is not None and not {'hospital', 'hospital_id'} & set(update_fields)):
+        return
+    instance._previous_hospital_id = (
+        CustomUser.objects.filter(pk=instance.pk).values_list('hospital_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=CustomUser)
+def reindex_patient_search(sender, instance, created, update_fields=None, **kwargs):
+    """Keeps the patient search index in step with username/email changes."""
+    previous_hospital_id = instance.__dict__.pop('_previous_hospital_id', None)
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    if created and instance.user_type != 'patient':
+        return
+    get_search_backend().index_patient(instance)
+    invalidate_hospital(instance.hospital_id)
+    if previous_hospital_id not in (None, instance.hospital_id):
+        invalidate_hospital(previous_hospital_id)
+
+
+@receiver(post_delete, sender=CustomUser)
+def drop_patient_from_autocomplete(sender, instance, **kwargs):
+    if instance.user_type == 'patient':
+        invalidate_hospital(instance.hospital_id)
+
+
+@receiver(post_save, sender=CustomUser)
+def track_deactivation(sender, instance, created, update_fields=None, **kwargs):
+    """Keeps the inactive flag checked by ClaimsJWTAuthentication in step with is_active."""
+    if update_fields is not None and 'is_active' not in update_fields:
+        return
+    if instance.is_active:
+        if not created:
+            clear_inactive(instance.id)
+    else:
+        mark_inactive(instance.id)
+
+
+@receiver(post_delete, sender=CustomUser)
+def refuse_deleted_user(sender, instance, **kwargs):
+    mark_inactive(instance.id)
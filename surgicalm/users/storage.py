@@ -0,0 +1,54 @@
+import logging
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SIGNED_URL_EXPIRATION = timedelta(minutes=90)
+
+
+def object_path(file_url):
+    """Derives the object path inside the bucket from a module's stored url."""
+    if file_url.startswith('gs://'):
+        return file_url.split('/', 3)[-1] if '/' in file_url else file_url
+    if 'storage.googleapis.com' in file_url or 'storage.cloud.google.com' in file_url:
+        url_parts = file_url.split('/')
+        if len(url_parts) > 4:
+            return '/'.join(url_parts[4:])
+        return url_parts[-1]
+    return file_url.lstrip('/')
+
+
+@lru_cache(maxsize=1)
+def signing_bucket():
+    """
+    Bucket handle on a storage client that impersonates the service account,
+    which gives the Cloud Run credentials signing capabilities. Built once per
+    process; the impersonated credentials refresh themselves. The google
+    client libraries are imported here rather than at module load to keep
+    them out of cold starts.
+    """
+    from google.auth import default, impersonated_credentials
+    from google.cloud import storage
+
+    source_credentials, project_id = default()
+    target_credentials = impersonated_credentials.Credentials(
+        source_credentials=source_credentials,
+        target_principal=settings.SERVICE_ACCOUNT_EMAIL,
+        target_scopes=["https://www.googleapis.com/auth/cloud-platform"],
+    )
+    signing_client = storage.Client(credentials=target_credentials)
+    logger.info("[SIGNED_URL] Initialized impersonated storage client.")
+    return signing_client.bucket(settings.STORAGE_BUCKET_NAME)
+
+
+def generate_signed_url(file_url):
+    """Short-lived v4 GET url for a module's file. Makes a blocking IAM signBlob call."""
+    blob = signing_bucket().blob(object_path(file_url))
+    return blob.generate_signed_url(
+        version="v4",
+        expiration=SIGNED_URL_EXPIRATION,
+        method="GET",
+    )
@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models import F
+
+from surgicalm.backend.routers import pin_to_primary
+
+from .models import PatientChange, PatientSyncState
+
+
+def record_changes(patient_id, changes):
+    """
+    Appends (kind, object_id, isCompleted) changes to the patient's change log
+    and advances their sync sequence. A 'reset' change supersedes everything
+    before it, so older rows are dropped. Replica reads about the patient go
+    to the primary for a short while afterwards.
+
+    The UPDATE reserves the sequence numbers for the whole batch and holds the
+    row lock until commit, so a patient's writers queue up; the new rows are
+    then numbered from it and written with one bulk insert.
+    """
+    if not changes:
+        return
+
+    resets = [index for index, (kind, _, _) in enumerate(changes) if kind == 'reset']
+    skip = resets[-1] if resets else 0
+    with transaction.atomic(savepoint=False):
+        states = PatientSyncState.objects.filter(patient_id=patient_id)
+        if not states.update(seq=F('seq') + len(changes)):
+            PatientSyncState.objects.bulk_create([PatientSyncState(patient_id=patient_id)], ignore_conflicts=True)
+            states.update(seq=F('seq') + len(changes))
+        first_seq = states.values_list('seq', flat=True).get() - len(changes) + 1
+        if resets:
+            PatientChange.objects.filter(patient_id=patient_id).delete()
+        PatientChange.objects.bulk_create([
+            PatientChange(patient_id=patient_id, seq=first_seq + index, kind=kind, object_id=object_id, isCompleted=bool(is_completed))
+            for index, (kind, object_id, is_completed) in enumerate(changes[skip:], start=skip)
+        ])
+    pin_to_primary(patient_id)
+
+
+def record_resets(patient_ids):
+    """record_changes(patient_id, [('reset', None, False)]) for many patients in a few set-based queries."""
+    patient_ids = list(patient_ids)
+    if not patient_ids:
+        return
+
+    with transaction.atomic():
+        PatientSyncState.objects.bulk_create(
+            [PatientSyncState(patient_id=patient_id) for patient_id in patient_ids], ignore_conflicts=True
+        )
+        states = PatientSyncState.objects.filter(patient_id__in=patient_ids)
+        states.update(seq=F('seq') + 1)
+        PatientChange.objects.filter(patient_id__in=patient_ids).delete()
+        PatientChange.objects.bulk_create([
+            PatientChange(patient_id=patient_id, seq=seq, kind='reset', object_id=None, isCompleted=False)
+            for patient_id, seq in states.values_list('patient_id', 'seq')
+        ])
+
+
+def current_seq(patient_id):
+    """Single indexed lookup of the patient's latest sequence number."""
+    return PatientSyncState.objects.filter(patient_id=patient_id).values_list('seq', flat=True).first() or 0
+
+
+def changes_since(patient_id, cursor):
+    """
+    Returns (needs_snapshot, changes) for everything after `cursor`. Changes
+    are collapsed to the latest state per (kind, id).
+    """
+    rows = PatientChange.objects.filter(patient_id=patient_id, seq__gt=cursor).order_by('seq')
+    latest = {}
+    needs_snapshot = cursor == 0
+    for kind, object_id, is_completed in rows.values_list('kind', 'object_id', 'isCompleted'):
+        if kind == 'reset':
+            needs_snapshot = True
+            latest = {}
+            continue
+        latest[(kind, object_id)] = is_completed
+
+    changes = [
+        {'type': kind, 'id': object_id, 'isCompleted': is_completed}
+        for (kind, object_id), is_completed in latest.items()
+    ]
+    return needs_snapshot, changes
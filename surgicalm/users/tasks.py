@@ -1,5 +1,7 @@
 from celery import shared_task
 from .services import refresh_user_data
+from .watch_buffer import flush_watch_buffer
+from .token_blacklist import prune_expired_tokens
 from .models import CustomUser
 import logging
 
@@ -32,4 +34,26 @@ def refresh_daily_data_for_user(user_id):
         error_msg = f"❌ EXCEPTION: Error refreshing user {user_id}: {str(e)}"
         logger.error(error_msg)
         print(error_msg)
-        return error_msg
\ No newline at end of file
+        return error_msg
+
+@shared_task
+def flush_watch_buffer_task(batch_size=1000):
+    """
+    Celery task to flush buffered watch events; schedule it on an interval.
+    """
+    total = 0
+    while True:
+        flushed, lag = flush_watch_buffer(batch_size)
+        total += flushed
+        if flushed < batch_size:
+            break
+    logger.info(f"Flushed {total} buffered watch events")
+    return total
+
+@shared_task
+def prune_expired_tokens_task(batch_size=1000, max_batches=None):
+    """
+    Celery task to delete expired refresh tokens in batches; schedule it daily.
+    """
+    deleted, batches = prune_expired_tokens(batch_size, max_batches)
+    return deleted
@@ -1,3 +1,951 @@
-from django.test import TestCase
+import base64
+import importlib
+import smtplib
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import requests
+import rsa
+from django.apps import apps
+from django.contrib.auth.hashers import check_password
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from google.auth import crypt, jwt
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import TokenError
+
+from surgicalm.backend.routers import REPLICA_ALIAS, pin_to_primary, replica_reads
+from surgicalm.users.activity import _add_to_aggregates, compact_activity_log
+from surgicalm.users.authentication import HospitalRefreshToken, user_from_claims
+from surgicalm.users.autocomplete import autocomplete
+from surgicalm.users.campaigns import audience_batch
+from surgicalm.users.mail import drain_email_outbox, enqueue_email, enqueue_password_reset
+from surgicalm.users.models import (
+    ActivityDailyAggregate, ActivityEvent, AssignedModules, AssignedTask, CustomUser, DailyWatchRollup,
+    ModuleCategories, ModuleSubcategories, ModulesList, NotificationDelivery,
+    OutgoingEmail, PartnerHospitals, PatientChange, PatientSearchToken, PushNotificationToken, TaskList,
+    UserVideoRefresh, WatchedData, WatchEventBuffer,
+)
+from surgicalm.users.oidc import GoogleIdTokenVerifier
+from surgicalm.users.onboarding import hash_passwords
+from surgicalm.users.outbox import (
+    complete_finished_campaigns, enqueue_campaign, materialize_due_campaigns, reconcile_receipts, send_queued,
+)
+from surgicalm.users.push import ExpoPushClient, PushBatchResult
+from surgicalm.users.scheduling import dispatch_refreshes
+from surgicalm.users.search import NgramIndexBackend
+from surgicalm.users.serializers import save_new_user
+from surgicalm.users.services import bump_watch_rollups, complete_video, refresh_users_data, watched_time_series
+from surgicalm.users.sync import changes_since, current_seq, record_changes, record_resets
+from surgicalm.users.token_blacklist import _cache_key, _filter, load_filter
+from surgicalm.users.watch_buffer import flush_watch_buffer
+
+AUDIENCE = 'https://api.example.test'
+PASSWORD = 'Str0ng!pass'
+
+
+def _b64(number):
+    raw = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def make_catalog(hospital, name='Recovery'):
+    """Creates one task and one video for `hospital` and returns them."""
+    category = ModuleCategories.objects.create(category=name, icon='heart', hospital=hospital)
+    subcategory = ModuleSubcategories.objects.create(subcategory=name, category=category, hospital=hospital)
+    video = ModulesList.objects.create(
+        hospital=hospital, category=category, subcategory=subcategory,
+        title=f'{name} video', description='-', url='https://media.example.test/video.mp4',
+    )
+    task = TaskList.objects.create(taskName=f'{name} task', taskDesc='-', hospital=hospital)
+    return task, video
+
+
+class FakeJWKSSession:
+    """Stands in for the requests session, serving `keys` as Google's JWKS endpoint would."""
+
+    def __init__(self, keys, headers=None):
+        self.keys = list(keys)
+        self.headers = headers or {'Cache-Control': 'public, max-age=3600'}
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        response = mock.Mock(headers=self.headers)
+        response.json.return_value = {'keys': list(self.keys)}
+        return response
+
+
+class GoogleIdTokenVerifierTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.signing_keys = {}
+        for kid in ('current', 'rotated'):
+            public_key, private_key = rsa.newkeys(1024)
+            cls.signing_keys[kid] = (
+                {'kty': 'RSA', 'alg': 'RS256', 'use': 'sig', 'kid': kid, 'n': _b64(public_key.n), 'e': _b64(public_key.e)},
+                crypt.RSASigner.from_string(private_key.save_pkcs1().decode(), key_id=kid),
+            )
+
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch('surgicalm.users.oidc.time.monotonic', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def make_verifier(self, kids=('current',), headers=None):
+        verifier = GoogleIdTokenVerifier('https://jwks.example.test', [AUDIENCE])
+        verifier.jwks.session = FakeJWKSSession([self.signing_keys[kid][0] for kid in kids], headers)
+        return verifier
+
+    def make_token(self, kid='current', **claims):
+        issued_at = int(time.time())
+        payload = {
+            'iss': 'https://accounts.google.com', 'aud': AUDIENCE, 'email': 'scheduler@example.test',
+            'iat': issued_at, 'exp': issued_at + 300, **claims,
+        }
+        return jwt.encode(self.signing_keys[kid][1], payload).decode()
+
+    def test_verifies_from_cached_keys(self):
+        verifier = self.make_verifier()
+        for _ in range(3):
+            claims = verifier.verify(self.make_token())
+        self.assertEqual(claims['email'], 'scheduler@example.test')
+        self.assertEqual(verifier.jwks.session.calls, 1)
+
+    def test_keys_cached_for_max_age_less_age(self):
+        verifier = self.make_verifier(headers={'Cache-Control': 'public, max-age=300', 'Age': '100'})
+        verifier.jwks.get_keys()
+        self.now += 199
+        verifier.jwks.get_keys()
+        self.assertEqual(verifier.jwks.session.calls, 1)
+        self.now += 2
+        verifier.jwks.get_keys()
+        self.assertEqual(verifier.jwks.session.calls, 2)
+
+    def test_unknown_kid_forces_a_rate_limited_refetch(self):
+        verifier = self.make_verifier()
+        verifier.verify(self.make_token())
+        # Google rotates in a key we haven't cached yet
+        verifier.jwks.session.keys.append(self.signing_keys['rotated'][0])
+        rotated_token = self.make_token(kid='rotated')
+
+        self.now += 30
+        with self.assertRaises(ValueError):
+            verifier.verify(rotated_token)
+        self.assertEqual(verifier.jwks.session.calls, 1)
+
+        self.now += 31
+        self.assertEqual(verifier.verify(rotated_token)['email'], 'scheduler@example.test')
+        self.assertEqual(verifier.jwks.session.calls, 2)
+
+    def test_rejects_wrong_audience(self):
+        with self.assertRaises(ValueError):
+            self.make_verifier().verify(self.make_token(aud='https://elsewhere.example.test'))
+
+    def test_rejects_wrong_issuer(self):
+        with self.assertRaisesMessage(ValueError, 'Wrong issuer'):
+            self.make_verifier().verify(self.make_token(iss='https://issuer.example.test'))
+
+
+class CaseInsensitiveUniquenessTests(TestCase):
+
+    def setUp(self):
+        self.hospital = PartnerHospitals.objects.create(hospital_name='General')
+        self.nurse = CustomUser.objects.create_user(
+            'nurse01', 'nurse@example.test', PASSWORD, user_type='nurse', hospital=self.hospital
+        )
+        self.patient = CustomUser.objects.create_user(
+            'alice01', 'Alice@Example.test', PASSWORD, user_type='patient', hospital=self.hospital
+        )
+        self.client = APIClient()
+
+    def register(self, username, email):
+        self.client.force_authenticate(self.nurse)
+        return self.client.post('/users/patient/register/', {
+            'username': username, 'email': email, 'password': PASSWORD, 'password2': PASSWORD,
+        }, format='json')
+
+    def test_register_rejects_case_variant_username(self):
+        response = self.register('ALICE01', 'new@example.test')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('username', response.json()['errors'])
+
+    def test_register_rejects_case_variant_email(self):
+        response = self.register('bob01', 'alice@EXAMPLE.TEST')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.json()['errors'])
+
+    def test_unique_indexes_reject_case_variants(self):
+        # What a request that lost the race after the serializer check would hit
+        for username, email in (('Alice01', 'other@example.test'), ('carol01', 'ALICE@example.test')):
+            with self.assertRaises(serializers.ValidationError):
+                save_new_user(CustomUser(username=username, email=email, user_type='patient', hospital=self.hospital))
+
+    def test_blank_emails_do_not_collide(self):
+        for username in ('dave01', 'erin01'):
+            save_new_user(CustomUser(username=username, email='', user_type='patient', hospital=self.hospital))
+        self.assertEqual(CustomUser.objects.filter(email='').count(), 2)
+
+    def test_login_with_case_variant_username(self):
+        response = self.client.post('/users/patient/login/', {'username': 'ALICE01', 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+
+    def test_lookups_seek_on_functional_indexes(self):
+        self.assertIn('users_customuser_username_ci_uniq', CustomUser.objects.with_username('ALICE01').explain())
+        self.assertIn('users_customuser_email_ci_uniq', CustomUser.objects.with_email('ALICE@example.test').explain())
+
+    def test_migration_refuses_case_duplicates(self):
+        migration = importlib.import_module('surgicalm.users.migrations.0078_customuser_ci_unique')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX users_customuser_username_ci_uniq')
+            cursor.execute('DROP INDEX users_customuser_email_ci_uniq')
+        CustomUser.objects.create(username='ALICE01', email='alice@example.test', user_type='patient', hospital=self.hospital)
+
+        with self.assertRaisesMessage(RuntimeError, 'username=alice01, email=alice@example.test'):
+            migration.check_duplicates(apps, None)
+
+
+class ReplicaRouterTests(TransactionTestCase):
+    # Not TestCase: its wrapping transaction would keep every read on the primary
+    databases = {'default', REPLICA_ALIAS}
+
+    def setUp(self):
+        cache.clear()
+        self.hospital = PartnerHospitals.objects.create(hospital_name='General')
+        self.nurse = CustomUser.objects.create_user(
+            'nurse01', 'nurse@example.test', PASSWORD, user_type='nurse', hospital=self.hospital
+        )
+        self.patient = CustomUser.objects.create_user(
+            'alice01', 'alice@example.test', PASSWORD, user_type='patient', hospital=self.hospital
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.nurse)
+
+    def user_reads(self, url):
+        """GETs `url` and returns how many users_customuser reads each alias served."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return {
+            alias: sum('FROM "users_customuser"' in query['sql'] for query in queries)
+            for alias, queries in (('default', primary), (REPLICA_ALIAS, replica))
+        }
+
+    def test_replica_view_reads_from_replica(self):
+        reads = self.user_reads(f'/users/patients-list/?query={self.patient.id}&searchBy=id')
+        self.assertEqual(reads, {'default': 0, REPLICA_ALIAS: 1})
+
+    def test_pinned_nurse_reads_from_primary(self):
+        pin_to_primary(self.nurse.id)
+        reads = self.user_reads(f'/users/patients-list/?query={self.patient.id}&searchBy=id')
+        self.assertEqual(reads, {'default': 1, REPLICA_ALIAS: 0})
+
+    def test_pinned_patient_reads_from_primary(self):
+        self.assertEqual(self.user_reads(f'/users/patient-graph/{self.patient.id}/')['default'], 0)
+        # A completion pins the patient so the nurse sees it straight away
+        pin_to_primary(self.patient.id)
+        self.assertEqual(self.user_reads(f'/users/patient-graph/{self.patient.id}/')[REPLICA_ALIAS], 0)
+
+    def test_reads_inside_atomic_stay_on_primary(self):
+        with replica_reads():
+            self.assertEqual(CustomUser.objects.all().db, REPLICA_ALIAS)
+            with transaction.atomic():
+                self.assertEqual(CustomUser.objects.all().db, 'default')
+                with CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica:
+                    self.assertEqual(CustomUser.objects.count(), 2)
+        self.assertEqual(len(replica), 0)
+        self.assertEqual(CustomUser.objects.all().db, 'default')
+
+
+class SyncPatientStateTests(TestCase):
+
+    def setUp(self):
+        self.hospital = PartnerHospitals.objects.create(hospital_name='General', time_zone='UTC')
+        self.patient = CustomUser.objects.create_user(
+            'alice01', 'alice@example.test', PASSWORD, user_type='patient', hospital=self.hospital
+        )
+        self.task, self.video = make_catalog(self.hospital)
+        AssignedTask.objects.create(patient=self.patient, task=self.task)
+        AssignedModules.objects.create(patient=self.patient, video=self.video)
+        self.refreshed_at = timezone.now() - timedelta(hours=1)
+        UserVideoRefresh.objects.create(patient=self.patient)
+        UserVideoRefresh.objects.filter(patient=self.patient).update(last_refreshed=self.refreshed_at)
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def sync(self, *events):
+        response = self.client.post('/users/sync/', {'cursor': 0, 'events': [
+            {'type': kind, 'id': pk, 'completedAt': completed_at.isoformat()} for kind, pk, completed_at in events
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return {(result['type'], result['id']): result['status'] for result in response.json()['results']}
+
+    def test_current_events_complete_assignments(self):
+        now = timezone.now()
+        results = self.sync(('task', self.task.id, now), ('video', self.video.id, now))
+        self.assertEqual(results, {('task', self.task.id): 'completed', ('video', self.video.id): 'completed'})
+        self.assertTrue(AssignedTask.objects.get(patient=self.patient).isCompleted)
+        self.assertEqual(WatchedData.objects.filter(user=self.patient).count(), 1)
+
+    def test_stale_events_only_record_history(self):
+        yesterday = self.refreshed_at - timedelta(days=1)
+        results = self.sync(('task', self.task.id, yesterday), ('video', self.video.id, yesterday))
+        self.assertEqual(results, {('task', self.task.id): 'recorded', ('video', self.video.id): 'recorded'})
+        # Today's assignments share the ids but are left alone
+        self.assertFalse(AssignedTask.objects.get(patient=self.patient).isCompleted)
+        self.assertFalse(AssignedModules.objects.get(patient=self.patient).isCompleted)
+        self.assertEqual(list(WatchedData.objects.values_list('date', flat=True)), [yesterday.date()])
+        self.assertEqual(DailyWatchRollup.objects.get(user=self.patient, date=yesterday.date()).count, 1)
+        self.assertEqual(ActivityEvent.objects.filter(patient_id=self.patient.id).count(), 2)
+
+    def test_retried_stale_upload_is_not_counted_twice(self):
+        yesterday = self.refreshed_at - timedelta(days=1)
+        self.sync(('video', self.video.id, yesterday))
+        results = self.sync(('video', self.video.id, yesterday + timedelta(minutes=5)))
+        self.assertEqual(results, {('video', self.video.id): 'already_completed'})
+        self.assertEqual(WatchedData.objects.filter(user=self.patient).count(), 1)
+        self.assertEqual(DailyWatchRollup.objects.get(user=self.patient).count, 1)
+
+    def test_stale_events_for_other_hospitals_or_missing_ids_are_invalid(self):
+        other_task, other_video = make_catalog(PartnerHospitals.objects.create(hospital_name='Other'), 'Other')
+        yesterday = self.refreshed_at - timedelta(days=1)
+        results = self.sync(
+            ('task', other_task.id, yesterday), ('video', other_video.id, yesterday), ('video', 999999, yesterday),
+        )
+        self.assertEqual(set(results.values()), {'invalid'})
+        self.assertFalse(WatchedData.objects.exists())
+        self.assertFalse(ActivityEvent.objects.exists())
+
+    def test_events_older_than_the_window_are_invalid(self):
+        too_old = timezone.now() - timedelta(days=30)
+        results = self.sync(('task', self.task.id, too_old), ('video', self.video.id, too_old))
+        self.assertEqual(set(results.values()), {'invalid'})
+        self.assertFalse(WatchedData.objects.exists())
+
+
+class SearchIndexBackfillTests(TestCase):
+
+    def test_backfill_indexes_existing_patients(self):
+        hospital = PartnerHospitals.objects.create(hospital_name='General')
+        alice = CustomUser.objects.create_user('alice01', 'alice@example.test', PASSWORD, user_type='patient', hospital=hospital)
+        CustomUser.objects.create_user('nurse01', 'nurse@example.test', PASSWORD, user_type='nurse', hospital=hospital)
+        indexed = sorted(PatientSearchToken.objects.values_list('patient_id', 'gram', 'weight'))
+        # Patients created before 0068 have no tokens
+        PatientSearchToken.objects.all().delete()
+
+        migration = importlib.import_module('surgicalm.users.migrations.0081_backfill_patient_search_tokens')
+        migration.backfill_search_tokens(apps, None)
+
+        self.assertEqual(sorted(PatientSearchToken.objects.values_list('patient_id', 'gram', 'weight')), indexed)
+        self.assertEqual(NgramIndexBackend().search(hospital.id, 'ali', 10), [alice.id])
+
+
+class DispatchRefreshesTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now().replace(hour=12, minute=30)
+        self.hospital = PartnerHospitals.objects.create(hospital_name='General', time_zone='UTC')
+        self.patients = [
+            CustomUser.objects.create_user(f'patient{n}', '', PASSWORD, user_type='patient', hospital=self.hospital)
+            for n in range(3)
+        ]
+        self.task, _ = make_catalog(self.hospital)
+
+    def test_refreshes_hospitals_due_in_the_window(self):
+        PartnerHospitals.objects.create(hospital_name='Later', time_zone='UTC', refresh_time='18:00')
+        self.hospital.refresh_time = '12:00'
+        self.hospital.save()
+        self.assertEqual(dispatch_refreshes(self.now), 3)
+        self.assertEqual(AssignedTask.objects.filter(patient__hospital=self.hospital).count(), 3)
+        # Claimed for the day
+        self.assertEqual(dispatch_refreshes(self.now), 0)
+
+    def test_without_a_window_every_hospital_not_yet_refreshed_today_is_due(self):
+        other = PartnerHospitals.objects.create(hospital_name='Later', time_zone='UTC', refresh_time='18:00')
+        CustomUser.objects.create_user('patient9', '', PASSWORD, user_type='patient', hospital=other)
+        self.assertEqual(dispatch_refreshes(self.now, window=None), 4)
+        self.assertEqual(dispatch_refreshes(self.now, window=None), 0)
+
+    def test_failed_batch_is_retried_by_the_next_dispatch(self):
+        calls = []
+
+        def flaky_refresh(hospital_id, user_ids):
+            calls.append(user_ids)
+            if len(calls) == 2:
+                raise RuntimeError('lock wait timeout')
+            refresh_users_data(hospital_id, user_ids)
+
+        with mock.patch('surgicalm.users.scheduling.refresh_users_data', side_effect=flaky_refresh):
+            self.assertEqual(dispatch_refreshes(self.now, window=None, batch_size=1), 2)
+        self.hospital.refresh_from_db()
+        self.assertIsNone(self.hospital.last_refresh_date)
+
+        # Only the patient whose batch failed is refreshed again
+        self.assertEqual(dispatch_refreshes(self.now, window=None, batch_size=1), 1)
+        self.assertEqual(AssignedTask.objects.count(), 3)
+        self.hospital.refresh_from_db()
+        self.assertEqual(self.hospital.last_refresh_date, self.now.date())
+
+
+class TokenBlacklistTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        hospital = PartnerHospitals.objects.create(hospital_name='General')
+        self.user = CustomUser.objects.create_user('alice01', 'alice@example.test', PASSWORD, user_type='patient', hospital=hospital)
+        self.refresh = HospitalRefreshToken.for_user(self.user)
+        load_filter()
+
+    def blacklist_elsewhere(self, token):
+        """Blacklists `token` as another worker would, leaving this process's filter as it was."""
+        with mock.patch.object(_filter, 'add'), self.captureOnCommitCallbacks(execute=True):
+            token.blacklist()
+
+    def blacklist_queries(self, token):
+        with CaptureQueriesContext(connection) as queries:
+            try:
+                HospitalRefreshToken(token)
+            except TokenError:
+                pass
+        return sum('token_blacklist_blacklistedtoken' in query['sql'] for query in queries)
+
+    def test_rotated_token_is_rejected_after_its_cache_key_is_evicted(self):
+        self.blacklist_elsewhere(self.refresh)
+        cache.delete(_cache_key(self.refresh['jti']))
+
+        with self.assertRaisesMessage(TokenError, 'blacklisted'):
+            HospitalRefreshToken(str(self.refresh))
+
+    def test_rejected_when_the_generation_key_is_evicted_too(self):
+        self.blacklist_elsewhere(self.refresh)
+        cache.clear()
+
+        with self.assertRaisesMessage(TokenError, 'blacklisted'):
+            HospitalRefreshToken(str(self.refresh))
+
+    def test_filter_miss_skips_the_database_until_something_is_blacklisted(self):
+        self.assertEqual(self.blacklist_queries(str(self.refresh)), 0)
+
+        self.blacklist_elsewhere(HospitalRefreshToken.for_user(self.user))
+        self.assertEqual(self.blacklist_queries(str(self.refresh)), 1)
+
+        # A reloaded filter covers everything blacklisted so far again
+        load_filter()
+        self.assertEqual(self.blacklist_queries(str(self.refresh)), 0)
+
+
+class ChangeLogTests(TestCase):
+
+    def setUp(self):
+        hospital = PartnerHospitals.objects.create(hospital_name='General')
+        self.patient = CustomUser.objects.create_user('alice01', 'alice@example.test', PASSWORD, user_type='patient', hospital=hospital)
+
+    def test_changes_are_numbered_from_the_reserved_sequence(self):
+        record_changes(self.patient.id, [('task', 1, True), ('video', 2, True)])
+        record_changes(self.patient.id, [('task', 1, False)])
+        self.assertEqual(current_seq(self.patient.id), 3)
+        self.assertEqual(
+            list(PatientChange.objects.order_by('seq').values_list('seq', 'kind', 'object_id', 'isCompleted')),
+            [(1, 'task', 1, True), (2, 'video', 2, True), (3, 'task', 1, False)],
+        )
+
+    def test_changes_since_collapses_to_the_latest_state(self):
+        record_changes(self.patient.id, [('task', 1, True), ('video', 2, True)])
+        record_changes(self.patient.id, [('task', 1, False)])
+        self.assertEqual(changes_since(self.patient.id, 1), (False, [
+            {'type': 'video', 'id': 2, 'isCompleted': True},
+            {'type': 'task', 'id': 1, 'isCompleted': False},
+        ]))
+        self.assertEqual(changes_since(self.patient.id, 3), (False, []))
+
+    def test_reset_drops_older_changes_and_asks_for_a_snapshot(self):
+        record_changes(self.patient.id, [('task', 1, True)])
+        record_changes(self.patient.id, [('video', 2, True), ('reset', None, False), ('task', 3, True)])
+        self.assertEqual(list(PatientChange.objects.order_by('seq').values_list('seq', 'kind')), [(3, 'reset'), (4, 'task')])
+        self.assertEqual(changes_since(self.patient.id, 1), (True, [{'type': 'task', 'id': 3, 'isCompleted': True}]))
+
+        record_resets([self.patient.id])
+        self.assertEqual(list(PatientChange.objects.values_list('seq', 'kind')), [(5, 'reset')])
+
+
+class ExpoPushClientTests(SimpleTestCase):
+
+    def make_client(self, *responses):
+        """A client whose session.post returns, or raises, each of `responses` in turn."""
+        client = ExpoPushClient(push_url='https://push.example.test', max_workers=2, max_retries=2, backoff=0)
+        client.session.post = mock.Mock(side_effect=list(responses))
+        return client
+
+    def response(self, status_code=200, json=None, text=''):
+        response = mock.Mock(status_code=status_code, text=text)
+        if isinstance(json, Exception):
+            response.json.side_effect = json
+        else:
+            response.json.return_value = json
+        return response
+
+    def test_tickets_from_a_200(self):
+        client = self.make_client(self.response(json={'data': [{'status': 'ok', 'id': 'ticket-1'}]}))
+        result = client.send_batch([{'to': 'ExponentPushToken[a]'}])
+        self.assertIsNone(result.error)
+        self.assertEqual(result.tickets, [{'status': 'ok', 'id': 'ticket-1'}])
+
+    def test_non_json_200_is_a_batch_error_and_not_resent(self):
+        client = self.make_client(self.response(json=requests.JSONDecodeError('Expecting value', '<html>', 0)))
+        result = client.send_batch([{'to': 'ExponentPushToken[a]'}])
+        self.assertIn('Invalid response', result.error)
+        self.assertEqual(client.session.post.call_count, 1)
+
+    def test_other_request_errors_are_retried_then_returned(self):
+        client = self.make_client(
+            requests.exceptions.ChunkedEncodingError('connection broken'),
+            requests.TooManyRedirects('too many redirects'),
+            self.response(json={'data': [{'status': 'ok', 'id': 'ticket-1'}]}),
+        )
+        self.assertIsNone(client.send_batch([{'to': 'ExponentPushToken[a]'}]).error)
+
+        client = self.make_client(*[requests.exceptions.ChunkedEncodingError('connection broken')] * 3)
+        result = client.send_batch([{'to': 'ExponentPushToken[a]'}])
+        self.assertEqual((result.error, result.attempts), ('connection broken', 3))
+
+    def test_one_failing_batch_does_not_stop_the_others(self):
+        client = self.make_client(
+            self.response(json=ValueError('bad json')),
+            self.response(json={'data': [{'status': 'ok', 'id': 'ticket-2'}]}),
+        )
+        client.max_workers = 1
+        results = list(client.send([[{'to': 'ExponentPushToken[a]'}], [{'to': 'ExponentPushToken[b]'}]]))
+        self.assertEqual([bool(result.error) for result in results], [True, False])
+
+
+class ActivityCompactionTests(TestCase):
+
+    def log(self, patient_id, event, days_ago, n=1):
+        created_at = timezone.now() - timedelta(days=days_ago)
+        ActivityEvent.objects.bulk_create([
+            ActivityEvent(patient_id=patient_id, event=event, created_at=created_at) for _ in range(n)
+        ])
+        return timezone.localdate(created_at)
+
+    def aggregates(self):
+        return {
+            (row.patient_id, row.date, row.event): row.count for row in ActivityDailyAggregate.objects.all()
+        }
+
+    def test_old_events_are_rolled_up_and_deleted(self):
+        old_day = self.log(1, ActivityEvent.LOGIN, 40, n=3)
+        self.log(1, ActivityEvent.TASK_COMPLETED, 40)
+        self.log(2, ActivityEvent.LOGIN, 2)
+
+        self.assertEqual(compact_activity_log(retention_days=30, chunk_size=2), 4)
+        self.assertEqual(self.aggregates(), {
+            (1, old_day, ActivityEvent.LOGIN): 3, (1, old_day, ActivityEvent.TASK_COMPLETED): 1,
+        })
+        self.assertEqual(list(ActivityEvent.objects.values_list('patient_id', flat=True)), [2])
+
+    def test_later_runs_add_to_existing_aggregates(self):
+        old_day = self.log(1, ActivityEvent.LOGIN, 40, n=2)
+        compact_activity_log(retention_days=30)
+        self.log(1, ActivityEvent.LOGIN, 40)
+        compact_activity_log(retention_days=30)
+        self.assertEqual(self.aggregates(), {(1, old_day, ActivityEvent.LOGIN): 3})
+
+    def test_increments_happen_in_the_database(self):
+        day = timezone.localdate()
+        _add_to_aggregates({(1, day, ActivityEvent.LOGIN): 2})
+        # A second compaction that read the row before this one wrote would
+        # have overwritten it; adding in SQL keeps both counts
+        _add_to_aggregates({(1, day, ActivityEvent.LOGIN): 5, (2, day, ActivityEvent.LOGIN): 1}, batch_size=1)
+        self.assertEqual(self.aggregates(), {(1, day, ActivityEvent.LOGIN): 7, (2, day, ActivityEvent.LOGIN): 1})
+
+
+class ClaimsAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        hospital = PartnerHospitals.objects.create(hospital_name='General')
+        self.user = CustomUser.objects.create_user('alice01', 'alice@example.test', PASSWORD, user_type='patient', hospital=hospital)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {HospitalRefreshToken.for_user(self.user).access_token}')
+
+    def sync(self):
+        return self.client.post('/users/sync/', {'cursor': 0}, format='json')
+
+    def test_active_user_is_served_without_loading_the_user_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.sync().status_code, 200)
+        self.assertFalse(any('FROM "users_customuser"' in query['sql'] for query in queries))
+
+    def test_deactivated_user_is_refused_until_reactivated(self):
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        response = self.sync()
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'user_inactive')
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.sync().status_code, 200)
+
+    def test_deleted_user_is_refused(self):
+        self.user.delete()
+        self.assertEqual(self.sync().status_code, 401)
+
+    def test_saving_a_claims_user_leaves_is_active_alone(self):
+        self.user.is_active = False
+        self.user.save()
+        user = user_from_claims(HospitalRefreshToken.for_user(self.user).access_token)
+        user.set_password('An0ther!pass')
+        user.save()
+        self.assertFalse(CustomUser.objects.get(id=self.user.id).is_active)
+        self.assertEqual(self.sync().status_code, 401)
+
+
+class FakePushClient:
+    """Answers every message with `ticket(token)`, or fails whole batches containing a token in `failing`."""
+
+    max_workers = 2
+
+    def __init__(self, ticket=None, failing=(), receipts=None):
+        self.ticket = ticket or (lambda token: {'status': 'ok', 'id': f'ticket-{token}'})
+        self.failing = set(failing)
+        self.receipts = receipts or {}
+
+    def send(self, batches):
+        for messages in batches:
+            if self.failing & {message['to'] for message in messages}:
+                yield PushBatchResult(messages, error='HTTP 503: unavailable')
+            else:
+                yield PushBatchResult(messages, tickets=[self.ticket(message['to']) for message in messages])
+
+    def get_receipts(self, ticket_ids):
+        return {ticket_id: self.receipts[ticket_id] for ticket_id in ticket_ids if ticket_id in self.receipts}
+
+
+class NotificationOutboxTests(TestCase):
+
+    def setUp(self):
+        hospital = PartnerHospitals.objects.create(hospital_name='General')
+        self.tokens = []
+        for n in range(5):
+            patient = CustomUser.objects.create_user(f'patient{n}', '', PASSWORD, user_type='patient', hospital=hospital)
+            self.tokens.append(PushNotificationToken.objects.create(token=f'ExponentPushToken[{n}]', patient=patient))
+
+    def test_campaign_is_materialized_in_chunks(self):
+        campaign = enqueue_campaign('Hello', 'Hi {username}')
+        self.assertEqual(materialize_due_campaigns(batch_size=2), 5)
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.materialized_through), ('sending', self.tokens[-1].id))
+        self.assertIsNotNone(campaign.materialized_at)
+        self.assertEqual(
+            sorted(NotificationDelivery.objects.values_list('body', flat=True)), [f'Hi patient{n}' for n in range(5)]
+        )
+        # Nothing left to do on the next pass
+        self.assertEqual(materialize_due_campaigns(batch_size=2), 0)
+
+    def test_interrupted_materialization_resumes_without_duplicates(self):
+        campaign = enqueue_campaign('Hello', 'Time to check your app!')
+        calls = []
+
+        def failing_second_chunk(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('worker killed')
+            return audience_batch(*args)
+
+        with mock.patch('surgicalm.users.outbox.audience_batch', side_effect=failing_second_chunk), \
+                self.assertRaises(RuntimeError):
+            materialize_due_campaigns(batch_size=2)
+        self.assertEqual(NotificationDelivery.objects.count(), 2)
+        # Not complete while part of the audience is still to be queued
+        NotificationDelivery.objects.update(status='delivered')
+        self.assertEqual(complete_finished_campaigns(), 0)
+
+        self.assertEqual(materialize_due_campaigns(batch_size=2), 3)
+        self.assertEqual(
+            sorted(NotificationDelivery.objects.values_list('token', flat=True)), [token.token for token in self.tokens]
+        )
+        campaign.refresh_from_db()
+        self.assertIsNotNone(campaign.materialized_at)
+
+    def test_send_records_tickets_retries_and_unregistered_devices(self):
+        enqueue_campaign('Hello', 'Time to check your app!')
+        materialize_due_campaigns()
+        unregistered = self.tokens[0].token
+
+        def ticket(token):
+            if token == unregistered:
+                return {'status': 'error', 'message': 'not registered', 'details': {'error': 'DeviceNotRegistered'}}
+            return {'status': 'ok', 'id': f'ticket-{token}'}
+
+        stats = send_queued(FakePushClient(ticket))
+        self.assertEqual(stats, {'sent': 4, 'unregistered': 1, 'failed': 0})
+        self.assertEqual(NotificationDelivery.objects.get(token=unregistered).status, 'dead')
+        self.assertFalse(PushNotificationToken.objects.filter(token=unregistered).exists())
+        self.assertEqual(NotificationDelivery.objects.filter(status='sent').exclude(ticket_id=None).count(), 4)
+
+    def test_failed_batch_is_requeued_with_backoff(self):
+        enqueue_campaign('Hello', 'Time to check your app!')
+        materialize_due_campaigns()
+        stats = send_queued(FakePushClient(failing={self.tokens[0].token}))
+        self.assertEqual(stats['failed'] + stats['sent'], 5)
+        retried = NotificationDelivery.objects.filter(status='queued')
+        self.assertEqual(retried.count(), stats['failed'])
+        self.assertTrue(all(d.attempts == 1 and d.next_attempt_at > timezone.now() for d in retried))
+
+    def test_receipts_complete_the_campaign(self):
+        campaign = enqueue_campaign('Hello', 'Time to check your app!')
+        materialize_due_campaigns()
+        send_queued(FakePushClient())
+        # Old enough to have a receipt; the last one never gets one
+        NotificationDelivery.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        NotificationDelivery.objects.filter(token=self.tokens[-1].token).update(
+            updated_at=timezone.now() - timedelta(days=2)
+        )
+        receipts = {f'ticket-{token.token}': {'status': 'ok'} for token in self.tokens[:-1]}
+
+        stats = reconcile_receipts(FakePushClient(receipts=receipts))
+        self.assertEqual((stats['delivered'], stats['expired']), (4, 1))
+        self.assertEqual(complete_finished_campaigns(), 1)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'sent')
+
+
+class HashPasswordsTests(SimpleTestCase):
+
+    def test_hashes_in_spawned_workers(self):
+        passwords = [f'Str0ng!pass{n}' for n in range(4)]
+        with mock.patch('surgicalm.users.onboarding.ProcessPoolExecutor', wraps=ProcessPoolExecutor) as pool:
+            hashes = hash_passwords(passwords, workers=2)
+        self.assertEqual(pool.call_args.kwargs['mp_context'].get_start_method(), 'spawn')
+        self.assertTrue(all(check_password(password, hashed) for password, hashed in zip(passwords, hashes)))
+
+
+class AutocompleteInvalidationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.general = PartnerHospitals.objects.create(hospital_name='General')
+        self.mercy = PartnerHospitals.objects.create(hospital_name='Mercy')
+        self.patient = CustomUser.objects.create_user(
+            'alice01', 'alice@example.test', PASSWORD, user_type='patient', hospital=self.general
+        )
+
+    def usernames(self, nurse_id, hospital, query='ali'):
+        return [row['username'] for row in autocomplete(nurse_id, hospital.id, query, 10)]
+
+    def test_patient_moved_to_another_hospital_leaves_the_old_one(self):
+        self.assertEqual(self.usernames(1, self.general), ['alice01'])
+        self.assertEqual(self.usernames(2, self.mercy), [])
+
+        self.patient.hospital = self.mercy
+        self.patient.save()
+
+        # Both the prefix index and the nurse's cached candidates for the old hospital are dropped
+        self.assertEqual(self.usernames(1, self.general), [])
+        self.assertEqual(self.usernames(1, self.general, 'alice'), [])
+        self.assertEqual(self.usernames(2, self.mercy), ['alice01'])
+
+    def test_new_usernames_show_up(self):
+        self.assertEqual(self.usernames(1, self.general), ['alice01'])
+        self.patient.username = 'alina01'
+        self.patient.save(update_fields=['username'])
+        self.assertEqual(self.usernames(1, self.general), ['alina01'])
+
+
+class CompletionTests(TestCase):
+
+    def setUp(self):
+        self.hospital = PartnerHospitals.objects.create(hospital_name='General')
+        self.patient = CustomUser.objects.create_user(
+            'alice01', 'alice@example.test', PASSWORD, user_type='patient', hospital=self.hospital
+        )
+        self.task, self.video = make_catalog(self.hospital)
+        AssignedTask.objects.create(patient=self.patient, task=self.task)
+        AssignedModules.objects.create(patient=self.patient, video=self.video)
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def history(self):
+        return (
+            ActivityEvent.objects.filter(patient_id=self.patient.id).count(),
+            PatientChange.objects.filter(patient=self.patient).count(),
+            WatchedData.objects.filter(user=self.patient).count(),
+        )
+
+    def test_task_completion_is_recorded_once(self):
+        url = f'/users/tasks/update-completion/{self.task.id}/'
+        self.assertEqual(self.client.post(url).json(), {'message': 'Task completion status updated successfully.'})
+        self.assertTrue(AssignedTask.objects.get(patient=self.patient).isCompleted)
+        self.assertEqual(self.history(), (1, 1, 0))
+
+        self.assertEqual(self.client.post(url).json(), {'message': 'Task has already been completed'})
+        self.assertEqual(self.history(), (1, 1, 0))
+
+    def test_unassigned_task_is_not_found(self):
+        other_task, _ = make_catalog(self.hospital, 'Other')
+        self.assertEqual(self.client.post(f'/users/tasks/update-completion/{other_task.id}/').status_code, 404)
+
+    def test_video_completion_records_the_watch_once(self):
+        url = f'/users/update_video_completion/{self.video.id}/'
+        self.assertEqual(self.client.post(url, {'isCompleted': True}, format='json').status_code, 200)
+        self.assertEqual(self.history(), (1, 1, 1))
+        self.assertEqual(DailyWatchRollup.objects.get(user=self.patient).count, 1)
+
+        response = self.client.post(url, {'isCompleted': True}, format='json')
+        self.assertEqual(response.json(), {'message': 'Video has already been completed'})
+        self.assertEqual(self.history(), (1, 1, 1))
+        self.assertEqual(DailyWatchRollup.objects.get(user=self.patient).count, 1)
+
+    def test_losing_a_completion_race_writes_nothing(self):
+        # Another request completed the video between this one's read and its UPDATE
+        AssignedModules.objects.filter(patient=self.patient).update(isCompleted=True)
+        self.assertFalse(complete_video(self.patient, self.video.id, True))
+        self.assertEqual(self.history(), (0, 0, 0))
+
+    def test_batch_completion_reports_each_id(self):
+        response = self.client.post('/users/completions/batch/', {
+            'tasks': [self.task.id, 999999], 'videos': [self.video.id, self.video.id],
+        }, format='json')
+        self.assertEqual(response.json(), {
+            'tasks': [{'id': self.task.id, 'status': 'completed'}, {'id': 999999, 'status': 'not_found'}],
+            'videos': [{'id': self.video.id, 'status': 'completed'}],
+        })
+        self.assertEqual(self.history(), (2, 2, 1))
+
+    @override_settings(WATCH_BUFFER_ENABLED=True)
+    def test_buffered_watches_are_written_by_the_flush(self):
+        self.assertTrue(complete_video(self.patient, self.video.id, True))
+        self.assertEqual(WatchEventBuffer.objects.count(), 1)
+        self.assertFalse(WatchedData.objects.exists())
+
+        self.assertEqual(flush_watch_buffer()[0], 1)
+        self.assertEqual(WatchedData.objects.filter(user=self.patient, video=self.video).count(), 1)
+        self.assertEqual(DailyWatchRollup.objects.get(user=self.patient).count, 1)
+        self.assertFalse(WatchEventBuffer.objects.exists())
+
+    def test_flush_drops_events_for_deleted_modules(self):
+        WatchEventBuffer.objects.create(patient_id=self.patient.id, module_id=999999, date=timezone.localdate())
+        self.assertEqual(flush_watch_buffer()[0], 1)
+        self.assertFalse(WatchedData.objects.exists())
+        self.assertFalse(WatchEventBuffer.objects.exists())
+
+
+class WatchRollupTests(TestCase):
+
+    def setUp(self):
+        hospital = PartnerHospitals.objects.create(hospital_name='General')
+        self.alice = CustomUser.objects.create_user('alice01', 'alice@example.test', PASSWORD, user_type='patient', hospital=hospital)
+        self.bob = CustomUser.objects.create_user('bob01', 'bob@example.test', PASSWORD, user_type='patient', hospital=hospital)
+        self.day = timezone.localdate()
+
+    def test_bump_inserts_and_increments_in_two_statements(self):
+        bump_watch_rollups({(self.alice.id, self.day): 2})
+        with self.assertNumQueries(2):
+            bump_watch_rollups({(self.alice.id, self.day): 3, (self.bob.id, self.day): 1})
+        self.assertEqual(
+            dict(DailyWatchRollup.objects.values_list('user_id', 'count')), {self.alice.id: 5, self.bob.id: 1}
+        )
+
+    def test_time_series_buckets_the_rollups(self):
+        monday = self.day - timedelta(days=self.day.weekday())
+        bump_watch_rollups({
+            (self.alice.id, monday - timedelta(days=7)): 1,
+            (self.alice.id, monday): 2,
+            (self.alice.id, monday + timedelta(days=1)): 3,
+            (self.bob.id, monday): 10,
+        })
+        series = watched_time_series(self.alice, monday - timedelta(days=7), monday + timedelta(days=6), 'week')
+        self.assertEqual(series['total'], 6)
+        self.assertEqual([point['count'] for point in series['series']], [1, 5])
+
+    def test_time_series_rejects_unbounded_ranges(self):
+        with self.assertRaises(ValueError):
+            watched_time_series(self.alice, self.day - timedelta(days=4000), self.day)
+        with self.assertRaises(ValueError):
+            watched_time_series(self.alice, self.day - timedelta(days=400), self.day, 'day')
+
+
+class FakeSMTPConnection:
+    """Stands in for the SMTP backend; `failures` maps an address to the exception sending to it raises."""
+
+    def __init__(self, failures=None, open_error=None):
+        self.failures = failures or {}
+        self.open_error = open_error
+        self.sent = []
+        self.closed = 0
+
+    def open(self):
+        if self.open_error:
+            raise self.open_error
+
+    def close(self):
+        self.closed += 1
+
+    def send_messages(self, messages):
+        for message in messages:
+            error = self.failures.get(message.to[0])
+            if error:
+                raise error
+            self.sent.append(message)
+        return len(messages)
+
+
+@override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_RETRY_DELAY=60)
+class EmailOutboxTests(TestCase):
+
+    def statuses(self):
+        return dict(OutgoingEmail.objects.values_list('to_email', 'status'))
+
+    def test_sends_retries_and_fails(self):
+        for address in ('ok@example.test', 'busy@example.test', 'gone@example.test'):
+            enqueue_email(address, 'Hello', 'Body')
+        smtp = FakeSMTPConnection({
+            'busy@example.test': smtplib.SMTPResponseException(451, b'Try again later'),
+            'gone@example.test': smtplib.SMTPRecipientsRefused({'gone@example.test': (550, b'No such user')}),
+        })
+
+        stats = drain_email_outbox(smtp=smtp)
+        self.assertEqual((stats['sent'], stats['retried'], stats['failed']), (1, 1, 1))
+        self.assertEqual(self.statuses(), {
+            'ok@example.test': 'sent', 'busy@example.test': 'queued', 'gone@example.test': 'failed',
+        })
+        busy = OutgoingEmail.objects.get(to_email='busy@example.test')
+        self.assertEqual(busy.attempts, 1)
+        self.assertGreater(busy.next_attempt_at, timezone.now())
+        # Nothing is due again yet
+        self.assertEqual(drain_email_outbox(smtp=smtp)['sent'], 0)
+
+    def test_connection_failure_defers_without_using_an_attempt(self):
+        for n in range(3):
+            enqueue_email(f'patient{n}@example.test', 'Hello', 'Body')
+        smtp = FakeSMTPConnection(open_error=smtplib.SMTPAuthenticationError(535, b'Bad credentials'))
+
+        stats = drain_email_outbox(batch_size=2, smtp=smtp)
+        self.assertEqual((stats['deferred'], stats['sent']), (2, 0))
+        # The pass stops after the first batch instead of failing the rest
+        self.assertEqual(OutgoingEmail.objects.filter(status='queued', attempts=0).count(), 3)
+        self.assertEqual(OutgoingEmail.objects.filter(next_attempt_at__gt=timezone.now()).count(), 2)
+
+    def test_password_reset_is_rendered_at_send_time(self):
+        hospital = PartnerHospitals.objects.create(hospital_name='General')
+        CustomUser.objects.create_user('alice01', 'Alice@example.test', PASSWORD, user_type='patient', hospital=hospital)
+        enqueue_password_reset('alice@example.test')
+        enqueue_password_reset('nobody@example.test')
+        smtp = FakeSMTPConnection()
+
+        stats = drain_email_outbox(smtp=smtp)
+        self.assertEqual((stats['sent'], stats['discarded']), (1, 1))
+        self.assertIn('/users/password-reset/confirm/', smtp.sent[0].body)
+        self.assertEqual(OutgoingEmail.objects.get(to_email='alice@example.test').body, '')
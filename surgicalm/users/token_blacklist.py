@@ -0,0 +1,191 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'jwt-blacklist'
+# Changes whenever a token is blacklisted, so a filter can tell whether it is still complete
+GENERATION_KEY = f'{CACHE_PREFIX}:generation'
+# Backends that are not shared between workers, so a cache miss proves nothing
+PROCESS_LOCAL_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings, sized for `capacity` keys at `error_rate`."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], 'big')
+        b = int.from_bytes(digest[8:], 'big') | 1
+        return [(a + i * b) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class BlacklistFilter:
+    """
+    Per-process bloom filter of unexpired blacklisted jtis, rebuilt from the
+    database every `ttl` seconds. `generation` is the shared blacklist
+    generation it was loaded at; once that moves on, the filter no longer
+    covers every blacklisted token.
+    """
+
+    def __init__(self, ttl, error_rate):
+        self.ttl = ttl
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._loaded_at = 0.0
+        self.generation = None
+
+    def _load(self):
+        started = time.monotonic()
+        # Read before the rows so a token blacklisted mid-load leaves the filter stale
+        generation = get_generation()
+        blacklisted = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        # Leave headroom for tokens added locally before the next rebuild
+        bloom = BloomFilter(blacklisted.count() * 2 + 1000, self.error_rate)
+        for jti in blacklisted.values_list('token__jti', flat=True).iterator(chunk_size=5000):
+            bloom.add(jti)
+        self._bloom = bloom
+        self.generation = generation
+        self._loaded_at = time.monotonic()
+        logger.info("Loaded token blacklist filter (%s bytes) in %.3fs", len(bloom.bits), self._loaded_at - started)
+
+    def might_contain(self, jti):
+        if time.monotonic() - self._loaded_at > self.ttl:
+            with self._lock:
+                if time.monotonic() - self._loaded_at > self.ttl:
+                    self._load()
+        return jti in self._bloom
+
+    def add(self, jti):
+        if self._bloom is not None:
+            self._bloom.add(jti)
+
+
+def _cache():
+    return caches[settings.JWT_BLACKLIST_CACHE]
+
+
+def get_generation():
+    """Returns the shared blacklist generation, starting one if the key is missing or was evicted."""
+    generation = _cache().get(GENERATION_KEY)
+    if generation is None:
+        _cache().add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = _cache().get(GENERATION_KEY)
+    return generation
+
+
+def _bump_generation():
+    try:
+        _cache().incr(GENERATION_KEY)
+    except ValueError:
+        _cache().set(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+_filter = BlacklistFilter(settings.JWT_BLACKLIST_FILTER_TTL, settings.JWT_BLACKLIST_FILTER_ERROR_RATE)
+
+
+def _cache_key(jti):
+    return f'{CACHE_PREFIX}:{jti}'
+
+
+def _cache_is_shared():
+    return settings.CACHES[settings.JWT_BLACKLIST_CACHE]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def _publish(jti, exp):
+    timeout = int(exp - time.time())
+    if timeout > 0:
+        _cache().set(_cache_key(jti), True, timeout)
+    _filter.add(jti)
+
+
+def mark_blacklisted(jti, exp):
+    """
+    Publishes a newly blacklisted jti to the shared cache until the token
+    would expire anyway, and moves the generation on once the row is committed.
+    """
+    _publish(jti, exp)
+    transaction.on_commit(_bump_generation)
+
+
+def load_filter():
+    """Builds this process's bloom filter now rather than on the first token check."""
+    with _filter._lock:
+        _filter._load()
+
+
+def is_blacklisted(jti, exp):
+    """
+    Shared cache first, then the bloom filter. A filter miss is only trusted
+    while nothing has been blacklisted since the filter was loaded: the
+    per-jti cache keys can be culled or evicted, so after that the database
+    decides. It is also queried when the filter reports a possible hit, or
+    when the cache is per-process and can't vouch for other workers.
+    """
+    if _cache().get(_cache_key(jti)):
+        return True
+    if (_cache_is_shared() and not _filter.might_contain(jti)
+            and _filter.generation == get_generation()):
+        return False
+
+    blacklisted = BlacklistedToken.objects.filter(token__jti=jti).exists()
+    if blacklisted:
+        _publish(jti, exp)
+    return blacklisted
+
+
+def prune_expired_tokens(batch_size=1000, max_batches=None, pause=0):
+    """
+    Deletes expired outstanding tokens and their blacklist entries, one short
+    transaction per batch so neither table is locked for long.
+    Returns (deleted, batches).
+    """
+    cutoff = timezone.now()
+    deleted = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        # Expired tokens are the oldest ids, so walking the primary key stops early
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lte=cutoff)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            OutstandingToken.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+        batches += 1
+        if pause:
+            time.sleep(pause)
+
+    logger.info("Pruned %s expired tokens in %s batches", deleted, batches)
+    return deleted, batches
@@ -1,8 +1,15 @@
 from django.urls import path, reverse_lazy
 from surgicalm.users.views import *
 from django.contrib.auth import views as auth_views
+from django.conf import settings
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+# Under ASGI the hot patient endpoints are served by their async versions
+if settings.ASYNC_VIEWS:
+    from surgicalm.users.async_views import (
+        dashboard, get_module_signed_url, update_task_completion, update_video_completion, save_push_token,
+    )
+
 urlpatterns = [
 
     # AUTH #
@@ -11,6 +18,8 @@ urlpatterns = [
     path('nurse/login/', nurse_login, name='nurse_login'),
     # Patient Account Creation
     path('patient/register/', patient_register, name='patient_register'),
+    # Bulk Patient Import (CSV/JSON)
+    path('patients/import/', import_patients, name='import_patients'),
     # Patient Login
     path('patient/login/', patient_login, name='patient_login'),
 
@@ -54,7 +63,9 @@ urlpatterns = [
 
     # Patient Search
     path('patients-list/', search_patients, name='search_patients'),
+    path('patients-autocomplete/', autocomplete_patients, name='autocomplete_patients'),
     path('patient-graph/<int:id>/', patient_graph, name='patient_graph'),
+    path('patient-roster/', patient_roster, name='patient_roster'),
 
     # PATIENT #
 
@@ -73,11 +84,15 @@ urlpatterns = [
     # Assignment Completion
     path('update_video_completion/<int:videoId>/', update_video_completion, name='update_video_completion'),
     path('tasks/update-completion/<int:taskId>/', update_task_completion, name='update_task_completion'),
+    path('completions/batch/', batch_completion, name='batch_completion'),
+    # Offline Sync
+    path('sync/', sync_patient_state, name='sync_patient_state'),
     # Notifications
     path('api/save-token/', save_push_token, name='save_push_token'),
 
     # Task Refresh
     path('cron/refresh-all-user-data/', trigger_daily_user_refresh, name='trigger_daily_user_refresh'),
+    path('cron/process-email-outbox/', trigger_email_outbox_drain, name='trigger_email_outbox_drain'),
 
     path('health-check/', health_check, name='health_check'),
 
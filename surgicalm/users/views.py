@@ -1,33 +1,22 @@
 
 import logging
-import time 
+import zoneinfo
 
 from django.utils import timezone
 from django.urls import reverse
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.http import JsonResponse
-from django.utils.encoding import force_bytes
-from django.utils.http import urlsafe_base64_encode
-from django.core.mail import send_mail
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
-from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth.views import PasswordResetCompleteView, PasswordResetDoneView
 from django.conf import settings
 from django.db import transaction
-from datetime import timedelta
-from django.core.mail import send_mail
-
-from google.cloud import storage
-from google.auth import impersonated_credentials
-from google.auth import default
-            
+from datetime import date, timedelta
 
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from axes.decorators import axes_dispatch
 from django_ratelimit.decorators import ratelimit
 from django_ratelimit.core import is_ratelimited
@@ -35,8 +24,21 @@ from django_ratelimit.core import is_ratelimited
 from surgicalm.users.models import *  
 from surgicalm.users.auth import *
 from surgicalm.users.serializers import *
-from .services import calculate_weekly_watched_data, refresh_user_data
+from surgicalm.backend.routers import pin_to_primary, replica_view
+from .services import (
+    calculate_weekly_watched_data, refresh_user_data, build_patient_roster,
+    record_watch, watched_time_series, complete_assignments, complete_video, record_history,
+)
 from .auth_decorators import oidc_auth_required
+from .authentication import HospitalRefreshToken
+from .search import search_patient_ids
+from .autocomplete import autocomplete
+from .sync import current_seq, changes_since
+from .activity import log_activity
+from .mail import drain_email_outbox, enqueue_password_reset
+from .onboarding import import_patient_rows, parse_rows
+from .storage import generate_signed_url
+from .scheduling import dispatch_refreshes
 
 logger = logging.getLogger(__name__)
 
@@ -82,7 +84,7 @@ def nurse_login(request):
         password = serializer.validated_data['password']
         user = auth_nurse(username=username, password=password, request=request)  
         if user:  
-            refresh = RefreshToken.for_user(user) 
+            refresh = HospitalRefreshToken.for_user(user) 
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -101,7 +103,8 @@ def patient_login(request):
         password = serializer.validated_data['password']
         user = auth_patient(username=username, password=password, request=request)         
         if user is not None:
-            refresh = RefreshToken.for_user(user)
+            log_activity(user.id, ActivityEvent.LOGIN)
+            refresh = HospitalRefreshToken.for_user(user)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -115,7 +118,7 @@ def patient_login(request):
 def logout(request):
     try:
         refresh_token = request.data["refresh"]
-        token = RefreshToken(refresh_token)
+        token = HospitalRefreshToken(refresh_token)
         token.blacklist()
         return Response({"message": "Logout successful"}, status=status.HTTP_200_OK)
     except Exception as e:
@@ -138,12 +141,14 @@ def patient_register(request):
 
     serializer = PatientRegistrationSerializer(
         data=request.data,
-        context={'hospital': request.user.hospital}
+        context={'hospital_id': request.user.hospital_id}
     )
 
     if serializer.is_valid():
         patient = serializer.save()                    
         logger.info("Nurse %s created patient %s", request.user.id, patient.id)
+        # Let the nurse's next search or roster see the new patient
+        pin_to_primary(request.user.id)
 
         # Assign initial modules, tasks, and quotes to the new patient
         try:
@@ -176,46 +181,66 @@ def patient_register(request):
         status=status.HTTP_400_BAD_REQUEST
     )
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@ratelimit(key='user', rate='10/h', method='POST', block=True)
+def import_patients(request):
+    """
+    Bulk-enroll patients under the nurse's hospital from an uploaded CSV or JSON
+    `file`, or a JSON body {"patients": [...]}. Every row is validated first and
+    nothing is created unless all rows are valid; `?dry_run=true` only validates.
+    """
+    if request.user.user_type != "nurse":
+        return Response(
+            {"message": "Only nurses can register patients."},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true')
+    upload = request.FILES.get('file')
+    try:
+        if upload:
+            file_format = request.data.get('format') or ('json' if upload.name.lower().endswith('.json') else 'csv')
+            rows = parse_rows(upload.read(), file_format)
+        else:
+            rows = parse_rows(request.data, 'json')
+        result = import_patient_rows(request.user.hospital_id, rows, dry_run=dry_run)
+    except (ValueError, UnicodeDecodeError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if result['errors']:
+        logger.warning("Patient import by nurse %s rejected: %s invalid rows", request.user.id, len(result['errors']))
+        return Response(
+            {'error': 'Some rows are invalid; no patients were created.', 'rows': result['errors']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if dry_run:
+        return Response({'message': f'{len(rows)} rows are valid.'}, status=status.HTTP_200_OK)
+
+    logger.info("Nurse %s imported %s patients", request.user.id, len(result['created']))
+    pin_to_primary(request.user.id)
+    return Response({'created': len(result['created']), 'ids': result['created']}, status=status.HTTP_201_CREATED)
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @ratelimit(key='ip', rate='100/h', block=True)
 @ratelimit(key='post:email', rate='100/h', block=True)
 def request_password_reset(request):
     """
-    Send a password-reset email *if and only if* the user exists, but
-    take roughly the same amount of time whether or not the e-mail is registered.
-    This prevents timing-based account enumeration attacks.
+    Queue a password-reset email for the outbox worker, which sends it *if and
+    only if* the user exists. The request does the same work whether or not the
+    e-mail is registered, so its timing can't be used to enumerate accounts.
     """
 
-    start_time = time.monotonic()  
-
     email = request.data.get('email', '').lower().strip()
     if not email:
         return Response({'error': 'Email is required'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        user = CustomUser.objects.filter(email__iexact=email).first()
-        if user:
-            token = default_token_generator.make_token(user)
-            uid = urlsafe_base64_encode(force_bytes(user.pk))
-            reset_path = reverse('password_reset_confirm', kwargs={'uidb64': uid, 'token': token})
-            reset_link = f"{settings.BASE_URL}{reset_path}"
-
-            send_mail(
-                subject="Password Reset",
-                message=f"Use the link below to reset your password:\n{reset_link}",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[email],
-                fail_silently=False,
-            )
+        enqueue_password_reset(email)
     except Exception as e:
         logger.error(f"Error in password-reset flow for {email}: {e}")
 
-    # Constant-time padding ─ ensure every call lasts at least ~0.5 s
-    elapsed = time.monotonic() - start_time
-    if elapsed < 0.5:
-        time.sleep(0.5 - elapsed)
-
     return Response(
         {'message': 'If that account exists, a password reset link has been sent.'},
         status=status.HTTP_200_OK,
@@ -233,41 +258,38 @@ class CustomPasswordResetDoneView(PasswordResetDoneView):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_view()
 def search_patients(request):
     search_query = request.GET.get('query', '').strip()
     search_by = request.GET.get('searchBy', 'text') 
-    hospital = request.user.hospital
+    hospital_id = request.user.hospital_id
 
     if not search_query:
         return Response([], status=status.HTTP_200_OK)
 
-    # Base queryset for patients in the nurse's hospital
-    base_queryset = CustomUser.objects.filter(user_type='patient', hospital=hospital)
+    try:
+        limit = int(request.GET.get('limit', settings.PATIENT_SEARCH_MAX_RESULTS))
+    except (ValueError, TypeError):
+        return Response({"error": "Invalid limit."}, status=status.HTTP_400_BAD_REQUEST)
 
-    patients = CustomUser.objects.none() # Start with an empty queryset
+    # Base queryset for patients in the nurse's hospital
+    base_queryset = CustomUser.objects.filter(user_type='patient', hospital_id=hospital_id)
 
     if search_by == 'id':
         try:
             # Perform a direct, fast lookup by primary key (ID)
             patient_id = int(search_query)
-            patients = base_queryset.filter(id=patient_id)
+            patients = list(base_queryset.filter(id=patient_id))
         except (ValueError, TypeError):
             # If the query is not a valid integer, return an error
             return Response({"error": "Invalid ID format."}, status=status.HTTP_400_BAD_REQUEST)
     else:
-        # Default to FULLTEXT search for 'text', 'username', 'email', etc.
-        # We add a '+' to each word to make it a boolean search for all terms.
-        terms = [f'+{term}' for term in search_query.split()]
-        if terms:
-            terms[-1] += '*'  # Add the wildcard to the last term
-        boolean_search_query = ' '.join(terms)
-
-        patients = base_queryset.extra(
-            where=["MATCH(username, email) AGAINST(%s IN BOOLEAN MODE)"],
-            params=[boolean_search_query]
-        )
+        # Ranked, limited lookup through the configured search index backend
+        patient_ids = search_patient_ids(hospital_id, search_query, limit)
+        patients_by_id = base_queryset.only('id', 'username', 'email').in_bulk(patient_ids)
+        patients = [patients_by_id[pk] for pk in patient_ids if pk in patients_by_id]
 
-    if not patients.exists():
+    if not patients:
         # Return an empty list with a 200 OK status for "no results found"
         return Response([], status=status.HTTP_200_OK)
 
@@ -277,12 +299,67 @@ def search_patients(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+def autocomplete_patients(request):
+    """Typeahead for the nurse patient search box: top matches by username/email prefix."""
+    if request.user.user_type != 'nurse':
+        return Response({"error": "Only nurses can search patients."}, status=status.HTTP_403_FORBIDDEN)
+
+    search_query = request.GET.get('query', '').strip()
+    if not search_query:
+        return Response([], status=status.HTTP_200_OK)
+
+    try:
+        limit = int(request.GET.get('limit', settings.PATIENT_AUTOCOMPLETE_LIMIT))
+    except (ValueError, TypeError):
+        return Response({"error": "Invalid limit."}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = autocomplete(request.user.id, request.user.hospital_id, search_query, limit)
+    return Response(results, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_view()
+def patient_roster(request):
+    """
+    Every patient in the nurse's hospital with this week's watch counts and
+    today's completion ratio. Paginate with ?cursor=<nextCursor>&limit=<n>.
+    """
+    if request.user.user_type != 'nurse':
+        return Response({"error": "Only nurses can view the patient roster."}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        cursor = int(request.GET.get('cursor', 0))
+        limit = int(request.GET.get('limit', 50))
+    except (ValueError, TypeError):
+        return Response({"error": "Invalid cursor or limit."}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, 200))
+
+    roster = build_patient_roster(request.user.hospital_id, cursor=cursor, limit=limit)
+    return Response(roster, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_view(patient_kwarg='id')
 def patient_graph(request, id):
     try:
         # Ensure the requesting nurse can only see patients in their own hospital
-        patient = CustomUser.objects.get(id=id, hospital=request.user.hospital)
-        week_data = calculate_weekly_watched_data(patient)
-        return Response({'weekData': week_data}, status=status.HTTP_200_OK)
+        patient = CustomUser.objects.get(id=id, hospital_id=request.user.hospital_id)
+
+        # Without a range keep the original Monday-Sunday payload
+        if not any(param in request.GET for param in ('from', 'to', 'bucket')):
+            week_data = calculate_weekly_watched_data(patient)
+            return Response({'weekData': week_data}, status=status.HTTP_200_OK)
+
+        try:
+            today = timezone.now().date()
+            end = date.fromisoformat(request.GET['to']) if 'to' in request.GET else today
+            start = date.fromisoformat(request.GET['from']) if 'from' in request.GET else end - timedelta(days=29)
+            series = watched_time_series(patient, start, end, request.GET.get('bucket', 'day'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(series, status=status.HTTP_200_OK)
     except CustomUser.DoesNotExist:
         return Response({'error': 'Patient not found for this hospital.'}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
@@ -297,11 +374,11 @@ def patient_graph(request, id):
 @permission_classes([IsAuthenticated])
 def category_list(request):
     """Returns all categories, their IDs, and icons for the requester's hospital."""
-    user_hospital = request.user.hospital
+    user_hospital = request.user.hospital_id
     if user_hospital is None:
         return Response({"error": "User is not associated with any hospital."}, status=status.HTTP_400_BAD_REQUEST)
     
-    categories = ModuleCategories.objects.filter(hospital=user_hospital)
+    categories = ModuleCategories.objects.filter(hospital_id=user_hospital)
     serializer = ModuleCategorySerializer(categories, many=True)
     return Response({"categories": serializer.data}, status=status.HTTP_200_OK)
 
@@ -311,7 +388,7 @@ def category_list(request):
 def subcategory_list(request, category_id):
     """Returns all subcategory names for a given category ID."""
     try:
-        hospital = request.user.hospital
+        hospital = request.user.hospital_id
 
         if not ModuleCategories.objects.filter(id=category_id, hospital_id=hospital).exists():
             return Response({'error': 'Category not found for this hospital.'}, status=status.HTTP_404_NOT_FOUND)
@@ -335,7 +412,7 @@ def modules_list(request, category, subcategory):
     try:
         # Ensure only modules from the user's hospital are accessible
         videos = ModulesList.objects.filter(
-            category_id=category, subcategory_id=subcategory, hospital=request.user.hospital
+            category_id=category, subcategory_id=subcategory, hospital_id=request.user.hospital_id
         ).values('id', 'title', 'url', 'category', 'subcategory', 'description', 'media_type')
         videos_list = list(videos)
         
@@ -360,74 +437,19 @@ def get_module_signed_url(request, module_id):
     Only accessible to users within the same hospital as the module.
     """
     logger.info(f"[SIGNED_URL] Request received for module {module_id} by user {request.user.id} "
-                f"(hospital={getattr(request.user, 'hospital', None)})")
+                f"(hospital={getattr(request.user, 'hospital_id', None)})")
 
     try:
         # STEP 1: Verify module belongs to the user’s hospital
         logger.debug(f"[SIGNED_URL] Attempting to fetch module {module_id}...")
-        module = ModulesList.objects.get(id=module_id, hospital=request.user.hospital)
-        logger.info(f"[SIGNED_URL] Found module {module_id} for hospital {request.user.hospital}")
-
-        file_url = module.url
-        logger.debug(f"[SIGNED_URL] Raw file_url from DB: {file_url}")
-
-        # STEP 2: Derive the object path inside the bucket
-        if file_url.startswith('gs://'):
-            file_path_in_bucket = file_url.split('/', 3)[-1] if '/' in file_url else file_url
-            logger.debug(f"[SIGNED_URL] Derived path from gs://: {file_path_in_bucket}")
-        elif 'storage.googleapis.com' in file_url or 'storage.cloud.google.com' in file_url:
-            url_parts = file_url.split('/')
-            if len(url_parts) > 4:
-                file_path_in_bucket = '/'.join(url_parts[4:])
-            else:
-                file_path_in_bucket = url_parts[-1]
-            logger.debug(f"[SIGNED_URL] Derived path from https://storage.googleapis.com/: {file_path_in_bucket}")
-        else:
-            file_path_in_bucket = file_url.lstrip('/')
-            logger.debug(f"[SIGNED_URL] Derived path (fallback): {file_path_in_bucket}")
+        module = ModulesList.objects.get(id=module_id, hospital_id=request.user.hospital_id)
+        logger.info(f"[SIGNED_URL] Found module {module_id} for hospital {request.user.hospital_id}")
 
-        # STEP 3: Initialize storage client
-        try:
-            storage_client = storage.Client()
-            logger.info("[SIGNED_URL] Initialized Google Cloud Storage client.")
-        except Exception as client_err:
-            logger.error(f"[SIGNED_URL] Failed to init GCS client: {client_err}", exc_info=True)
-            return Response({"error": "Storage client initialization failed."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        logger.debug(f"[SIGNED_URL] Raw file_url from DB: {module.url}")
 
-        bucket_name = settings.STORAGE_BUCKET_NAME
-        logger.info(f"[SIGNED_URL] Using bucket: {bucket_name}, path: {file_path_in_bucket}")
-
-        # STEP 4: Get blob reference
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(file_path_in_bucket)
-        logger.debug(f"[SIGNED_URL] Blob object created for {file_path_in_bucket}")
-
-        # STEP 5: Generate signed URL using service account impersonation
+        # STEP 2: Sign the object path with the impersonated service account
         try:
-            
-            # Get default credentials (will be the Cloud Run service account)
-            source_credentials, project_id = default()
-            
-            # Create impersonated credentials for signing
-            # Note: We're impersonating the same service account to get signing capabilities
-            target_credentials = impersonated_credentials.Credentials(
-                source_credentials=source_credentials,
-                target_principal=settings.SERVICE_ACCOUNT_EMAIL,
-                target_scopes=["https://www.googleapis.com/auth/cloud-platform"],
-            )
-            
-            # Create a new storage client with the impersonated credentials
-            signing_client = storage.Client(credentials=target_credentials)
-            signing_bucket = signing_client.bucket(bucket_name)
-            signing_blob = signing_bucket.blob(file_path_in_bucket)
-            
-            # Generate the signed URL
-            signed_url = signing_blob.generate_signed_url(
-                version="v4",
-                expiration=timedelta(minutes=90),
-                method="GET",
-            )
-            
+            signed_url = generate_signed_url(module.url)
             logger.info(f"[SIGNED_URL] Successfully generated signed URL for module {module_id}")
             return Response({"signedUrl": signed_url}, status=status.HTTP_200_OK)
 
@@ -436,7 +458,7 @@ def get_module_signed_url(request, module_id):
             return Response({"error": "Signed URL generation failed."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     except ModulesList.DoesNotExist:
-        logger.warning(f"[SIGNED_URL] Module {module_id} not found or not in hospital {request.user.hospital}")
+        logger.warning(f"[SIGNED_URL] Module {module_id} not found or not in hospital {request.user.hospital_id}")
         return Response({"error": "Module not found"}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         logger.error(f"[SIGNED_URL] Unexpected error for module {module_id}: {e}", exc_info=True)
@@ -456,6 +478,7 @@ def dashboard(request):
     quote_serializer = AssignedQuoteSerializer(assigned_quote)
 
     week_data = calculate_weekly_watched_data(user)
+    log_activity(user.id, ActivityEvent.DASHBOARD_OPENED)
 
     return Response({
         'generalVideos': video_serializer.data,
@@ -471,16 +494,14 @@ def update_task_completion(request, taskId):
     user = request.user  
 
     try:
-        task_tracker = AssignedTask.objects.get(patient=user, task_id=taskId)
-
-        task_tracker.isCompleted = True
-        task_tracker.save()
-
+        # Same path as the batch endpoint: one transaction, and a no-op if already completed
+        result = complete_assignments(user, [taskId], [])['tasks'][taskId]
+        if result == 'not_found':
+            return Response({'error': 'Assigned task not found for this user.'}, status=status.HTTP_404_NOT_FOUND)
+        if result == 'already_completed':
+            return Response({'message': 'Task has already been completed'}, status=status.HTTP_200_OK)
         return Response({'message': 'Task completion status updated successfully.'}, status=status.HTTP_200_OK)
 
-    except AssignedTask.DoesNotExist:
-        return Response({'error': 'Assigned task not found for this user.'}, status=status.HTTP_404_NOT_FOUND)
-
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -495,18 +516,9 @@ def update_video_completion(request, videoId):
     is_completed = request.data.get('isCompleted')
 
     try:
-        with transaction.atomic():  
-            
-            video_tracker = AssignedModules.objects.get(patient=user, video_id=videoId)
-            if video_tracker.isCompleted: 
-                return Response({'message': 'Video has already been completed'}, status=status.HTTP_200_OK)
-            video_tracker.isCompleted = is_completed
-            video_tracker.save()
-
-            if is_completed:
-                WatchedData.objects.create(user=user, video=video_tracker.video, date=timezone.now().date())
-
-            return Response({'message': 'Video completion status updated successfully.'}, status=status.HTTP_200_OK)
+        if not complete_video(user, videoId, is_completed):
+            return Response({'message': 'Video has already been completed'}, status=status.HTTP_200_OK)
+        return Response({'message': 'Video completion status updated successfully.'}, status=status.HTTP_200_OK)
 
     except AssignedModules.DoesNotExist:
         return Response({'error': 'Assigned video not found for this user.'}, status=status.HTTP_404_NOT_FOUND)
@@ -518,6 +530,108 @@ def update_video_completion(request, videoId):
         return Response({'error': f'An unexpected error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_completion(request):
+    """
+    Completes several assigned tasks and videos in one transaction.
+    JSON payload: { "tasks": [<taskId>, ...], "videos": [<videoId>, ...] }
+    """
+    serializer = BatchCompletionSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    task_ids = list(dict.fromkeys(serializer.validated_data.get('tasks', [])))
+    video_ids = list(dict.fromkeys(serializer.validated_data.get('videos', [])))
+
+    try:
+        results = complete_assignments(request.user, task_ids, video_ids)
+    except Exception as e:
+        logger.error(f"Batch completion failed for user {request.user.id}: {e}")
+        return Response({'error': 'An unexpected error occurred.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return Response({
+        'tasks': [{'id': task_id, 'status': result} for task_id, result in results['tasks'].items()],
+        'videos': [{'id': video_id, 'status': result} for video_id, result in results['videos'].items()],
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def sync_patient_state(request):
+    """
+    Offline-first sync. The client uploads queued completion events and the
+    cursor from its last sync, and receives only what changed since then.
+    Events from before the patient's last refresh only go into their watch and
+    activity history, since today's assignments reuse the same task and video ids.
+    Events older than SYNC_HISTORY_MAX_DAYS, or for ids the hospital doesn't
+    have, come back with status 'invalid'.
+    JSON payload: { "cursor": <int>, "events": [{"type": "task"|"video", "id": <int>, "completedAt": <iso8601>}] }
+    """
+    serializer = SyncSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    user = request.user
+    cursor = serializer.validated_data['cursor']
+    events = serializer.validated_data.get('events', [])
+
+    # Idle client: one indexed lookup and an empty response
+    if not events:
+        seq = current_seq(user.id)
+        if seq == cursor:
+            return Response({'cursor': seq, 'changes': []}, status=status.HTTP_200_OK)
+
+    # Apply queued events grouped by the hospital-local day they happened on,
+    # and by whether they predate the last refresh
+    results = []
+    if events:
+        hospital_tz = zoneinfo.ZoneInfo(
+            PartnerHospitals.objects.filter(id=user.hospital_id).values_list('time_zone', flat=True).get()
+        )
+        last_refreshed = UserVideoRefresh.objects.filter(patient=user).values_list('last_refreshed', flat=True).first()
+        today = timezone.localdate(timezone=hospital_tz)
+        oldest = timezone.now() - timedelta(days=settings.SYNC_HISTORY_MAX_DAYS)
+        events_by_day = {}
+        for event in events:
+            completed_at = event['completedAt']
+            if completed_at < oldest:
+                results.append({'type': event['type'], 'id': event['id'], 'status': 'invalid'})
+                continue
+            day = min(timezone.localdate(completed_at, timezone=hospital_tz), today)
+            stale = last_refreshed is not None and completed_at < last_refreshed
+            group = events_by_day.setdefault((day, stale), {'task': [], 'video': [], 'completed_at': completed_at})
+            group[event['type']].append(event['id'])
+            group['completed_at'] = max(group['completed_at'], completed_at)
+
+        for (day, stale), ids in sorted(events_by_day.items()):
+            task_ids, video_ids = list(dict.fromkeys(ids['task'])), list(dict.fromkeys(ids['video']))
+            if stale:
+                applied = record_history(user, task_ids, video_ids, day, hospital_tz, ids['completed_at'])
+            else:
+                applied = complete_assignments(user, task_ids, video_ids, day)
+            results += [{'type': 'task', 'id': pk, 'status': result} for pk, result in applied['tasks'].items()]
+            results += [{'type': 'video', 'id': pk, 'status': result} for pk, result in applied['videos'].items()]
+        seq = current_seq(user.id)
+
+    if cursor > seq:
+        cursor = 0
+    needs_snapshot, changes = changes_since(user.id, cursor)
+    response = {'cursor': seq, 'changes': changes, 'results': results}
+
+    if needs_snapshot:
+        assigned_videos = AssignedModules.objects.filter(patient=user).select_related('video__category')
+        assigned_tasks = AssignedTask.objects.filter(patient=user).select_related('task')
+        assigned_quote = AssignedQuote.objects.filter(patient=user).select_related('quote').first()
+        response['snapshot'] = {
+            'generalVideos': AssignedModuleSerializer(assigned_videos, many=True).data,
+            'tasks': AssignedTaskSerializer(assigned_tasks, many=True).data,
+            'quote': AssignedQuoteSerializer(assigned_quote).data if assigned_quote else None,
+        }
+
+    return Response(response, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_settings(request):
@@ -598,17 +712,13 @@ def save_push_token(request):
 @axes_dispatch
 @oidc_auth_required
 def trigger_daily_user_refresh(request):
+    """
+    Scheduled daily: refreshes every hospital that hasn't been refreshed yet
+    on its local date. Hospitals already handled at their own local time by
+    `manage.py dispatch_scheduled` are skipped.
+    """
     try:
-        patients = User.objects.filter(user_type='patient')
-        processed_count = 0
-        for patient in patients:
-            try:
-                with transaction.atomic():
-                    refresh_user_data(patient)
-                processed_count += 1
-            except Exception as e:
-                logger.error(f"Failed to refresh data for user {patient.id}: {e}")
-        
+        processed_count = dispatch_refreshes(window=None)
         message = f"Successfully refreshed data for {processed_count} users."
         logger.info(message)
         return Response({"message": message}, status=status.HTTP_200_OK)
@@ -617,3 +727,22 @@ def trigger_daily_user_refresh(request):
         logger.error(f"A critical error occurred during the daily refresh task: {e}")
         return Response({"error": "An internal error occurred."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+@axes_dispatch
+@oidc_auth_required
+def trigger_email_outbox_drain(request):
+    """Scheduled every minute: sends queued emails, capped per run to fit the request timeout."""
+    try:
+        stats = drain_email_outbox(max_messages=settings.EMAIL_OUTBOX_CRON_MAX_MESSAGES)
+        message = (
+            f"Sent {stats['sent']}, retried {stats['retried']}, failed {stats['failed']}, "
+            f"deferred {stats['deferred']} emails."
+        )
+        return Response({"message": message}, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        logger.error(f"A critical error occurred while draining the email outbox: {e}")
+        return Response({"error": "An internal error occurred."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
@@ -0,0 +1,57 @@
+import logging
+from collections import Counter
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import CustomUser, ModulesList, WatchedData, WatchEventBuffer
+from .services import bump_watch_rollups
+
+logger = logging.getLogger(__name__)
+
+
+def buffer_stats():
+    """Returns the number of pending events and the age in seconds of the oldest one."""
+    pending = WatchEventBuffer.objects.count()
+    oldest = WatchEventBuffer.objects.order_by('id').values_list('created_at', flat=True).first()
+    lag = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return {'pending': pending, 'lag_seconds': lag}
+
+
+def flush_watch_buffer(batch_size=1000):
+    """
+    Moves one batch of buffered events into WatchedData and the daily rollups.
+    Inserting and deleting the buffer rows happen in the same transaction, so a
+    crash mid-flush leaves the batch in the buffer and replaying it is safe.
+    Returns (flushed, lag_seconds).
+    """
+    with transaction.atomic():
+        queryset = WatchEventBuffer.objects.order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Lets several flushers run without handing out the same rows
+            queryset = queryset.select_for_update(skip_locked=True)
+        events = list(queryset[:batch_size])
+        if not events:
+            return 0, 0.0
+
+        lag = (timezone.now() - events[0].created_at).total_seconds()
+
+        # Skip events for patients or modules deleted since they were buffered
+        patient_ids = set(CustomUser.objects.filter(
+            id__in={event.patient_id for event in events}
+        ).values_list('id', flat=True))
+        module_ids = set(ModulesList.objects.filter(
+            id__in={event.module_id for event in events}
+        ).values_list('id', flat=True))
+        valid = [event for event in events if event.patient_id in patient_ids and event.module_id in module_ids]
+
+        WatchedData.objects.bulk_create([
+            WatchedData(user_id=event.patient_id, video_id=event.module_id, date=event.date) for event in valid
+        ])
+        bump_watch_rollups(Counter((event.patient_id, event.date) for event in valid))
+        WatchEventBuffer.objects.filter(id__in=[event.id for event in events]).delete()
+
+    if len(valid) < len(events):
+        logger.warning("Dropped %s buffered watch events for deleted patients or modules", len(events) - len(valid))
+    logger.info("Flushed %s watch events (lag %.1fs)", len(valid), lag)
+    return len(events), lag